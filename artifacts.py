@@ -0,0 +1,238 @@
+"""
+Server-Side Artifact Extraction
+
+The model wraps chart artifacts between <<<ARTIFACT_START>>> and
+<<<ARTIFACT_END>>> markers (see prompt.py). Instead of returning the raw
+string and letting every client regex-scan and JSON.parse it, the backend
+splits the response once into ordered segments:
+
+    {"type": "text", "content": "Here is the chart:"}
+    {"type": "artifact", "artifact": {"type": "artifact", "artifact_type": "chart", ...}}
+    {"type": "artifact_error", "error": "Invalid artifact JSON: ...", "content": "<raw block>"}
+
+Every artifact block in the response is extracted, not just the first, and
+each one is validated against the artifact schema described in prompt.py.
+Oversized chart series are then downsampled (see downsampling.py).
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from downsampling import downsample_artifact
+
+
+ARTIFACT_START = "<<<ARTIFACT_START>>>"
+ARTIFACT_END = "<<<ARTIFACT_END>>>"
+
+ARTIFACT_TYPES = ("chart",)
+
+
+class ArtifactError(ValueError):
+    """Raised when an artifact block is not valid JSON or does not match the schema"""
+
+
+def validate_artifact(artifact: Any) -> Dict[str, Any]:
+    """
+    Validate a decoded artifact against the schema in prompt.py.
+
+    Returns:
+        The artifact unchanged
+
+    Raises:
+        ArtifactError: If a required field is missing or has the wrong type
+    """
+    if not isinstance(artifact, dict):
+        raise ArtifactError("Artifact must be a JSON object")
+    if artifact.get("type") != "artifact":
+        raise ArtifactError('Artifact "type" must be "artifact"')
+    if artifact.get("artifact_type") not in ARTIFACT_TYPES:
+        raise ArtifactError(f'Unsupported artifact_type {artifact.get("artifact_type")!r}')
+    if not isinstance(artifact.get("title", ""), str):
+        raise ArtifactError('Artifact "title" must be a string')
+    if not isinstance(artifact.get("description", ""), str):
+        raise ArtifactError('Artifact "description" must be a string')
+
+    data = artifact.get("data")
+    if not isinstance(data, dict):
+        raise ArtifactError('Artifact "data" must be a Highcharts configuration object')
+
+    series = data.get("series", [])
+    if not isinstance(series, list):
+        raise ArtifactError('"data.series" must be a list')
+    for i, item in enumerate(series):
+        if not isinstance(item, dict) or not isinstance(item.get("data", []), list):
+            raise ArtifactError(f'"data.series[{i}]" must be an object with a "data" list')
+
+    return artifact
+
+
+def parse_artifact(block: str) -> Dict[str, Any]:
+    """Decode and validate the JSON between a pair of artifact markers"""
+    try:
+        artifact = json.loads(block)
+    except json.JSONDecodeError as e:
+        raise ArtifactError(f"Invalid artifact JSON: {e}")
+    return validate_artifact(artifact)
+
+
+def text_segment(content: str) -> Dict[str, Any]:
+    return {"type": "text", "content": content}
+
+
+def artifact_segment(block: str) -> Dict[str, Any]:
+    """Build the segment for one raw artifact block, capturing validation errors"""
+    try:
+        return {"type": "artifact", "artifact": downsample_artifact(parse_artifact(block))}
+    except ArtifactError as e:
+        return {"type": "artifact_error", "error": str(e), "content": block.strip()}
+
+
+def split_segments(content: str) -> List[Dict[str, Any]]:
+    """
+    Split a model response into ordered text and artifact segments.
+
+    Empty text between blocks is dropped. An unterminated start marker is
+    reported as an artifact_error segment.
+    """
+    segments: List[Dict[str, Any]] = []
+    position = 0
+
+    while True:
+        start = content.find(ARTIFACT_START, position)
+        if start == -1:
+            break
+
+        before = content[position:start].strip()
+        if before:
+            segments.append(text_segment(before))
+
+        block_start = start + len(ARTIFACT_START)
+        end = content.find(ARTIFACT_END, block_start)
+        if end == -1:
+            segments.append({
+                "type": "artifact_error",
+                "error": "Artifact is missing its end marker",
+                "content": content[block_start:].strip()
+            })
+            return segments
+
+        segments.append(artifact_segment(content[block_start:end]))
+        position = end + len(ARTIFACT_END)
+
+    rest = content[position:].strip()
+    if rest:
+        segments.append(text_segment(rest))
+    return segments
+
+
+def build_chat_response(content: str, usage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """JSON body returned by the chat endpoints: raw text for history plus parsed segments"""
+    body: Dict[str, Any] = {
+        "response": content,
+        "segments": split_segments(content)
+    }
+    if usage is not None:
+        body["usage"] = usage
+    return body
+
+
+def _partial_marker_length(text: str, marker: str) -> int:
+    """Length of the longest suffix of text that is a proper prefix of marker"""
+    for length in range(min(len(marker) - 1, len(text)), 0, -1):
+        if text.endswith(marker[:length]):
+            return length
+    return 0
+
+
+class StreamingArtifactParser:
+    """
+    Incremental artifact parser for streamed model output.
+
+    Prose is forwarded as soon as it arrives; only a few trailing characters
+    that might be the beginning of a start marker are held back. Bytes between
+    markers are buffered and emitted as one validated artifact once the end
+    marker arrives, so markers split across chunks are handled.
+
+    Usage:
+        parser = StreamingArtifactParser()
+        async for chunk in llm.astream(messages):
+            for event in parser.feed(chunk.content):
+                yield format_sse(event)
+        for event in parser.close():
+            yield format_sse(event)
+
+    Events are dicts with an "event" name and a "data" payload:
+        {"event": "text_delta", "data": {"text": "..."}}
+        {"event": "artifact", "data": {"artifact": {...}}}
+        {"event": "artifact_error", "data": {"error": "...", "content": "..."}}
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._buffer = ""
+        self._in_artifact = False
+        self._scan_from = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume one chunk and return the events it completes"""
+        if not chunk:
+            return []
+        self._chunks.append(chunk)
+        self._buffer += chunk
+
+        events: List[Dict[str, Any]] = []
+        while True:
+            if self._in_artifact:
+                end = self._buffer.find(ARTIFACT_END, self._scan_from)
+                if end == -1:
+                    # Only the tail can still contain the start of the end marker
+                    self._scan_from = max(0, len(self._buffer) - len(ARTIFACT_END) + 1)
+                    break
+                events.append(self._artifact_event(artifact_segment(self._buffer[:end])))
+                self._buffer = self._buffer[end + len(ARTIFACT_END):]
+                self._in_artifact = False
+                self._scan_from = 0
+            else:
+                start = self._buffer.find(ARTIFACT_START)
+                if start == -1:
+                    held = _partial_marker_length(self._buffer, ARTIFACT_START)
+                    ready = self._buffer[:len(self._buffer) - held]
+                    if ready:
+                        events.append({"event": "text_delta", "data": {"text": ready}})
+                    self._buffer = self._buffer[len(ready):]
+                    break
+                if start:
+                    events.append({"event": "text_delta", "data": {"text": self._buffer[:start]}})
+                self._buffer = self._buffer[start + len(ARTIFACT_START):]
+                self._in_artifact = True
+                self._scan_from = 0
+        return events
+
+    @property
+    def text(self) -> str:
+        """Full raw text received so far (for the conversation history)"""
+        return "".join(self._chunks)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Flush whatever is left once the stream ends"""
+        events: List[Dict[str, Any]] = []
+        if self._in_artifact:
+            events.append({
+                "event": "artifact_error",
+                "data": {"error": "Artifact is missing its end marker", "content": self._buffer.strip()}
+            })
+        elif self._buffer:
+            events.append({"event": "text_delta", "data": {"text": self._buffer}})
+        self._buffer = ""
+        self._in_artifact = False
+        return events
+
+    @staticmethod
+    def _artifact_event(segment: Dict[str, Any]) -> Dict[str, Any]:
+        data = {key: value for key, value in segment.items() if key != "type"}
+        return {"event": segment["type"], "data": data}
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serialize a parser event as a Server-Sent Events message"""
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], separators=(',', ':'))}\n\n"
@@ -1,30 +1,152 @@
 """
 Backend Example using LangChain with Messages Array
 
-The frontend sends a messages array in LangChain format:
+The frontend sends only the new message and a session id; the server keeps
+the history (see sessions.py):
+{"session_id": "3f2a...", "message": "Show me data"}
+
+Stateless clients can still send the whole messages array in LangChain format:
 [
     {"role": "user", "content": "Hello"},
     {"role": "assistant", "content": "Hi!"},
     {"role": "user", "content": "Show me data"}
 ]
+
+Per-user memory stores are off by default. Set KNOWLEDGE_TENANT_HEADER
+(e.g. "X-User-ID") to bind the memory tools to the tenant named in that
+request header. Clients can send any header, so enable it only behind a
+trusted proxy that authenticates the caller and sets (or strips) the header.
 """
 
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import List, Dict
-from prompt import SYSTEM_PROMPT
+from typing import List, Dict, Optional, Tuple
+from langchain_core.messages.ai import add_usage
+from langchain_core.tools import tool
+from prompt_caching import system_message, cache_usage
+from history import history_manager
+from llm_clients import registry, get_llm
+from duckdb_manager import duckdb_manager
+from result_encoder import encode_result
+from query_cache import query_cache
+from artifacts import StreamingArtifactParser, build_chat_response, format_sse
+from sessions import session_store, new_session_id
+from knowledge_store import tenant_dir, tenant_scope, tenant_stores
+
+
+# DuckDB calls are synchronous; they run on a bounded pool so they never
+# block the event loop and cannot spawn unbounded threads under load. The
+# pool is created per application lifespan (a shut down pool cannot be
+# reused, and tests or reloads may run several lifespans in one process).
+DUCKDB_MAX_WORKERS = int(os.getenv("DUCKDB_MAX_WORKERS", "4"))
+db_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """The DuckDB pool of the running lifespan (created on first use outside one)"""
+    global db_executor
+    if db_executor is None:
+        db_executor = ThreadPoolExecutor(max_workers=DUCKDB_MAX_WORKERS, thread_name_prefix="duckdb")
+    return db_executor
+
+# Request header naming the tenant whose memory store the memory tools use
+# (empty: disabled). It must be set by an authenticating proxy; requests
+# without it use the shared store.
+KNOWLEDGE_TENANT_HEADER = os.getenv("KNOWLEDGE_TENANT_HEADER", "")
+
 
-app = FastAPI()
+class KnowledgeTenantMiddleware:
+    """Bind the memory tools to the caller's tenant store for the whole request, including streamed bodies"""
+
+    def __init__(self, app, header: str = KNOWLEDGE_TENANT_HEADER):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.header:
+            await self.app(scope, receive, send)
+            return
+        tenant_id = dict(scope["headers"]).get(self.header, b"").decode("latin-1").strip()
+        if tenant_id:
+            try:
+                tenant_dir(tenant_id)
+            except ValueError as e:
+                await JSONResponse({"error": str(e)}, status_code=400)(scope, receive, send)
+                return
+        with tenant_scope(tenant_id):
+            await self.app(scope, receive, send)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global db_executor, _agent_executor
+    # One pooled client registry for the whole process
+    registry.start()
+    executor = get_db_executor()
+    yield
+    await registry.aclose()
+    # The agent holds a client from the registry whose pool was just closed
+    _agent_executor = None
+    db_executor = None
+    executor.shutdown(wait=True)
+    duckdb_manager.close()
+    session_store.close()
+    tenant_stores.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(KnowledgeTenantMiddleware)
 
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
 templates = Jinja2Templates(directory="frontend")
 
 
 class ChatRequest(BaseModel):
-    messages: List[Dict[str, str]]
+    messages: List[Dict[str, str]] = []
+    session_id: Optional[str] = None
+    message: Optional[str] = None
+
+
+async def load_conversation(request: ChatRequest, session_id: Optional[str] = None) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    """
+    Resolve the conversation for a request.
+    
+    Session mode ({"message", "session_id"}): history comes from the session
+    store, so only the new message is uploaded and validated. A new session id
+    is assigned when none is given. Stateless mode ({"messages"}): the client
+    sends the whole conversation.
+    """
+    session_id = request.session_id or session_id
+    if request.message is None:
+        return session_id, request.messages
+    session_id = session_id or new_session_id()
+    history = await asyncio.to_thread(session_store.get_history, session_id)
+    return session_id, history + [{"role": "user", "content": request.message}]
+
+
+async def save_turn(request: ChatRequest, session_id: Optional[str], reply: str):
+    """Store the new user message and the reply in session mode"""
+    if request.message is None:
+        return
+    await asyncio.to_thread(session_store.append, session_id, [
+        {"role": "user", "content": request.message},
+        {"role": "assistant", "content": reply}
+    ])
+
+
+async def chat_response(request: ChatRequest, session_id: Optional[str], content: str, usage: Optional[Dict] = None) -> JSONResponse:
+    await save_turn(request, session_id, content)
+    body = build_chat_response(content, usage)
+    if request.message is not None:
+        body["session_id"] = session_id
+    return JSONResponse(body)
 
 
 @app.get("/")
@@ -37,7 +159,10 @@ async def chat(request: ChatRequest):
     """
     Chat endpoint using LangChain messages format
     
-    Frontend sends:
+    Frontend sends the new message; history is kept server-side:
+    {"session_id": "3f2a...", "message": "Show me sales data"}
+    
+    or, statelessly, the whole conversation:
     {
         "messages": [
             {"role": "user", "content": "Hello"},
@@ -45,32 +170,82 @@ async def chat(request: ChatRequest):
             {"role": "user", "content": "Show me sales data"}
         ]
     }
-    """
     
-    from langchain_openai import ChatOpenAI
-    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+    Backend returns the raw text, parsed segments, token usage including
+    prompt cache hits and (in session mode) the session id:
+    {
+        "session_id": "3f2a...",
+        "response": "Here is the chart: <<<ARTIFACT_START>>>...",
+        "segments": [
+            {"type": "text", "content": "Here is the chart:"},
+            {"type": "artifact", "artifact": {"type": "artifact", "artifact_type": "chart", ...}}
+        ],
+        "usage": {"input_tokens": 3200, "cached_input_tokens": 3072, ...}
+    }
+    """
     
-    llm = ChatOpenAI(
-        model="gpt-4",
-        temperature=0.7
-    )
+    llm = get_llm("openai", "gpt-4", temperature=0.7)
     
-    # Build messages with system prompt
-    langchain_messages = [SystemMessage(content=SYSTEM_PROMPT)]
+    # Build messages with the cacheable system prompt prefix
+    langchain_messages = [system_message("openai")]
     
-    # Convert frontend messages to LangChain format
-    for msg in request.messages:
-        if msg["role"] == "user":
-            langchain_messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            langchain_messages.append(AIMessage(content=msg["content"]))
+    # Recent turns within the token budget, older turns as a cached summary
+    session_id, messages = await load_conversation(request)
+    langchain_messages += await history_manager.prepare(messages)
     
     # Get response
-    response = llm.invoke(langchain_messages)
+    response = await llm.ainvoke(langchain_messages)
     
-    return JSONResponse({
-        "response": response.content
-    })
+    return await chat_response(request, session_id, response.content, cache_usage(response.usage_metadata))
+
+
+def run_duckdb_query(sql: str) -> str:
+    """Run a SQL query against DuckDB synchronously (called on the DuckDB pool)"""
+    return encode_result(duckdb_manager.cursor().execute(sql))
+
+
+@tool
+async def duckdb_query(sql: str) -> str:
+    """Executes SQL queries against the DuckDB database and returns results as compact column-oriented JSON"""
+    # Repeated queries are answered from memory without a thread hop
+    cached = query_cache.get(sql)
+    if cached is not None:
+        return cached
+
+    version = query_cache.data_version()
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(get_db_executor(), run_duckdb_query, sql)
+    query_cache.put(sql, result, version)
+    return result
+
+
+_agent_executor = None
+
+
+def get_agent_executor():
+    """Build the DuckDB agent once; AgentExecutor is safe to share across requests"""
+    global _agent_executor
+    if _agent_executor is None:
+        from langchain.agents import AgentExecutor, create_tool_calling_agent
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+        tools = [duckdb_query]
+
+        llm = get_llm("openai", "gpt-4", temperature=0)
+
+        # Create prompt with system message and chat history. The system prompt
+        # is passed as a message so its JSON braces are not parsed as template
+        # fields, and stays first so the provider can cache it as a prefix.
+        prompt = ChatPromptTemplate.from_messages([
+            system_message("openai"),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ])
+
+        agent = create_tool_calling_agent(llm, tools, prompt)
+        _agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    return _agent_executor
 
 
 # Example with LangChain Agent and Tools
@@ -79,55 +254,29 @@ async def chat_with_tools(request: ChatRequest):
     """
     Example using LangChain Agent with DuckDB tool
     """
-    from langchain_openai import ChatOpenAI
-    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-    from langchain.agents import AgentExecutor, create_tool_calling_agent
-    from langchain_core.tools import tool
-    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-    import duckdb
-    
-    @tool
-    def duckdb_query(sql: str) -> str:
-        """Executes SQL queries against the DuckDB database and returns results as a string"""
-        conn = duckdb.connect('database.db')
-        result = conn.execute(sql).fetchall()
-        return str(result)
-    
-    tools = [duckdb_query]
-    
-    llm = ChatOpenAI(model="gpt-4", temperature=0)
-    
-    # Create prompt with system message and chat history
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-    ])
+    agent_executor = get_agent_executor()
     
-    agent = create_tool_calling_agent(llm, tools, prompt)
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    session_id, messages = await load_conversation(request)
     
-    # Convert messages to LangChain format for chat history
-    chat_history = []
-    for msg in request.messages[:-1]:  # All except last message
-        if msg["role"] == "user":
-            chat_history.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            chat_history.append(AIMessage(content=msg["content"]))
+    # Token-budgeted chat history (all except last message)
+    chat_history = await history_manager.prepare(messages[:-1])
     
     # Get last user message
-    last_message = request.messages[-1]["content"] if request.messages else ""
+    last_message = messages[-1]["content"] if messages else ""
     
-    # Execute agent
-    result = agent_executor.invoke({
+    # Execute agent without blocking the event loop
+    result = await agent_executor.ainvoke({
         "input": last_message,
         "chat_history": chat_history
     })
     
-    return JSONResponse({
-        "response": result["output"]
-    })
+    return await chat_response(request, session_id, result["output"])
+
+
+@app.get("/stats/query-cache")
+async def query_cache_stats():
+    """Hit/miss counters of the duckdb_query result cache"""
+    return JSONResponse(query_cache.stats())
 
 
 # Example with Anthropic Claude via LangChain
@@ -136,85 +285,87 @@ async def chat_claude(request: ChatRequest):
     """
     Example using Anthropic Claude via LangChain
     """
-    from langchain_anthropic import ChatAnthropic
-    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-    
-    llm = ChatAnthropic(
-        model="claude-3-5-sonnet-20241022",
-        temperature=0.7
-    )
+    llm = get_llm("anthropic", "claude-3-5-sonnet-20241022", temperature=0.7)
     
     # Build messages
-    langchain_messages = [SystemMessage(content=SYSTEM_PROMPT)]
-    
-    for msg in request.messages:
-        if msg["role"] == "user":
-            langchain_messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            langchain_messages.append(AIMessage(content=msg["content"]))
+    session_id, messages = await load_conversation(request)
+    langchain_messages = [system_message("anthropic")]
+    langchain_messages += await history_manager.prepare(messages)
     
     # Get response
-    response = llm.invoke(langchain_messages)
+    response = await llm.ainvoke(langchain_messages)
     
-    return JSONResponse({
-        "response": response.content
-    })
+    return await chat_response(request, session_id, response.content, cache_usage(response.usage_metadata))
 
 
 # Example with streaming response
 @app.post("/chat-stream")
 async def chat_stream(request: ChatRequest):
     """
-    Streaming response for real-time output
+    Streaming response for real-time output as Server-Sent Events
+    
+    Prose is forwarded as soon as it arrives; artifacts are buffered on the
+    server and sent once complete and validated:
+    
+        event: text_delta       data: {"text": "Here is "}
+        event: artifact         data: {"artifact": {...}}
+        event: artifact_error   data: {"error": "...", "content": "..."}
+        event: done             data: {"response": "<full raw text>", "usage": {...}, "session_id": "3f2a..."}
+        event: error            data: {"message": "..."}
     """
-    from fastapi.responses import StreamingResponse
-    from langchain_openai import ChatOpenAI
-    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-    
-    llm = ChatOpenAI(
-        model="gpt-4",
-        temperature=0.7,
-        streaming=True
-    )
+    llm = get_llm("openai", "gpt-4", temperature=0.7, streaming=True)
     
     # Build messages
-    langchain_messages = [SystemMessage(content=SYSTEM_PROMPT)]
-    
-    for msg in request.messages:
-        if msg["role"] == "user":
-            langchain_messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            langchain_messages.append(AIMessage(content=msg["content"]))
+    session_id, messages = await load_conversation(request)
+    langchain_messages = [system_message("openai")]
+    langchain_messages += await history_manager.prepare(messages)
     
     async def generate():
-        async for chunk in llm.astream(langchain_messages):
-            if chunk.content:
-                yield chunk.content
-    
-    return StreamingResponse(generate(), media_type="text/plain")
+        parser = StreamingArtifactParser()
+        usage = None
+        try:
+            async for chunk in llm.astream(langchain_messages):
+                if chunk.usage_metadata:
+                    usage = add_usage(usage, chunk.usage_metadata)
+                for event in parser.feed(chunk.content):
+                    yield format_sse(event)
+            for event in parser.close():
+                yield format_sse(event)
+            await save_turn(request, session_id, parser.text)
+            yield format_sse({"event": "done", "data": {
+                "response": parser.text,
+                "usage": cache_usage(usage),
+                "session_id": session_id
+            }})
+        except Exception as e:
+            yield format_sse({"event": "error", "data": {"message": str(e)}})
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # Example with memory using LangChain's built-in memory
 @app.post("/chat-with-memory")
-async def chat_with_memory(request: ChatRequest, session_id: str = "default"):
+async def chat_with_memory(request: ChatRequest, session_id: Optional[str] = None):
     """
     Example using LangChain's ConversationBufferMemory
+    
+    The buffer is filled from the server-side session history; session_id may
+    be given in the body or as a query parameter.
     """
-    from langchain_openai import ChatOpenAI
     from langchain.memory import ConversationBufferMemory
     from langchain.chains import ConversationChain
     
-    llm = ChatOpenAI(model="gpt-4", temperature=0.7)
+    llm = get_llm("openai", "gpt-4", temperature=0.7)
     
-    # In production, store memory per session_id (e.g., in Redis)
+    session_id, messages = await load_conversation(request, session_id)
     memory = ConversationBufferMemory()
     
-    # Load previous messages into memory
-    for msg in request.messages[:-1]:
-        if msg["role"] == "user":
-            memory.chat_memory.add_user_message(msg["content"])
-        elif msg["role"] == "assistant":
-            memory.chat_memory.add_ai_message(msg["content"])
+    # Load previous messages (token-budgeted) into memory
+    memory.chat_memory.add_messages(await history_manager.prepare(messages[:-1]))
     
     # Create conversation chain
     conversation = ConversationChain(
@@ -224,14 +375,12 @@ async def chat_with_memory(request: ChatRequest, session_id: str = "default"):
     )
     
     # Get last user message
-    last_message = request.messages[-1]["content"] if request.messages else ""
+    last_message = messages[-1]["content"] if messages else ""
     
     # Get response
-    response = conversation.predict(input=last_message)
+    response = await conversation.apredict(input=last_message)
     
-    return JSONResponse({
-        "response": response
-    })
+    return await chat_response(request, session_id, response)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""
+Append-Only Delta Logs for the Derived Memory Indexes
+
+The derived indexes (search shards, duplicates, vectors) used to rewrite
+their whole snapshot file on every memory create, update or retire, so a
+write cost O(corpus) although it changed a single memory. Each index now
+appends the entries of the memories a change touched to a log next to its
+snapshot (dedup_index.json -> dedup_index.log), one JSON line per change
+
+    {"base": 41, "seq": 42, "changes": {memory_id: entry, ...}}
+
+where base and seq are the store change sequences before and after the
+change and a null entry removes the memory. The snapshot is only rewritten
+(and the log dropped) once the log has grown larger than the snapshot, so a
+write costs O(changed memories) amortized.
+
+Loading reads the snapshot, then replays the log. Every process applies
+every change, so several processes append to the same log and lines can be
+duplicated or out of order: a line is replayed only when it continues from
+the state loaded so far. Lines at or below the loaded sequence are skipped;
+a line whose base is ahead of it means changes are missing (appended while
+another process compacted), so replay stops there and the index, now
+behind the store, is rebuilt like a missing snapshot. A torn last line from
+a crashed writer stops replay too.
+
+Configuration (environment variables):
+    MEMORY_INDEX_LOG_MIN_BYTES  log size below which it is never compacted (default 1 MiB)
+
+Usage:
+    from delta_log import DeltaLog
+
+    log = DeltaLog("knowledge/dedup_index.json")
+    if log.append(base, seq, {"MEMORY-001": entry}):
+        save_snapshot()  # then log.clear()
+    for seq, changes in log.replay(snapshot_seq):
+        ...
+"""
+
+import os
+from typing import Any, Dict, Iterator, Tuple
+
+import json_codec
+
+
+MEMORY_INDEX_LOG_MIN_BYTES = int(os.getenv("MEMORY_INDEX_LOG_MIN_BYTES", str(1 << 20)))
+
+
+class DeltaLog:
+    """Append-only log of index changes kept next to an index snapshot"""
+
+    def __init__(self, snapshot_path: str, *data_paths: str, min_bytes: int = MEMORY_INDEX_LOG_MIN_BYTES):
+        """
+        Args:
+            snapshot_path: The index snapshot; the log is named after it
+            data_paths: Further files rewritten with the snapshot (their size counts towards it)
+            min_bytes: Log size below which compaction is never due
+        """
+        self.snapshot_paths = (snapshot_path,) + data_paths
+        self.path = os.path.splitext(snapshot_path)[0] + ".log"
+        self.min_bytes = min_bytes
+
+    def append(self, base: int, seq: int, changes: Dict[str, Any]) -> bool:
+        """
+        Append one change as a single write, so concurrent appends do not interleave.
+
+        Returns:
+            True when the log has outgrown the snapshot (or there is no
+            snapshot yet) and should be compacted
+        """
+        line = json_codec.dumps({"base": base, "seq": seq, "changes": changes}) + b"\n"
+        with open(self.path, 'ab') as f:
+            f.write(line)
+            size = f.tell()
+        try:
+            snapshot_size = sum(os.path.getsize(path) for path in self.snapshot_paths)
+        except OSError:
+            # No snapshot to replay the log on yet
+            return True
+        return size > max(snapshot_size, self.min_bytes)
+
+    def replay(self, seq: int) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(seq, changes) of the lines that continue from change sequence seq, in order"""
+        try:
+            with open(self.path, 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json_codec.loads(line)
+            except ValueError:
+                return
+            if record["seq"] <= seq:
+                continue
+            if record["base"] > seq:
+                return
+            seq = record["seq"]
+            yield seq, record["changes"]
+
+    def clear(self):
+        """Drop the log once a snapshot that covers it is written"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
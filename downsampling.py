@@ -0,0 +1,248 @@
+"""
+Chart Series Downsampling
+
+Risk time series can have tens of thousands of points. Shipped verbatim in
+an artifact's data.series[].data, they bloat the payload and stall
+Highcharts in the browser. This post-processing stage bounds every series
+to a point budget while keeping its visual shape:
+
+- line-like series (line, spline, area, areaspline, scatter) use
+  Largest-Triangle-Three-Buckets (LTTB), which keeps peaks and troughs
+- other series (column, bar, ...) are aggregated into equal buckets (mean)
+- series that share xAxis.categories are reduced together so categories
+  and values stay aligned: each gets an equal share of the budget and the
+  union of the points they keep is shared by all of them
+
+The original point counts are recorded in artifact["metadata"]["downsampling"].
+
+Configuration (environment variables):
+    ARTIFACT_POINT_BUDGET  maximum points per series (default 1000)
+"""
+
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+ARTIFACT_POINT_BUDGET = int(os.getenv("ARTIFACT_POINT_BUDGET", "1000"))
+
+LINE_TYPES = ("line", "spline", "area", "areaspline", "scatter")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _xy(point: Any, index: int) -> Optional[Tuple[float, float]]:
+    """(x, y) of a Highcharts point, using the index when x is implicit or not numeric"""
+    if _is_number(point):
+        return float(index), float(point)
+    if isinstance(point, (list, tuple)) and len(point) == 2 and _is_number(point[1]):
+        return (float(point[0]) if _is_number(point[0]) else float(index)), float(point[1])
+    if isinstance(point, dict) and _is_number(point.get("y")):
+        x = point.get("x")
+        return (float(x) if _is_number(x) else float(index)), float(point["y"])
+    return None
+
+
+def lttb_indices(points: Sequence[Tuple[float, float]], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Args:
+        points: (x, y) pairs ordered by x
+        threshold: Number of points to keep (>= 3)
+
+    Returns:
+        Sorted indices of the points to keep, always including first and last
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    selected = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int(math.floor((i + 1) * bucket_size)) + 1
+        next_end = min(int(math.floor((i + 2) * bucket_size)) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(points[j][0] for j in range(next_start, next_end)) / count
+        avg_y = sum(points[j][1] for j in range(next_start, next_end)) / count
+
+        start = int(math.floor(i * bucket_size)) + 1
+        end = int(math.floor((i + 1) * bucket_size)) + 1
+        ax, ay = points[a]
+
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+
+        selected.append(best)
+        a = best
+
+    selected.append(n - 1)
+    return selected
+
+
+def _stride_indices(n: int, budget: int) -> List[int]:
+    step = math.ceil(n / budget)
+    return list(range(0, n, step))
+
+
+def _series_lttb_indices(data: List[Any], budget: int) -> List[int]:
+    xy = [_xy(point, i) for i, point in enumerate(data)]
+    if any(p is None for p in xy):
+        # Nulls or multi-value points (ranges, OHLC): plain decimation
+        return _stride_indices(len(data), budget)
+    return lttb_indices(xy, budget)
+
+
+def _bucket_mean(values: List[Any]) -> Any:
+    numbers = [v for v in values if _is_number(v)]
+    return sum(numbers) / len(numbers) if numbers else None
+
+
+def _aggregate_bucket(points: List[Any]) -> Any:
+    """Mean of a bucket of points, keeping the shape of the first point"""
+    first = points[0]
+    if _is_number(first) or first is None:
+        return _bucket_mean(points)
+    if isinstance(first, (list, tuple)) and len(first) == 2:
+        return [first[0], _bucket_mean([p[1] for p in points if isinstance(p, (list, tuple)) and len(p) == 2])]
+    if isinstance(first, dict):
+        aggregated = dict(first)
+        aggregated["y"] = _bucket_mean([p.get("y") for p in points if isinstance(p, dict)])
+        return aggregated
+    return first
+
+
+def _buckets(n: int, budget: int) -> List[Tuple[int, int]]:
+    size = math.ceil(n / budget)
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+def _chart_type(config: Dict[str, Any]) -> str:
+    chart = config.get("chart")
+    return chart.get("type", "line") if isinstance(chart, dict) else "line"
+
+
+def _first_x_axis(config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    x_axis = config.get("xAxis")
+    if isinstance(x_axis, list):
+        x_axis = x_axis[0] if x_axis else None
+    return x_axis if isinstance(x_axis, dict) else None
+
+
+def downsample_artifact(artifact: Dict[str, Any], budget: int = ARTIFACT_POINT_BUDGET) -> Dict[str, Any]:
+    """
+    Bound every series of a chart artifact to the point budget (in place).
+
+    Args:
+        artifact: A validated chart artifact
+        budget: Maximum number of points per series
+
+    Returns:
+        The same artifact, with metadata.downsampling set when anything changed
+    """
+    config = artifact.get("data")
+    series_list = config.get("series") if isinstance(config, dict) else None
+    if not isinstance(series_list, list) or budget < 3:
+        return artifact
+
+    oversized = [s for s in series_list if isinstance(s, dict) and isinstance(s.get("data"), list) and len(s["data"]) > budget]
+    if not oversized:
+        return artifact
+
+    chart_type = _chart_type(config)
+    x_axis = _first_x_axis(config)
+    categories = x_axis.get("categories") if x_axis else None
+    report = []
+
+    def series_type(series: Dict[str, Any]) -> str:
+        return series.get("type", chart_type)
+
+    def record(series: Dict[str, Any], original: int, method: str):
+        report.append({
+            "name": series.get("name"),
+            "original_points": original,
+            "points": len(series["data"]),
+            "method": method
+        })
+
+    # Series positioned by category index must be reduced with the categories
+    if isinstance(categories, list) and len(categories) > budget:
+        aligned = [
+            s for s in series_list
+            if isinstance(s, dict) and isinstance(s.get("data"), list)
+            and all(_is_number(p) or p is None for p in s["data"])
+        ]
+        if aligned and all(series_type(s) in LINE_TYPES for s in aligned):
+            # Split the budget so the union of the series' points stays within it
+            share = budget // len(aligned)
+            if share >= 3:
+                keep = set()
+                for series in aligned:
+                    keep.update(_series_lttb_indices(series["data"][:len(categories)], share))
+                indices = sorted(keep)
+            else:
+                indices = _stride_indices(len(categories), budget)
+            for series in aligned:
+                original = len(series["data"])
+                series["data"] = [series["data"][i] for i in indices if i < original]
+                record(series, original, "lttb")
+            x_axis["categories"] = [categories[i] for i in indices]
+        elif aligned:
+            buckets = _buckets(len(categories), budget)
+            for series in aligned:
+                original = len(series["data"])
+                series["data"] = [
+                    _bucket_mean(series["data"][start:end])
+                    for start, end in buckets if start < original
+                ]
+                record(series, original, "bucket_mean")
+            x_axis["categories"] = [
+                categories[start] if end - start == 1 else f"{categories[start]} – {categories[end - 1]}"
+                for start, end in buckets
+            ]
+        handled = {id(s) for s in aligned}
+    else:
+        handled = set()
+
+    for series in oversized:
+        if id(series) in handled:
+            continue
+        data = series["data"]
+        original = len(data)
+        if series_type(series) in LINE_TYPES:
+            indices = _series_lttb_indices(data, budget)
+            kept = []
+            for i in indices:
+                point = data[i]
+                if _is_number(point) or point is None:
+                    # Implicit x would shift once points are dropped: make it explicit
+                    start = series.get("pointStart", 0)
+                    interval = series.get("pointInterval", 1)
+                    point = [start + i * interval, point]
+                kept.append(point)
+            series["data"] = kept
+            record(series, original, "lttb")
+        else:
+            interval = series.get("pointInterval", 1)
+            buckets = _buckets(original, budget)
+            series["data"] = [_aggregate_bucket(data[start:end]) for start, end in buckets]
+            if all(_is_number(p) or p is None for p in data):
+                # Keep implicit x spacing consistent with the wider buckets
+                series["pointInterval"] = interval * (buckets[0][1] - buckets[0][0])
+            record(series, original, "bucket_mean")
+
+    if report:
+        metadata = artifact.setdefault("metadata", {})
+        metadata["downsampling"] = {"point_budget": budget, "series": report}
+    return artifact
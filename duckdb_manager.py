@@ -0,0 +1,94 @@
+"""
+DuckDB Connection Manager
+
+Opens the analytics database once per process and hands out one cursor per
+thread, instead of re-opening the database file (and re-reading its catalog)
+on every duckdb_query tool call.
+
+Configuration (environment variables):
+    DUCKDB_PATH          database file (default: database.db)
+    DUCKDB_READ_ONLY     open read-only for analytics (default: 1)
+    DUCKDB_THREADS       DuckDB worker threads per query (default: DuckDB's own)
+    DUCKDB_MEMORY_LIMIT  e.g. "2GB" (default: DuckDB's own)
+
+Usage:
+    from duckdb_manager import duckdb_manager
+
+    rows = duckdb_manager.cursor().execute("SELECT 42").fetchall()
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", "database.db")
+DUCKDB_READ_ONLY = os.getenv("DUCKDB_READ_ONLY", "1") not in ("0", "false", "False")
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0")) or None
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT") or None
+
+
+class DuckDBConnectionManager:
+    """One shared DuckDB connection with a cursor per thread"""
+
+    def __init__(
+        self,
+        path: str = DUCKDB_PATH,
+        read_only: bool = DUCKDB_READ_ONLY,
+        threads: Optional[int] = DUCKDB_THREADS,
+        memory_limit: Optional[str] = DUCKDB_MEMORY_LIMIT
+    ):
+        self.path = path
+        self.read_only = read_only
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self._conn = None
+        self._cursors: List[Any] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _config(self) -> Dict[str, Any]:
+        config: Dict[str, Any] = {}
+        if self.threads:
+            config["threads"] = self.threads
+        if self.memory_limit:
+            config["memory_limit"] = self.memory_limit
+        return config
+
+    def connect(self):
+        """Open the shared connection (idempotent)"""
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    import duckdb
+
+                    self._conn = duckdb.connect(self.path, read_only=self.read_only, config=self._config())
+        return self._conn
+
+    def cursor(self):
+        """Return this thread's cursor, creating it on first use"""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            conn = self.connect()
+            with self._lock:
+                cursor = conn.cursor()
+                self._cursors.append(cursor)
+            self._local.cursor = cursor
+        return cursor
+
+    def close(self):
+        """Close every cursor and the shared connection; call on shutdown"""
+        with self._lock:
+            for cursor in self._cursors:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            self._cursors = []
+            self._local = threading.local()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+duckdb_manager = DuckDBConnectionManager()
@@ -5,7 +5,8 @@ const sendBtn = document.getElementById('sendBtn');
 const newChatBtn = document.getElementById('newChatBtn');
 
 let isWaitingForResponse = false;
-let messages = [];
+// Conversation history lives on the server; only the new message is sent
+let sessionId = null;
 
 function autoResizeTextarea() {
     messageInput.style.height = 'auto';
@@ -31,26 +32,6 @@ function clearWelcomeMessage() {
     }
 }
 
-function detectArtifact(content) {
-    const artifactRegex = /<<<ARTIFACT_START>>>([\s\S]*?)<<<ARTIFACT_END>>>/;
-    const match = content.match(artifactRegex);
-
-    if (match) {
-        const beforeArtifact = content.substring(0, match.index).trim();
-        const artifactJson = match[1].trim();
-        const afterArtifact = content.substring(match.index + match[0].length).trim();
-
-        return {
-            hasArtifact: true,
-            beforeText: beforeArtifact,
-            artifactData: artifactJson,
-            afterText: afterArtifact
-        };
-    }
-
-    return { hasArtifact: false };
-}
-
 function createChartElement(artifactData) {
     const chartContainer = document.createElement('div');
     chartContainer.className = 'w-full bg-white rounded-lg border border-border p-4 my-2';
@@ -91,45 +72,72 @@ function createMessageElement(content, isUser = false) {
     return messageDiv;
 }
 
-function createArtifactMessage(content) {
-    const artifact = detectArtifact(content);
-
-    if (!artifact.hasArtifact) {
-        return createMessageElement(content, false);
-    }
+function createTextSegment(content) {
+    const textDiv = document.createElement('div');
+    textDiv.className = 'bg-muted text-foreground rounded-lg px-4 py-3';
+    const text = document.createElement('p');
+    text.className = 'text-sm whitespace-pre-wrap break-words';
+    text.textContent = content;
+    textDiv.appendChild(text);
+    return textDiv;
+}
 
+function createStreamingMessage() {
     const containerDiv = document.createElement('div');
     containerDiv.className = 'flex justify-start w-full';
 
     const contentWrapper = document.createElement('div');
     contentWrapper.className = 'max-w-[90%] space-y-2';
+    containerDiv.appendChild(contentWrapper);
+
+    let currentTextNode = null;
+    let pendingText = '';
+    let frameRequested = false;
 
-    if (artifact.beforeText) {
-        const beforeDiv = document.createElement('div');
-        beforeDiv.className = 'bg-muted text-foreground rounded-lg px-4 py-3';
-        const beforeText = document.createElement('p');
-        beforeText.className = 'text-sm whitespace-pre-wrap break-words';
-        beforeText.textContent = artifact.beforeText;
-        beforeDiv.appendChild(beforeText);
-        contentWrapper.appendChild(beforeDiv);
+    // Text deltas are buffered and written at most once per animation frame
+    function flushText() {
+        frameRequested = false;
+        if (!pendingText) return;
+
+        if (!currentTextNode) {
+            const textDiv = createTextSegment('');
+            currentTextNode = document.createTextNode('');
+            textDiv.querySelector('p').appendChild(currentTextNode);
+            contentWrapper.appendChild(textDiv);
+        }
+        currentTextNode.appendData(pendingText);
+        pendingText = '';
+        scrollToBottom();
     }
 
-    const artifactData = JSON.parse(artifact.artifactData);
-    const chartElement = createChartElement(artifactData);
-    contentWrapper.appendChild(chartElement);
-
-    if (artifact.afterText) {
-        const afterDiv = document.createElement('div');
-        afterDiv.className = 'bg-muted text-foreground rounded-lg px-4 py-3';
-        const afterText = document.createElement('p');
-        afterText.className = 'text-sm whitespace-pre-wrap break-words';
-        afterText.textContent = artifact.afterText;
-        afterDiv.appendChild(afterText);
-        contentWrapper.appendChild(afterDiv);
+    function appendText(text) {
+        // Skip whitespace-only bubbles around artifacts
+        if (!currentTextNode && !pendingText) {
+            text = text.replace(/^\s+/, '');
+            if (!text) return;
+        }
+        pendingText += text;
+        if (!frameRequested) {
+            frameRequested = true;
+            requestAnimationFrame(flushText);
+        }
     }
 
-    containerDiv.appendChild(contentWrapper);
-    return containerDiv;
+    function appendElement(element) {
+        flushText();
+        contentWrapper.appendChild(element);
+        // Text after an artifact goes into a new bubble
+        currentTextNode = null;
+        scrollToBottom();
+    }
+
+    return {
+        element: containerDiv,
+        appendText: appendText,
+        appendArtifact: artifact => appendElement(createChartElement(artifact)),
+        appendInvalidArtifact: content => appendElement(createTextSegment(content)),
+        finish: flushText
+    };
 }
 
 function createLoadingElement() {
@@ -159,23 +167,57 @@ function scrollToBottom() {
     chatContainer.scrollTop = chatContainer.scrollHeight;
 }
 
-async function getLLMResponse() {
-    const response = await fetch('/chat', {
+function parseSSEEvent(rawEvent) {
+    let event = 'message';
+    const dataLines = [];
+
+    rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+
+    return { event: event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+}
+
+async function streamLLMResponse(message, onEvent) {
+    const response = await fetch('/chat-stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
         body: JSON.stringify({
-            messages: messages
+            session_id: sessionId,
+            message: message
         })
     });
 
-    if (!response.ok) {
+    if (!response.ok || !response.body) {
         throw new Error('Failed to get response from server');
     }
 
-    const data = await response.json();
-    return data.response;
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            if (rawEvent.trim()) {
+                onEvent(parseSSEEvent(rawEvent));
+            }
+            boundary = buffer.indexOf('\n\n');
+        }
+    }
 }
 
 async function handleSubmit(e) {
@@ -203,22 +245,44 @@ async function handleSubmit(e) {
     scrollToBottom();
 
     try {
-        messages.push({
-            role: 'user',
-            content: message
-        });
-
-        const response = await getLLMResponse();
-
-        messages.push({
-            role: 'assistant',
-            content: response
+        let streamingMessage = null;
+        let completed = false;
+
+        await streamLLMResponse(message, ({ event, data }) => {
+            if (event === 'error') {
+                throw new Error(data.message);
+            }
+            if (event === 'done') {
+                sessionId = data.session_id;
+                completed = true;
+                return;
+            }
+
+            // First event: swap the loading dots for the assistant message
+            if (!streamingMessage) {
+                loadingElement.remove();
+                streamingMessage = createStreamingMessage();
+                chatContainer.appendChild(streamingMessage.element);
+            }
+
+            if (event === 'text_delta') {
+                streamingMessage.appendText(data.text);
+            } else if (event === 'artifact') {
+                streamingMessage.appendArtifact(data.artifact);
+            } else if (event === 'artifact_error') {
+                console.warn('Invalid artifact from server:', data.error);
+                streamingMessage.appendInvalidArtifact(data.content);
+            }
         });
 
         loadingElement.remove();
+        if (streamingMessage) {
+            streamingMessage.finish();
+        }
 
-        const assistantMessageElement = createArtifactMessage(response);
-        chatContainer.appendChild(assistantMessageElement);
+        if (!completed) {
+            throw new Error('Stream ended before completion');
+        }
         scrollToBottom();
     } catch (error) {
         loadingElement.remove();
@@ -240,7 +304,7 @@ async function handleSubmit(e) {
 }
 
 function handleNewChat() {
-    messages = [];
+    sessionId = null;
 
     chatContainer.innerHTML = `
         <div class="flex items-center justify-center h-full">
@@ -0,0 +1,202 @@
+"""
+Token-Budgeted Conversation History
+
+Sending the whole conversation on every turn makes prompt size, latency and
+cost grow linearly until the context limit is hit. The HistoryManager keeps
+the most recent turns verbatim within a token budget and replaces older
+turns with a rolling summary:
+
+- Tokens are counted with tiktoken when installed (4 chars/token otherwise)
+- When the history exceeds the budget, the oldest turns are folded into a
+  summary until the recent window fits in HISTORY_RECENT_RATIO of the budget,
+  which leaves room for several more turns before the next summary update
+- Summaries are cached by a hash of the summarized prefix of the
+  conversation, so later turns reuse them, and an update only summarizes the
+  turns dropped since the last cached summary
+
+Configuration (environment variables):
+    HISTORY_TOKEN_BUDGET        tokens of history sent verbatim (default 6000)
+    HISTORY_RECENT_RATIO        share of the budget kept after a cut (default 0.5)
+    HISTORY_SUMMARY_CACHE_SIZE  cached summaries (default 1024)
+
+Usage:
+    from history import history_manager
+
+    langchain_messages = [system_message("openai")]
+    langchain_messages += await history_manager.prepare(request.messages)
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+HISTORY_RECENT_RATIO = float(os.getenv("HISTORY_RECENT_RATIO", "0.5"))
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "1024"))
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and a Risk Analyst assistant.
+Update the summary with the new messages below. Keep facts, numbers, table and column names,
+SQL that worked, chart preferences and open questions. Drop pleasantries and chart JSON.
+Reply with the updated summary only, in at most 250 words.
+
+<current_summary>
+{summary}
+</current_summary>
+
+<new_messages>
+{messages}
+</new_messages>"""
+
+Summarizer = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Not installed, or the encoding file cannot be downloaded (offline)
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Approximate token count of a string"""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def to_langchain_messages(messages: List[Dict[str, str]]) -> List[BaseMessage]:
+    """Convert frontend {"role", "content"} messages to LangChain messages"""
+    langchain_messages: List[BaseMessage] = []
+    for msg in messages:
+        if msg["role"] == "user":
+            langchain_messages.append(HumanMessage(content=msg["content"]))
+        elif msg["role"] == "assistant":
+            langchain_messages.append(AIMessage(content=msg["content"]))
+    return langchain_messages
+
+
+def summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
+
+
+def _prefix_hashes(messages: List[Dict[str, str]]) -> List[str]:
+    """hashes[k] identifies the first k messages of the conversation"""
+    hashes = [""]
+    digest = hashlib.sha256()
+    for msg in messages:
+        digest.update(msg.get("role", "").encode("utf-8") + b"\x00")
+        digest.update(msg.get("content", "").encode("utf-8") + b"\x01")
+        hashes.append(digest.copy().hexdigest())
+    return hashes
+
+
+async def llm_summarize(summary: str, messages: List[Dict[str, str]]) -> str:
+    """Default summarizer: fold new messages into the running summary with the shared LLM"""
+    from llm_clients import get_llm
+
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(empty)", messages=transcript)
+    response = await get_llm("openai", "gpt-4", temperature=0).ainvoke([HumanMessage(content=prompt)])
+    return response.content
+
+
+class HistoryManager:
+    """Windows conversation history to a token budget with cached rolling summaries"""
+
+    def __init__(
+        self,
+        budget: int = HISTORY_TOKEN_BUDGET,
+        recent_ratio: float = HISTORY_RECENT_RATIO,
+        cache_size: int = HISTORY_SUMMARY_CACHE_SIZE,
+        summarize: Optional[Summarizer] = None
+    ):
+        self.budget = budget
+        self.recent_ratio = recent_ratio
+        self.cache_size = cache_size
+        self.summarize = summarize or llm_summarize
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached_summary(self, prefix_hash: str) -> Optional[str]:
+        with self._lock:
+            summary = self._summaries.get(prefix_hash)
+            if summary is not None:
+                self._summaries.move_to_end(prefix_hash)
+            return summary
+
+    def _store_summary(self, prefix_hash: str, summary: str):
+        with self._lock:
+            self._summaries[prefix_hash] = summary
+            self._summaries.move_to_end(prefix_hash)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    async def window(self, messages: List[Dict[str, str]]) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """
+        Split a conversation into (summary of older turns, recent turns).
+
+        The last message is always kept verbatim. Summary is None when the
+        whole conversation fits in the budget.
+        """
+        tokens = [count_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages]
+        # suffix[k] = tokens of messages[k:]
+        suffix = [0] * (len(messages) + 1)
+        for k in range(len(messages) - 1, -1, -1):
+            suffix[k] = suffix[k + 1] + tokens[k]
+
+        if suffix[0] <= self.budget or len(messages) <= 1:
+            return None, messages
+
+        hashes = _prefix_hashes(messages)
+        last = len(messages) - 1
+
+        # Reuse the most recent cached cut whose window still fits the budget
+        for cut in range(last, 0, -1):
+            if suffix[cut] > self.budget:
+                break
+            summary = self._cached_summary(hashes[cut])
+            if summary is not None:
+                return summary, messages[cut:]
+
+        # New cut: shrink the recent window to the target so later turns can reuse it
+        target = self.budget * self.recent_ratio
+        cut = last
+        while cut > 1 and suffix[cut - 1] <= target:
+            cut -= 1
+
+        # Fold only the turns after the newest cached summary into it
+        base, previous = 0, ""
+        for k in range(cut - 1, 0, -1):
+            summary = self._cached_summary(hashes[k])
+            if summary is not None:
+                base, previous = k, summary
+                break
+
+        summary = await self.summarize(previous, messages[base:cut])
+        self._store_summary(hashes[cut], summary)
+        return summary, messages[cut:]
+
+    async def prepare(self, messages: List[Dict[str, str]]) -> List[BaseMessage]:
+        """LangChain messages for the conversation: optional summary message plus recent turns"""
+        summary, recent = await self.window(messages)
+        prepared = to_langchain_messages(recent)
+        if summary:
+            prepared.insert(0, summary_message(summary))
+        return prepared
+
+
+history_manager = HistoryManager()
@@ -0,0 +1,39 @@
+"""
+Fast JSON Codec
+
+Uses orjson when it is installed (several times faster than the standard
+library for both parsing and serializing) and falls back to json otherwise.
+Both functions work on bytes so files can be read and written in binary
+mode without an extra decode/encode pass.
+
+Usage:
+    from json_codec import dumps, loads
+
+    with open(path, "rb") as f:
+        data = loads(f.read())
+    with open(path, "wb") as f:
+        f.write(dumps(data, indent=True))
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (2-space indented when indent is True)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
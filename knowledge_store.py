@@ -0,0 +1,1400 @@
+"""
+Knowledge Memory Storage Backends
+
+The memory tools in tools.py work on index entries like:
+
+    {
+        "memory_id": "MEMORY-001",
+        "file_path": "memory-001.md",
+        "category": "user_profile",
+        "tags": ["preferences", "ui"],
+        "summary": "User UI preferences",
+        "confidence": 0.8,
+        "access_count": 0,
+        "status": "active",
+        "created": "2025-01-01T00:00:00Z",
+        "updated": "2025-01-01T00:00:00Z"
+    }
+
+Two interchangeable backends store them:
+
+- JsonKnowledgeStore: the original knowledge/knowledge.json file, now a
+  snapshot plus an append-only journal (knowledge/knowledge.journal). Each
+  change (create/update/retire/next_id/access) is one JSON line appended
+  under an exclusive flock on knowledge/knowledge.lock, so several uvicorn
+  workers can write concurrently without lost updates. Every
+  KNOWLEDGE_JOURNAL_COMPACT_EVERY records the journal is folded into a new
+  snapshot written to a temp file and renamed over knowledge.json, so the
+  snapshot is never left truncated. The parsed index is cached in process;
+  at most every KNOWLEDGE_INDEX_RECHECK_INTERVAL seconds the journal tail
+  written by other workers is replayed, so repeated tool calls in a turn do
+  not touch the disk.
+- SQLiteKnowledgeStore: knowledge/knowledge.db, one row per memory, indexed
+  on memory_id, status, category and updated, so lookups and writes are
+  O(log n) row operations. Concurrency is handled by SQLite (WAL).
+
+Derived indexes (search_index, dedup_index, vector_index) follow every change, including changes
+replayed from other workers, and persist the change sequence they reflect so
+a stale copy on disk is rebuilt instead of trusted. The search index is
+sharded by category (knowledge/search_index/), so category-filtered searches
+and writes load and rewrite one shard only. A memory that leaves the live
+index or changes category reaches the derived indexes as a copy with status
+"archived" (a tombstone), followed by its new version if it has one.
+
+Memory content is kept in knowledge/memory-NNN.md files by default. With
+KNOWLEDGE_CONTENT_FORMAT=packed it goes into one append-only, memory-mapped
+segment instead (memory_content.py); memories whose content is not in the
+pack yet are still read from their .md files, and
+`python knowledge_store.py pack-content` copies them in.
+`python knowledge_store.py compact-content` drops retired content from the
+pack.
+
+Retired memories can be tiered out of the live store into a compressed cold
+archive (memory_archive.py) with `python knowledge_store.py archive-retired`;
+the archive is only read for searches that ask for retired memories.
+
+Tenants: tenant_scope(tenant_id) binds the memory tools in the current
+context (request, task or thread) to the tenant's own store under
+knowledge/tenants/<tenant_id>/. Open tenant stores are kept in a bounded LRU
+(TenantStores); the least recently used idle tenant is flushed and closed
+when the limit is reached. Without a tenant the process-wide store in
+KNOWLEDGE_DIR is used, as before.
+
+Reads never write: access_count bumps from search/read go into an in-memory
+AccessCountBuffer and reach the store in one batched write per flush (every
+KNOWLEDGE_ACCESS_FLUSH_INTERVAL seconds, every KNOWLEDGE_ACCESS_FLUSH_COUNT
+bumps, and on close/interpreter exit).
+
+Configuration (environment variables):
+    KNOWLEDGE_DIR                    (default: knowledge)
+    KNOWLEDGE_BACKEND                "json" (default) or "sqlite"
+    KNOWLEDGE_ACCESS_FLUSH_INTERVAL  seconds between access-count flushes (default 30)
+    KNOWLEDGE_ACCESS_FLUSH_COUNT     pending bumps that force a flush (default 500)
+    KNOWLEDGE_INDEX_RECHECK_INTERVAL seconds a cached JSON index is trusted
+                                     before checking the journal again (default 2)
+    KNOWLEDGE_JOURNAL_COMPACT_EVERY  journal records before compaction (default 1000)
+    KNOWLEDGE_CONTENT_FORMAT         "files" (default) or "packed"
+    KNOWLEDGE_ARCHIVE_AFTER_DAYS     days since retirement before archive-retired
+                                     moves a memory to the archive (default 30)
+    KNOWLEDGE_MAX_OPEN_TENANTS       tenant stores kept open (default 64)
+
+Migrating an existing JSON index:
+    python knowledge_store.py migrate [--knowledge-dir knowledge]
+
+Archiving retired memories (e.g. from a nightly cron job):
+    python knowledge_store.py archive-retired [--knowledge-dir knowledge] [--older-than-days 30]
+
+Moving memory content into the packed segment:
+    python knowledge_store.py pack-content [--knowledge-dir knowledge] [--remove-files]
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import json_codec
+from memory_archive import ColdArchive
+from memory_content import PackedContentStore
+from memory_dedup import MinHashIndex
+from memory_search import ShardedSearchIndex, epoch_seconds
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no inter-process locking; run a single worker there
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", "knowledge")
+KNOWLEDGE_INDEX = os.path.join(KNOWLEDGE_DIR, "knowledge.json")
+KNOWLEDGE_BACKEND = os.getenv("KNOWLEDGE_BACKEND", "json")
+KNOWLEDGE_ACCESS_FLUSH_INTERVAL = float(os.getenv("KNOWLEDGE_ACCESS_FLUSH_INTERVAL", "30"))
+KNOWLEDGE_ACCESS_FLUSH_COUNT = int(os.getenv("KNOWLEDGE_ACCESS_FLUSH_COUNT", "500"))
+KNOWLEDGE_INDEX_RECHECK_INTERVAL = float(os.getenv("KNOWLEDGE_INDEX_RECHECK_INTERVAL", "2"))
+KNOWLEDGE_JOURNAL_COMPACT_EVERY = int(os.getenv("KNOWLEDGE_JOURNAL_COMPACT_EVERY", "1000"))
+KNOWLEDGE_CONTENT_FORMAT = os.getenv("KNOWLEDGE_CONTENT_FORMAT", "files")
+KNOWLEDGE_ARCHIVE_AFTER_DAYS = float(os.getenv("KNOWLEDGE_ARCHIVE_AFTER_DAYS", "30"))
+KNOWLEDGE_MAX_OPEN_TENANTS = int(os.getenv("KNOWLEDGE_MAX_OPEN_TENANTS", "64"))
+
+MEMORY_FIELDS = (
+    "memory_id", "file_path", "category", "tags", "summary",
+    "confidence", "access_count", "status", "created", "updated"
+)
+
+
+def utc_now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def empty_index() -> Dict[str, Any]:
+    now = utc_now()
+    return {
+        "metadata": {
+            "created": now,
+            "last_updated": now,
+            "total_memories": 0,
+            "next_id": 1
+        },
+        "memories": []
+    }
+
+
+def _copy_memory(memory: Dict[str, Any]) -> Dict[str, Any]:
+    # Callers may edit returned entries; keep the cached index untouched
+    return {**memory, "tags": list(memory.get("tags") or [])}
+
+
+def _matches(memory: Dict[str, Any], status: Optional[str], category: Optional[str]) -> bool:
+    if status and status != "all" and memory.get("status") != status:
+        return False
+    if category and memory.get("category") != category:
+        return False
+    return True
+
+
+class AccessCountBuffer:
+    """Write-behind buffer of access_count increments, flushed in batches"""
+
+    def __init__(
+        self,
+        flush: Callable[[Dict[str, int]], None],
+        interval: float = KNOWLEDGE_ACCESS_FLUSH_INTERVAL,
+        max_pending: int = KNOWLEDGE_ACCESS_FLUSH_COUNT
+    ):
+        self._flush = flush
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: Counter = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _start(self):
+        # Caller holds the lock
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="knowledge-access-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while not self._wakeup.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Access count flush failed")
+
+    def add(self, memory_ids: Iterable[str]):
+        """Record one access for each memory id"""
+        with self._lock:
+            if self._closed:
+                return
+            self._pending.update(memory_ids)
+            self._start()
+            full = sum(self._pending.values()) >= self.max_pending
+        if full:
+            self.flush()
+
+    def pending(self, memory_id: str) -> int:
+        """Accesses recorded but not yet written to the store"""
+        with self._lock:
+            return self._pending.get(memory_id, 0)
+
+    def pending_counts(self) -> Dict[str, int]:
+        """All accesses recorded but not yet written to the store"""
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Write all pending increments to the store in one batch"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._pending = dict(self._pending), Counter()
+            if not counts:
+                return
+            try:
+                self._flush(counts)
+            except Exception:
+                with self._lock:
+                    self._pending.update(counts)
+                raise
+
+    def close(self):
+        """Flush what is pending and stop the background flusher"""
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+            atexit.unregister(self.flush)
+        self.flush()
+
+
+class KnowledgeStore(ABC):
+    """Behaviour shared by the storage backends"""
+
+    knowledge_dir: str
+
+    def __init__(self, content_format: str = KNOWLEDGE_CONTENT_FORMAT):
+        if content_format not in ("files", "packed"):
+            raise ValueError(f"Unknown content format '{content_format}'. Use: files or packed")
+        self.content_format = content_format
+        self._content_pack: Optional[PackedContentStore] = None
+        self._archive: Optional[ColdArchive] = None
+        # Bumped on every change this process writes or observes
+        self.version = 0
+        # Sequence number of the last memory create/update/retire; derived
+        # indexes persist it to tell whether they are still current
+        self.change_seq = 0
+        self.access = AccessCountBuffer(self.increment_access)
+        self._lock = threading.RLock()
+        self._derived: Dict[str, Any] = {}
+        # Set while a batch() is open: content writes (memory_id ->
+        # (file_path, content)) and changed memories are held back until
+        # the batch commits
+        self._staged_content: Optional[Dict[str, Tuple[str, str]]] = None
+        self._batch_changed: Optional[List[Dict[str, Any]]] = None
+
+    def sync(self):
+        """Pick up changes written by other processes"""
+
+    @abstractmethod
+    def load_index(self) -> Dict[str, Any]:
+        """The whole index as {"metadata": ..., "memories": [...]}"""
+
+    @abstractmethod
+    def save_index(self, data: Dict[str, Any]):
+        """Replace the whole index with a new snapshot"""
+
+    @abstractmethod
+    def get(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        """A memory by id, or None"""
+
+    @abstractmethod
+    def list(self, status: Optional[str] = None, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Memories filtered by status ('all' or None for any) and category"""
+
+    @abstractmethod
+    def put(self, memory: Dict[str, Any]):
+        """Insert or replace a memory entry"""
+
+    @abstractmethod
+    def allocate_id(self) -> int:
+        """Reserve and return the next numeric memory id"""
+
+    def derived_index(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        An index derived from the memories (search, duplicates, ...).
+
+        Built by factory() on first use and then kept current: every memory
+        change, local or replayed from another process, is passed to the
+        index's apply(memories, change_seq).
+        """
+        with self._lock:
+            self.sync()
+            index = self._derived.get(name)
+            if index is None:
+                index = self._derived[name] = factory()
+            return index
+
+    def _changed(self, memories: List[Dict[str, Any]]):
+        # Caller holds the lock
+        if self._batch_changed is not None:
+            self._batch_changed.extend(memories)
+            return
+        for index in list(self._derived.values()):
+            index.apply(memories, self.change_seq)
+
+    def _accessed(self, counts: Dict[str, int]):
+        # Caller holds the lock; access counts are not memory changes, so
+        # only indexes that rank by them are told
+        for index in list(self._derived.values()):
+            if hasattr(index, "apply_access"):
+                index.apply_access(counts)
+
+    @contextmanager
+    def batch(self):
+        """
+        Group writes into one atomic commit.
+
+        Reads inside the batch see its own changes. Content writes are staged
+        and written when the batch commits; derived indexes are updated once,
+        after the commit. If the block raises, nothing is written.
+        """
+        with self._lock:
+            if self._staged_content is not None:
+                # Nested batch: part of the outer one
+                yield
+                return
+            with self._batch_commit():
+                self._staged_content, self._batch_changed = {}, []
+                try:
+                    yield
+                    self._write_contents(self._staged_content)
+                except BaseException:
+                    self._staged_content = self._batch_changed = None
+                    raise
+            changed = self._batch_changed
+            self._staged_content = self._batch_changed = None
+            if changed:
+                self._changed(changed)
+
+    @abstractmethod
+    def _batch_commit(self):
+        """Context manager wrapping a batch in the backend's commit/rollback"""
+
+    def _reset_derived(self):
+        # Caller holds the lock; indexes are rebuilt on next use
+        self._derived.clear()
+
+    @property
+    def search_index(self) -> ShardedSearchIndex:
+        """BM25 index over this store's memories, one shard per category (loaded lazily)"""
+        return self.derived_index("search", lambda: ShardedSearchIndex.open(
+            os.path.join(self.knowledge_dir, "search_index"),
+            lambda category: self.list(status="all", category=category),
+            self.change_seq,
+            self.access_counts
+        ))
+
+    @property
+    def dedup_index(self) -> MinHashIndex:
+        """MinHash/LSH index of active memory content for duplicate detection"""
+        return self.derived_index("dedup", lambda: MinHashIndex.open(
+            os.path.join(self.knowledge_dir, "dedup_index.json"),
+            lambda: self.list(status="active"),
+            lambda memory: self.read_content(memory) or memory.get("summary", ""),
+            self.change_seq
+        ))
+
+    @property
+    def vector_index(self):
+        """Semantic vectors of memory summary, tags and content (needs NumPy)"""
+        from memory_vectors import VectorIndex
+
+        return self.derived_index("vectors", lambda: VectorIndex.open(
+            os.path.join(self.knowledge_dir, "vector_index.json"),
+            lambda: self.list(status="all"),
+            self.memory_text,
+            self.change_seq
+        ))
+
+    def memory_text(self, memory: Dict[str, Any]) -> str:
+        """Summary, tags and content of a memory as one text"""
+        return "\n".join([
+            memory.get("summary") or "",
+            " ".join(memory.get("tags") or []),
+            self.read_content(memory) or ""
+        ])
+
+    @property
+    def content_pack(self) -> Optional[PackedContentStore]:
+        """The packed content segment (None when content is kept in .md files)"""
+        if self.content_format != "packed":
+            return None
+        with self._lock:
+            if self._content_pack is None:
+                self._content_pack = PackedContentStore(self.knowledge_dir, KNOWLEDGE_INDEX_RECHECK_INTERVAL)
+            return self._content_pack
+
+    def read_content(self, memory: Dict[str, Any]) -> Optional[str]:
+        """Full content of a memory, or None when it has none stored"""
+        memory_id = memory.get("memory_id")
+        if self._staged_content and memory_id in self._staged_content:
+            return self._staged_content[memory_id][1]
+        pack = self.content_pack
+        if pack is not None:
+            content = pack.read(memory_id)
+            if content is not None:
+                return content
+        file_path = memory.get("file_path")
+        if file_path:
+            try:
+                with open(os.path.join(self.knowledge_dir, file_path), 'r') as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+        if memory.get("status") == "retired":
+            return self.archive.read_content(memory_id)
+        return None
+
+    def write_content(self, memory: Dict[str, Any], content: str):
+        """Write a memory's content; call before put() so derived indexes see it"""
+        contents = {memory["memory_id"]: (memory["file_path"], content)}
+        if self._staged_content is not None:
+            self._staged_content.update(contents)
+            return
+        self._write_contents(contents)
+
+    def _write_contents(self, contents: Dict[str, Tuple[str, str]]):
+        # memory_id -> (file_path, content); one append when packed
+        pack = self.content_pack
+        if pack is not None:
+            pack.write_many((memory_id, content) for memory_id, (_, content) in contents.items())
+            return
+        os.makedirs(self.knowledge_dir, exist_ok=True)
+        for file_path, content in contents.values():
+            with open(os.path.join(self.knowledge_dir, file_path), 'w') as f:
+                f.write(content)
+
+    def compact_content(self) -> int:
+        """
+        Drop the content of retired memories from the packed segment.
+
+        Returns:
+            Bytes reclaimed (0 when content is kept in .md files)
+        """
+        pack = self.content_pack
+        if pack is None:
+            return 0
+        return pack.compact(drop=[m["memory_id"] for m in self.list(status="retired")])
+
+    @property
+    def archive(self) -> ColdArchive:
+        """Cold archive of retired memories moved out of the live store"""
+        with self._lock:
+            if self._archive is None:
+                self._archive = ColdArchive(self.knowledge_dir)
+            return self._archive
+
+    def archive_retired(self, older_than_days: float = KNOWLEDGE_ARCHIVE_AFTER_DAYS) -> int:
+        """
+        Move retired memories and their content to the cold archive.
+
+        The archive is written (and synced) first, then the memories are
+        removed from the live store in one commit, then their content is
+        deleted. A crash in between leaves a memory in both tiers; the live
+        copy wins and the next run archives it again.
+
+        Args:
+            older_than_days: Only archive memories last updated this many days ago or earlier
+
+        Returns:
+            Number of archived memories
+        """
+        cutoff = time.time() - older_than_days * 86400
+        with self._lock:
+            with self.batch():
+                # Memories without a valid timestamp count as old
+                retired = [
+                    m for m in self.list(status="retired")
+                    if not epoch_seconds(m.get("updated") or m.get("created")) > cutoff
+                ]
+                if not retired:
+                    return 0
+                self.archive.append([{"memory": m, "content": self.read_content(m)} for m in retired])
+                self._remove_memories([m["memory_id"] for m in retired])
+            memory_ids = {m["memory_id"] for m in retired}
+            pack = self.content_pack
+            if pack is not None:
+                pack.compact(drop=memory_ids)
+            for memory in retired:
+                if memory.get("file_path"):
+                    try:
+                        os.remove(os.path.join(self.knowledge_dir, memory["file_path"]))
+                    except FileNotFoundError:
+                        pass
+        return len(retired)
+
+    @abstractmethod
+    def _remove_memories(self, memory_ids: List[str]):
+        """Delete memories from the live store (derived indexes see them as status 'archived')"""
+
+    def get_many(self, memory_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Memories by id (missing ids are left out)"""
+        memories = {}
+        for memory_id in memory_ids:
+            memory = self.get(memory_id)
+            if memory is not None:
+                memories[memory_id] = memory
+        return memories
+
+    def record_access(self, memory_ids: Iterable[str]):
+        """Count reads without writing; the buffer flushes them in batches"""
+        self.access.add(memory_ids)
+
+    def access_counts(self, category: Optional[str] = None) -> Dict[str, int]:
+        """Stored access_count of every memory (optionally of one category), by memory id"""
+        return {m["memory_id"]: m.get("access_count", 0) for m in self.list(status="all", category=category)}
+
+    def access_count(self, memory: Dict[str, Any]) -> int:
+        """Stored access_count plus increments still waiting in the buffer"""
+        return memory.get("access_count", 0) + self.access.pending(memory["memory_id"])
+
+    @abstractmethod
+    def increment_access(self, counts: Dict[str, int]):
+        """Add access counts for several memories at once"""
+
+    def close(self):
+        self.access.close()
+        with self._lock:
+            if self._content_pack is not None:
+                self._content_pack.close()
+            for index in self._derived.values():
+                if hasattr(index, "close"):
+                    index.close()
+
+
+class JsonKnowledgeStore(KnowledgeStore):
+    """Memory index kept as a knowledge.json snapshot plus an append-only journal"""
+
+    def __init__(
+        self,
+        knowledge_dir: str = KNOWLEDGE_DIR,
+        recheck_interval: float = KNOWLEDGE_INDEX_RECHECK_INTERVAL,
+        compact_every: int = KNOWLEDGE_JOURNAL_COMPACT_EVERY,
+        content_format: str = KNOWLEDGE_CONTENT_FORMAT
+    ):
+        super().__init__(content_format)
+        self.knowledge_dir = knowledge_dir
+        self.index_path = os.path.join(knowledge_dir, "knowledge.json")
+        self.journal_path = os.path.join(knowledge_dir, "knowledge.journal")
+        self.lock_path = os.path.join(knowledge_dir, "knowledge.lock")
+        self.recheck_interval = recheck_interval
+        self.compact_every = compact_every
+        self._data: Optional[Dict[str, Any]] = None
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._snapshot_signature: Optional[Tuple[int, int, int]] = None
+        self._seq = 0
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._checked_at = 0.0
+        self._lock_file = None
+        self._file_lock_depth = 0
+        self._pending_records: Optional[List[Dict[str, Any]]] = None
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        # Caller holds self._lock; serializes with other processes
+        if fcntl is None or self._file_lock_depth:
+            # Re-entered from a batch, which already holds the exclusive lock
+            yield
+            return
+        if self._lock_file is None:
+            os.makedirs(self.knowledge_dir, exist_ok=True)
+            self._lock_file = open(self.lock_path, 'a+b')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self._file_lock_depth += 1
+        try:
+            yield
+        finally:
+            self._file_lock_depth -= 1
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load_snapshot(self, signature: Optional[Tuple[int, int, int]]):
+        # Caller holds the file lock
+        if signature is None:
+            data = empty_index()
+        else:
+            with open(self.index_path, 'rb') as f:
+                data = json_codec.loads(f.read())
+        self._data = data
+        self._by_id = {m["memory_id"]: m for m in data["memories"]}
+        self._snapshot_signature = signature
+        self._seq = data["metadata"].get("journal_seq", 0)
+        self.change_seq = data["metadata"].get("change_seq", 0)
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._reset_derived()
+        self.version += 1
+
+    def _refresh(self):
+        # Caller holds the file lock: reload a replaced snapshot, then replay
+        # journal records appended since the last refresh
+        signature = self._stat(self.index_path)
+        if self._data is None or signature != self._snapshot_signature:
+            self._load_snapshot(signature)
+        try:
+            size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            size = 0
+        if size < self._journal_offset:
+            # Journal was compacted away under us; start over from the snapshot
+            self._load_snapshot(signature)
+        if size == self._journal_offset:
+            return
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            chunk = f.read(size - self._journal_offset)
+        # Ignore a torn last line; it is truncated before the next append
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        changed = []
+        for line in complete.splitlines():
+            changed += self._apply(json_codec.loads(line))
+        self._journal_offset += len(complete)
+        if complete:
+            self.version += 1
+        if changed:
+            self._changed(changed)
+
+    def _apply(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Apply one journal record to the cached index; returns changed memories
+        if record["seq"] <= self._seq:
+            return []
+        op = record["op"]
+        if op == "batch":
+            changed = []
+            for sub_record in record["records"]:
+                changed += self._apply(sub_record)
+            return changed
+        self._seq = record["seq"]
+        self._journal_records += 1
+        metadata = self._data["metadata"]
+        metadata["last_updated"] = record["ts"]
+        if op == "next_id":
+            metadata["next_id"] = record["value"]
+        elif op == "archive":
+            removed = [self._by_id.pop(m) for m in record["memory_ids"] if m in self._by_id]
+            if removed:
+                self._data["memories"] = [m for m in self._data["memories"] if m["memory_id"] in self._by_id]
+            self.change_seq = record["seq"]
+            return [{**memory, "status": "archived"} for memory in removed]
+        elif op == "access":
+            for memory_id, count in record["counts"].items():
+                memory = self._by_id.get(memory_id)
+                if memory is not None:
+                    memory["access_count"] = memory.get("access_count", 0) + count
+            self._accessed(record["counts"])
+        else:
+            # create / update / retire
+            memory = record["memory"]
+            existing = self._by_id.get(memory["memory_id"])
+            moved = []
+            if existing is not None:
+                if existing.get("category") != memory.get("category"):
+                    # Tombstone for the old category's index shard
+                    moved = [{**existing, "status": "archived"}]
+                existing.clear()
+                existing.update(memory)
+            else:
+                memory = dict(memory)
+                self._data["memories"].append(memory)
+                self._by_id[memory["memory_id"]] = memory
+            self.change_seq = record["seq"]
+            return moved + [memory]
+        return []
+
+    def _read(self) -> Dict[str, Any]:
+        # Caller holds the lock. Serve the cached index; at most once per
+        # recheck_interval, look for writes from other processes.
+        now = time.monotonic()
+        if self._data is None or now - self._checked_at >= self.recheck_interval:
+            with self._file_lock(exclusive=False):
+                self._refresh()
+            self._checked_at = now
+        return self._data
+
+    def sync(self):
+        with self._lock:
+            self._read()
+
+    @contextmanager
+    def _writing(self):
+        # Exclusive section: catch up with other writers, then append
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            try:
+                if os.path.getsize(self.journal_path) > self._journal_offset:
+                    os.truncate(self.journal_path, self._journal_offset)
+            except FileNotFoundError:
+                pass
+            yield
+            if self._journal_records >= self.compact_every and self._pending_records is None:
+                self._compact()
+            self._checked_at = time.monotonic()
+
+    def _append(self, record: Dict[str, Any]):
+        # Caller is inside _writing(); inside a batch the record is held back
+        # and written with the rest of the batch as one journal line
+        record = {"seq": self._seq + 1, "ts": utc_now(), **record}
+        if self._pending_records is None:
+            self._write_journal_line(record)
+        else:
+            self._pending_records.append(record)
+        self.version += 1
+        changed = self._apply(record)
+        if changed:
+            self._changed(changed)
+
+    def _write_journal_line(self, record: Dict[str, Any]):
+        line = json_codec.dumps(record) + b"\n"
+        with open(self.journal_path, 'ab') as f:
+            f.write(line)
+        self._journal_offset += len(line)
+
+    @contextmanager
+    def _batch_commit(self):
+        with self._writing():
+            self._pending_records = []
+            try:
+                yield
+            except BaseException:
+                # Drop the batch's changes from the cache
+                self._pending_records = None
+                self._load_snapshot(self._stat(self.index_path))
+                self._refresh()
+                raise
+            records, self._pending_records = self._pending_records, None
+            if records:
+                # One line, so a crash keeps all of the batch or none of it
+                self._write_journal_line({
+                    "seq": records[-1]["seq"], "ts": records[-1]["ts"], "op": "batch", "records": records
+                })
+
+    def _write_snapshot(self, data: Dict[str, Any]):
+        # Caller holds the exclusive file lock. Write a temp file and rename it
+        # over the snapshot, so readers never see a partial file.
+        data["metadata"]["journal_seq"] = self._seq
+        data["metadata"]["change_seq"] = self.change_seq
+        data["metadata"]["total_memories"] = len([m for m in data["memories"] if m.get("status") == "active"])
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json_codec.dumps(data, indent=True))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+        # A crash here leaves journal records the snapshot already holds;
+        # replay skips them by sequence number
+        with open(self.journal_path, 'wb'):
+            pass
+        self._snapshot_signature = self._stat(self.index_path)
+        self._journal_offset = 0
+        self._journal_records = 0
+
+    def _compact(self):
+        """Fold the journal into a new snapshot (caller holds the exclusive file lock)"""
+        self._write_snapshot(self._data)
+
+    def compact(self):
+        """Fold the journal into knowledge.json now"""
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            self._compact()
+
+    def load_index(self) -> Dict[str, Any]:
+        """The whole index as {"metadata": ..., "memories": [...]}"""
+        with self._lock:
+            data = copy.deepcopy(self._read())
+        data["metadata"]["total_memories"] = len([m for m in data["memories"] if m.get("status") == "active"])
+        return data
+
+    def save_index(self, data: Dict[str, Any]):
+        """Replace the whole index with a new snapshot"""
+        data = copy.deepcopy(data)
+        data["metadata"]["last_updated"] = utc_now()
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            self._seq += 1
+            self.change_seq = self._seq
+            self._write_snapshot(data)
+            self._data = data
+            self._by_id = {m["memory_id"]: m for m in data["memories"]}
+            self._reset_derived()
+            self.version += 1
+
+    def get(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._read()
+            memory = self._by_id.get(memory_id)
+            return _copy_memory(memory) if memory else None
+
+    def get_many(self, memory_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._read()
+            return {
+                memory_id: _copy_memory(self._by_id[memory_id])
+                for memory_id in memory_ids if memory_id in self._by_id
+            }
+
+    def list(self, status: Optional[str] = None, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Memories filtered by status ('all' or None for any) and category"""
+        with self._lock:
+            data = self._read()
+            return [_copy_memory(m) for m in data["memories"] if _matches(m, status, category)]
+
+    def put(self, memory: Dict[str, Any]):
+        """Insert or replace a memory entry (one journal append)"""
+        memory = _copy_memory(memory)
+        with self._writing():
+            existing = self._by_id.get(memory["memory_id"])
+            if existing is None:
+                op = "create"
+            elif memory.get("status") == "retired" and existing.get("status") != "retired":
+                op = "retire"
+            else:
+                op = "update"
+            self._append({"op": op, "memory": memory})
+
+    def _remove_memories(self, memory_ids: List[str]):
+        with self._writing():
+            self._append({"op": "archive", "memory_ids": memory_ids})
+
+    def allocate_id(self) -> int:
+        """Reserve and return the next numeric memory id"""
+        with self._writing():
+            next_id = self._data["metadata"]["next_id"]
+            self._append({"op": "next_id", "value": next_id + 1})
+            return next_id
+
+    def increment_access(self, counts: Dict[str, int]):
+        """Add access counts for several memories at once"""
+        if not counts:
+            return
+        with self._writing():
+            self._append({"op": "access", "counts": counts})
+
+    def close(self):
+        super().close()
+        with self._lock:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+
+class SQLiteKnowledgeStore(KnowledgeStore):
+    """Memory index kept as indexed rows in knowledge.db"""
+
+    def __init__(
+        self,
+        knowledge_dir: str = KNOWLEDGE_DIR,
+        db_name: str = "knowledge.db",
+        content_format: str = KNOWLEDGE_CONTENT_FORMAT
+    ):
+        super().__init__(content_format)
+        self.knowledge_dir = knowledge_dir
+        os.makedirs(knowledge_dir, exist_ok=True)
+        self.db_path = os.path.join(knowledge_dir, db_name)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS memories (
+                    memory_id TEXT PRIMARY KEY,
+                    file_path TEXT,
+                    category TEXT,
+                    tags TEXT NOT NULL DEFAULT '[]',
+                    summary TEXT NOT NULL DEFAULT '',
+                    confidence REAL NOT NULL DEFAULT 0.5,
+                    access_count INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'active',
+                    created TEXT,
+                    updated TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_memories_status ON memories(status);
+                CREATE INDEX IF NOT EXISTS idx_memories_category ON memories(category, status);
+                CREATE INDEX IF NOT EXISTS idx_memories_updated ON memories(updated);
+                CREATE TABLE IF NOT EXISTS metadata (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS archived (
+                    memory_id TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_archived_seq ON archived(seq);
+            """)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(memories)")}
+            if "seq" not in columns:
+                # Change sequence per row, so other processes can catch up on changes
+                self._conn.execute("ALTER TABLE memories ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memories_seq ON memories(seq)")
+            now = utc_now()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO metadata (key, value) VALUES (?, ?)",
+                [("created", now), ("last_updated", now), ("next_id", "1"), ("change_seq", "0")]
+            )
+        self.change_seq = self._metadata_value("change_seq")
+        self._in_transaction = False
+
+    @contextmanager
+    def _transaction(self):
+        # Caller holds the lock. One write transaction, or part of an open batch.
+        if self._in_transaction:
+            yield
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+        try:
+            yield
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            self.change_seq = self._metadata_value("change_seq")
+            raise
+        finally:
+            self._in_transaction = False
+
+    @contextmanager
+    def _batch_commit(self):
+        with self._transaction():
+            self._catch_up()
+            yield
+
+    @staticmethod
+    def _to_memory(row: sqlite3.Row) -> Dict[str, Any]:
+        memory = dict(row)
+        memory.pop("seq", None)
+        memory["tags"] = json.loads(memory["tags"] or "[]")
+        return memory
+
+    @staticmethod
+    def _to_row(memory: Dict[str, Any], seq: int) -> tuple:
+        return (
+            memory["memory_id"],
+            memory.get("file_path"),
+            memory.get("category"),
+            json.dumps(memory.get("tags", [])),
+            memory.get("summary", ""),
+            memory.get("confidence", 0.5),
+            memory.get("access_count", 0),
+            memory.get("status", "active"),
+            memory.get("created"),
+            memory.get("updated"),
+            seq
+        )
+
+    _INSERT = (
+        f"INSERT OR REPLACE INTO memories ({', '.join(MEMORY_FIELDS)}, seq) "
+        f"VALUES ({', '.join('?' * (len(MEMORY_FIELDS) + 1))})"
+    )
+
+    def _touch(self):
+        self._conn.execute("UPDATE metadata SET value = ? WHERE key = 'last_updated'", (utc_now(),))
+
+    def _metadata_value(self, key: str) -> int:
+        (value,) = self._conn.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return int(value)
+
+    def _next_change_seq(self) -> int:
+        # Caller is inside a write transaction
+        seq = self._metadata_value("change_seq") + 1
+        self._conn.execute("UPDATE metadata SET value = ? WHERE key = 'change_seq'", (str(seq),))
+        return seq
+
+    def _metadata(self) -> Dict[str, Any]:
+        values = dict(self._conn.execute("SELECT key, value FROM metadata").fetchall())
+        (active,) = self._conn.execute("SELECT COUNT(*) FROM memories WHERE status = 'active'").fetchone()
+        return {
+            "created": values.get("created"),
+            "last_updated": values.get("last_updated"),
+            "total_memories": active,
+            "next_id": int(values.get("next_id", 1))
+        }
+
+    def _catch_up(self):
+        # Caller holds the lock; replay rows changed by other processes
+        rows = self._conn.execute(
+            "SELECT * FROM memories WHERE seq > ? ORDER BY seq", (self.change_seq,)
+        ).fetchall()
+        archived = self._conn.execute(
+            "SELECT memory_id, seq FROM archived WHERE seq > ? ORDER BY seq", (self.change_seq,)
+        ).fetchall()
+        if rows or archived:
+            self.change_seq = max(row["seq"] for row in rows + archived)
+            self.version += 1
+            self._changed(
+                [self._to_memory(row) for row in rows]
+                + [{"memory_id": row["memory_id"], "status": "archived"} for row in archived]
+            )
+
+    def sync(self):
+        with self._lock:
+            self._catch_up()
+
+    def load_index(self) -> Dict[str, Any]:
+        """The whole index as {"metadata": ..., "memories": [...]} (full scan)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM memories ORDER BY rowid").fetchall()
+            return {"metadata": self._metadata(), "memories": [self._to_memory(r) for r in rows]}
+
+    def save_index(self, data: Dict[str, Any]):
+        """Replace the whole index (used by migration)"""
+        with self._lock, self._transaction():
+            seq = self._next_change_seq()
+            self._conn.execute("DELETE FROM memories")
+            self._conn.executemany(self._INSERT, [self._to_row(m, seq) for m in data.get("memories", [])])
+            metadata = data.get("metadata", {})
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+                [
+                    ("created", metadata.get("created") or utc_now()),
+                    ("next_id", str(metadata.get("next_id", 1)))
+                ]
+            )
+            self._touch()
+            self.change_seq = seq
+            self._reset_derived()
+            self.version += 1
+
+    def get(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM memories WHERE memory_id = ?", (memory_id,)).fetchone()
+        return self._to_memory(row) if row else None
+
+    def get_many(self, memory_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        memory_ids = list(memory_ids)
+        if not memory_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM memories WHERE memory_id IN ({', '.join('?' * len(memory_ids))})",
+                memory_ids
+            ).fetchall()
+        return {row["memory_id"]: self._to_memory(row) for row in rows}
+
+    def list(self, status: Optional[str] = None, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Memories filtered by status ('all' or None for any) and category"""
+        clauses, params = [], []
+        if status and status != "all":
+            clauses.append("status = ?")
+            params.append(status)
+        if category:
+            clauses.append("category = ?")
+            params.append(category)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM memories{where} ORDER BY rowid", params).fetchall()
+        return [self._to_memory(r) for r in rows]
+
+    def put(self, memory: Dict[str, Any]):
+        """Insert or replace a memory entry"""
+        with self._lock, self._transaction():
+            self._catch_up()
+            seq = self._next_change_seq()
+            previous = self._conn.execute(
+                "SELECT category FROM memories WHERE memory_id = ?", (memory["memory_id"],)
+            ).fetchone()
+            self._conn.execute(self._INSERT, self._to_row(memory, seq))
+            self._touch()
+            self.change_seq = seq
+            self.version += 1
+            changed = [_copy_memory(memory)]
+            if previous is not None and previous["category"] != memory.get("category"):
+                # Tombstone for the old category's index shard
+                changed.insert(0, {"memory_id": memory["memory_id"], "category": previous["category"], "status": "archived"})
+            self._changed(changed)
+
+    def _remove_memories(self, memory_ids: List[str]):
+        with self._lock, self._transaction():
+            self._catch_up()
+            seq = self._next_change_seq()
+            removed = [self._to_memory(row) for row in self._conn.execute(
+                f"SELECT * FROM memories WHERE memory_id IN ({', '.join('?' * len(memory_ids))})", memory_ids
+            ).fetchall()]
+            self._conn.executemany("DELETE FROM memories WHERE memory_id = ?", [(m,) for m in memory_ids])
+            # Tombstones tell other processes' derived indexes to drop them
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archived (memory_id, seq) VALUES (?, ?)", [(m, seq) for m in memory_ids]
+            )
+            self._touch()
+            self.change_seq = seq
+            self.version += 1
+            self._changed([{**memory, "status": "archived"} for memory in removed])
+
+    def access_counts(self, category: Optional[str] = None) -> Dict[str, int]:
+        where, params = ("WHERE category = ?", (category,)) if category else ("", ())
+        with self._lock:
+            return dict(self._conn.execute(f"SELECT memory_id, access_count FROM memories {where}", params).fetchall())
+
+    def allocate_id(self) -> int:
+        """Reserve and return the next numeric memory id"""
+        with self._lock, self._transaction():
+            value = self._metadata_value("next_id")
+            self._conn.execute("UPDATE metadata SET value = ? WHERE key = 'next_id'", (str(value + 1),))
+            return value
+
+    def increment_access(self, counts: Dict[str, int]):
+        """Add access counts for several memories at once"""
+        if not counts:
+            return
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    "UPDATE memories SET access_count = access_count + ? WHERE memory_id = ?",
+                    [(count, memory_id) for memory_id, count in counts.items()]
+                )
+            self._accessed(counts)
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(
+    knowledge_dir: str = KNOWLEDGE_DIR,
+    backend: str = KNOWLEDGE_BACKEND,
+    content_format: str = KNOWLEDGE_CONTENT_FORMAT
+):
+    """Open the memory store for a knowledge directory"""
+    if backend == "sqlite":
+        return SQLiteKnowledgeStore(knowledge_dir, content_format=content_format)
+    if backend == "json":
+        return JsonKnowledgeStore(knowledge_dir, content_format=content_format)
+    raise ValueError(f"Unknown knowledge backend '{backend}'. Use: json or sqlite")
+
+
+_TENANT_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,127}$")
+
+# Tenant the memory tools act for in the current context (None: the shared store)
+current_tenant: ContextVar[Optional[str]] = ContextVar("knowledge_tenant", default=None)
+
+
+def tenant_dir(tenant_id: str, knowledge_dir: str = KNOWLEDGE_DIR) -> str:
+    """Knowledge directory of a tenant; rejects ids that are not a safe path component"""
+    if not _TENANT_ID_RE.match(tenant_id):
+        raise ValueError(f"Invalid tenant id '{tenant_id}'. Use letters, digits, '.', '_' and '-' (max 128)")
+    return os.path.join(knowledge_dir, "tenants", tenant_id)
+
+
+class TenantStores:
+    """
+    Bounded LRU of open per-tenant stores.
+
+    A tenant's store is opened on first use and moved to the front on every
+    get(). When more than `capacity` stores are open, the least recently
+    used tenants without an active tenant_scope() are closed, which flushes
+    their buffered access counts. Tenants in use are never closed; the LRU
+    may then exceed its capacity until they are released.
+    """
+
+    def __init__(
+        self,
+        knowledge_dir: str = KNOWLEDGE_DIR,
+        capacity: int = KNOWLEDGE_MAX_OPEN_TENANTS,
+        opener: Callable[[str], KnowledgeStore] = open_store
+    ):
+        self.knowledge_dir = knowledge_dir
+        self.capacity = capacity
+        self._opener = opener
+        self._stores: "OrderedDict[str, KnowledgeStore]" = OrderedDict()
+        self._pins: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._stores)
+
+    def __contains__(self, tenant_id: str) -> bool:
+        with self._lock:
+            return tenant_id in self._stores
+
+    def get(self, tenant_id: str) -> KnowledgeStore:
+        """The tenant's store, opened if needed"""
+        with self._lock:
+            store = self._stores.get(tenant_id)
+            if store is not None:
+                self._stores.move_to_end(tenant_id)
+                return store
+            store = self._stores[tenant_id] = self._opener(tenant_dir(tenant_id, self.knowledge_dir))
+            evicted = self._evict()
+        self._close(evicted)
+        return store
+
+    def pin(self, tenant_id: str):
+        """Keep the tenant's store open while a tenant_scope() is active"""
+        with self._lock:
+            self._pins[tenant_id] += 1
+
+    def unpin(self, tenant_id: str):
+        with self._lock:
+            self._pins[tenant_id] -= 1
+            if self._pins[tenant_id] <= 0:
+                del self._pins[tenant_id]
+            evicted = self._evict()
+        self._close(evicted)
+
+    def _evict(self) -> List[KnowledgeStore]:
+        # Caller holds the lock; least recently used idle tenants first
+        evicted = []
+        for tenant_id in list(self._stores):
+            if len(self._stores) <= self.capacity:
+                break
+            if not self._pins[tenant_id]:
+                evicted.append(self._stores.pop(tenant_id))
+        return evicted
+
+    @staticmethod
+    def _close(stores: List[KnowledgeStore]):
+        for store in stores:
+            try:
+                store.close()
+            except Exception:
+                logger.exception("Closing tenant store %s failed", store.knowledge_dir)
+
+    def close(self):
+        """Close every open tenant store"""
+        with self._lock:
+            stores, self._stores = list(self._stores.values()), OrderedDict()
+        self._close(stores)
+
+
+tenant_stores = TenantStores()
+
+
+@contextmanager
+def tenant_scope(tenant_id: Optional[str]):
+    """
+    Bind the memory tools to a tenant's store for the current context.
+
+    Context variables follow asyncio tasks and asyncio.to_thread(), so one
+    scope around a request covers every tool call made while handling it.
+    A falsy tenant_id binds the shared store.
+    """
+    tenant_id = tenant_id or None
+    stores = tenant_stores
+    if tenant_id is not None:
+        tenant_dir(tenant_id)
+        stores.pin(tenant_id)
+    token = current_tenant.set(tenant_id)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+        if tenant_id is not None:
+            stores.unpin(tenant_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The memory store of the current tenant, or the process-wide store"""
+    global _store
+    tenant_id = current_tenant.get()
+    if tenant_id is not None:
+        return tenant_stores.get(tenant_id)
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_store()
+    return _store
+
+
+def set_store(store):
+    """Replace the process-wide memory store (e.g. in tests or scripts)"""
+    global _store
+    with _store_lock:
+        if _store is not None and _store is not store:
+            _store.access.flush()
+        _store = store
+
+
+def migrate_json_to_sqlite(knowledge_dir: str = KNOWLEDGE_DIR) -> int:
+    """
+    Copy knowledge.json into knowledge.db in the same directory.
+
+    Returns:
+        Number of migrated memories
+    """
+    source = JsonKnowledgeStore(knowledge_dir)
+    if not os.path.exists(source.index_path) and not os.path.exists(source.journal_path):
+        raise FileNotFoundError(f"No JSON index at {source.index_path}")
+    data = source.load_index()
+    target = SQLiteKnowledgeStore(knowledge_dir)
+    try:
+        target.save_index(data)
+    finally:
+        target.close()
+    return len(data["memories"])
+
+
+def pack_content_files(knowledge_dir: str = KNOWLEDGE_DIR, remove_files: bool = False) -> int:
+    """
+    Copy memory content from .md files into the packed segment.
+
+    Args:
+        knowledge_dir: Knowledge directory
+        remove_files: Delete each .md file once its content is packed
+
+    Returns:
+        Number of memories whose content was packed
+    """
+    store = open_store(knowledge_dir, content_format="packed")
+    try:
+        pack = store.content_pack
+        contents = {}
+        for memory in store.list(status="all"):
+            file_path = memory.get("file_path")
+            if not file_path or memory["memory_id"] in pack:
+                continue
+            try:
+                with open(os.path.join(knowledge_dir, file_path), 'r') as f:
+                    contents[memory["memory_id"]] = (file_path, f.read())
+            except FileNotFoundError:
+                continue
+        store._write_contents(contents)
+        if remove_files:
+            for file_path, _ in contents.values():
+                os.remove(os.path.join(knowledge_dir, file_path))
+    finally:
+        store.close()
+    return len(contents)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Knowledge memory store utilities")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    migrate = subcommands.add_parser("migrate", help="Migrate knowledge.json to the SQLite backend")
+    migrate.add_argument("--knowledge-dir", default=KNOWLEDGE_DIR)
+    pack_content = subcommands.add_parser("pack-content", help="Copy memory .md files into the packed content segment")
+    pack_content.add_argument("--knowledge-dir", default=KNOWLEDGE_DIR)
+    pack_content.add_argument("--remove-files", action="store_true", help="Delete the .md files once packed")
+    archive_retired = subcommands.add_parser("archive-retired", help="Move retired memories to the cold archive")
+    archive_retired.add_argument("--knowledge-dir", default=KNOWLEDGE_DIR)
+    archive_retired.add_argument("--older-than-days", type=float, default=KNOWLEDGE_ARCHIVE_AFTER_DAYS)
+    compact_content = subcommands.add_parser("compact-content", help="Drop retired memory content from the packed segment")
+    compact_content.add_argument("--knowledge-dir", default=KNOWLEDGE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate_json_to_sqlite(args.knowledge_dir)
+        print(f"Migrated {count} memories to {os.path.join(args.knowledge_dir, 'knowledge.db')}")
+        print("Set KNOWLEDGE_BACKEND=sqlite to use it.")
+    elif args.command == "pack-content":
+        count = pack_content_files(args.knowledge_dir, args.remove_files)
+        print(f"Packed the content of {count} memories into {os.path.join(args.knowledge_dir, 'content.pack')}")
+        print("Set KNOWLEDGE_CONTENT_FORMAT=packed to use it.")
+    elif args.command == "archive-retired":
+        store = open_store(args.knowledge_dir)
+        try:
+            count = store.archive_retired(args.older_than_days)
+        finally:
+            store.close()
+        print(f"Archived {count} retired memories to {store.archive.path}")
+    elif args.command == "compact-content":
+        store = open_store(args.knowledge_dir, content_format="packed")
+        try:
+            reclaimed = store.compact_content()
+        finally:
+            store.close()
+        print(f"Reclaimed {reclaimed} bytes from {os.path.join(args.knowledge_dir, 'content.pack')}")
@@ -0,0 +1,138 @@
+"""
+Shared LLM Client Registry
+
+Chat model clients are expensive to build and each one owns its own HTTP
+connection pool. Building a fresh ChatOpenAI / ChatAnthropic per request
+throws away warm keep-alive connections, so every turn pays TLS and client
+setup again.
+
+This module keeps one client per (provider, model, temperature, streaming)
+for the lifetime of the process. OpenAI clients share a single pooled
+httpx.Client / httpx.AsyncClient pair whose limits are configurable:
+
+    LLM_MAX_CONNECTIONS            (default 100)
+    LLM_MAX_KEEPALIVE_CONNECTIONS  (default 20)
+    LLM_KEEPALIVE_EXPIRY           seconds (default 60)
+    LLM_TIMEOUT                    seconds (default 120)
+
+ChatAnthropic builds its own SDK HTTP client and does not accept one, so
+the connection limits and keep-alive settings above apply to OpenAI clients
+only. Anthropic clients get LLM_TIMEOUT and the SDK's default pool, which is
+still kept warm because each cached instance reuses its SDK client.
+
+Usage:
+    from llm_clients import get_llm
+
+    llm = get_llm("openai", "gpt-4", temperature=0.7)
+    response = llm.invoke(messages)
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+ClientKey = Tuple[str, str, float, bool]
+
+
+class LLMClientRegistry:
+    """Process-wide cache of chat model clients backed by pooled HTTP connections"""
+
+    def __init__(
+        self,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+        timeout: float = LLM_TIMEOUT
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout)
+        self._clients: Dict[ClientKey, Any] = {}
+        self._lock = threading.Lock()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    def start(self):
+        """Open the shared HTTP connection pools (idempotent)"""
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+            if self._http_async_client is None:
+                self._http_async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+
+    def get(self, provider: str, model: str, temperature: float = 0.7, streaming: bool = False) -> Any:
+        """Return the shared chat model for this configuration, building it on first use"""
+        key = (provider, model, float(temperature), bool(streaming))
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        self.start()
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._build(*key)
+                self._clients[key] = client
+        return client
+
+    def _build(self, provider: str, model: str, temperature: float, streaming: bool) -> Any:
+        if provider == "openai":
+            from langchain_openai import ChatOpenAI
+
+            return ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                streaming=streaming,
+                # Report token usage (incl. prompt cache hits) on streamed responses
+                stream_usage=streaming,
+                http_client=self._http_client,
+                http_async_client=self._http_async_client
+            )
+        elif provider == "anthropic":
+            from langchain_anthropic import ChatAnthropic
+
+            # ChatAnthropic keeps its SDK client (and that client's connection
+            # pool) on the instance, so reusing the instance keeps connections warm.
+            return ChatAnthropic(
+                model=model,
+                temperature=temperature,
+                streaming=streaming,
+                default_request_timeout=self.timeout.read
+            )
+        else:
+            raise ValueError(f"Unknown LLM provider '{provider}'. Use: openai or anthropic")
+
+    def close(self):
+        """Drop cached clients and close the sync connection pool"""
+        with self._lock:
+            self._clients.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+
+    async def aclose(self):
+        """Close every connection pool; call on application shutdown"""
+        async_client = self._http_async_client
+        self._http_async_client = None
+        self.close()
+        if async_client is not None:
+            await async_client.aclose()
+
+
+registry = LLMClientRegistry()
+
+
+def get_llm(provider: str, model: str, temperature: float = 0.7, streaming: bool = False) -> Any:
+    """Get the shared chat model client from the process-wide registry"""
+    return registry.get(provider, model, temperature, streaming)
@@ -0,0 +1,110 @@
+"""
+Cold Archive for Retired Memories
+
+Retiring a memory only flips its status, so retired and consolidated
+memories stayed in the live index forever and were loaded, filtered and
+rewritten with every change. The tiering job (KnowledgeStore.archive_retired,
+or `python knowledge_store.py archive-retired`) moves them out: their index
+entries and content are appended to knowledge/archive.jsonl.gz and then
+removed from the live store, so the hot index grows with active memories
+only.
+
+Each tiering run appends one gzip member of JSON lines
+
+    {"memory": {...index entry...}, "content": "..."}
+
+(a file of concatenated gzip members is still one valid gzip stream). The
+archive is only read when a search asks for retired memories
+(status="retired" or "all") or a memory id is not in the live store. It is
+then decompressed once and cached, together with an in-memory BM25 index
+over it, until the file changes.
+
+Usage:
+    from memory_archive import ColdArchive
+
+    archive = ColdArchive("knowledge")
+    archive.append([{"memory": memory, "content": content}])
+    archive.get("MEMORY-001"), archive.read_content("MEMORY-001")
+"""
+
+import gzip
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import json_codec
+from memory_search import MemorySearchIndex
+
+
+class ColdArchive:
+    """Compressed, append-only archive of retired memories and their content"""
+
+    def __init__(self, knowledge_dir: str):
+        self.path = os.path.join(knowledge_dir, "archive.jsonl.gz")
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._memories: Dict[str, Dict[str, Any]] = {}
+        self._content: Dict[str, Optional[str]] = {}
+        self._search_index: Optional[MemorySearchIndex] = None
+        self._lock = threading.Lock()
+
+    def append(self, records: List[Dict[str, Any]]):
+        """Append {"memory": ..., "content": ...} records as one durable gzip member"""
+        if not records:
+            return
+        payload = b"".join(json_codec.dumps(record) + b"\n" for record in records)
+        with open(self.path, 'ab') as f:
+            f.write(gzip.compress(payload))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load(self):
+        # Caller holds the lock; decompress the archive when it changed
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._signature, self._memories, self._content, self._search_index = None, {}, {}, None
+            return
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature == self._signature:
+            return
+        memories, content = {}, {}
+        with gzip.open(self.path, 'rb') as f:
+            for line in f:
+                record = json_codec.loads(line)
+                memory_id = record["memory"]["memory_id"]
+                # A memory archived twice (crash between archive and removal): latest wins
+                memories[memory_id] = record["memory"]
+                content[memory_id] = record.get("content")
+        self._signature, self._memories, self._content, self._search_index = signature, memories, content, None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._memories)
+
+    def get(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._load()
+            memory = self._memories.get(memory_id)
+            return dict(memory) if memory else None
+
+    def get_many(self, memory_ids) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._load()
+            return {m: dict(self._memories[m]) for m in memory_ids if m in self._memories}
+
+    def read_content(self, memory_id: str) -> Optional[str]:
+        with self._lock:
+            self._load()
+            return self._content.get(memory_id)
+
+    @property
+    def search_index(self) -> MemorySearchIndex:
+        """BM25 index over the archived memories (in memory, built on first use)"""
+        with self._lock:
+            self._load()
+            if self._search_index is None:
+                index = MemorySearchIndex()
+                index.rebuild(self._memories.values(), persist=False)
+                self._search_index = index
+            return self._search_index
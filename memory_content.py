@@ -0,0 +1,273 @@
+"""
+Packed, Memory-Mapped Memory Content
+
+Each memory's content used to be its own knowledge/memory-NNN.md file, so a
+read was an exists check, an open and a read, and a large knowledge base
+meant tens of thousands of tiny files. PackedContentStore keeps all content
+in one append-only segment, knowledge/content.pack, made of records
+
+    [u32 memory_id length][u32 content length][memory_id][content (UTF-8)]
+
+The latest record of a memory wins. An offset table (memory_id -> offset,
+length of the content) is built by scanning the record headers and
+checkpointed to knowledge/content.idx, so opening a large pack only scans
+the records appended after the checkpoint. The pack is memory-mapped and a
+read decodes one slice of the mapped buffer; no file is opened per read.
+
+Writers append under an exclusive flock on knowledge/content.lock, in one
+write per call (a batch of memories is one append), and truncate a torn
+record left by a crashed writer. Readers need no lock: a torn tail is
+simply not indexed until it is complete, and records written by other
+processes are picked up when a memory_id is not in the table or at most
+every KNOWLEDGE_INDEX_RECHECK_INTERVAL seconds.
+
+compact() rewrites the pack with only the latest record of each memory,
+leaving out the memories it is told to drop (the store drops retired
+memories), into a temp file renamed over content.pack.
+
+Usage:
+    from memory_content import PackedContentStore
+
+    content = PackedContentStore("knowledge")
+    content.write_many([("MEMORY-001", "User prefers dark mode charts")])
+    content.read("MEMORY-001")
+    content.compact(drop={"MEMORY-002"})
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import json_codec
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no inter-process locking; run a single worker there
+    fcntl = None
+
+
+INDEX_FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<II")
+
+
+class PackedContentStore:
+    """Memory content in one append-only, memory-mapped segment file"""
+
+    def __init__(self, knowledge_dir: str, recheck_interval: float = 2.0):
+        self.knowledge_dir = knowledge_dir
+        self.pack_path = os.path.join(knowledge_dir, "content.pack")
+        self.index_path = os.path.join(knowledge_dir, "content.idx")
+        self.lock_path = os.path.join(knowledge_dir, "content.lock")
+        self.recheck_interval = recheck_interval
+        # memory_id -> (offset, length) of its latest content in the pack
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        # Pack file identity and the number of bytes scanned into _offsets
+        self._ino: Optional[int] = None
+        self._size = 0
+        self._map: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self._checked_at = 0.0
+        self._checkpointed_size = 0
+        self._lock = threading.RLock()
+        self._lock_file = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._offsets)
+
+    def __contains__(self, memory_id: str) -> bool:
+        with self._lock:
+            if memory_id not in self._offsets:
+                self._refresh()
+            return memory_id in self._offsets
+
+    @contextmanager
+    def _file_lock(self):
+        # Caller holds self._lock; serializes writers across processes
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            os.makedirs(self.knowledge_dir, exist_ok=True)
+            self._lock_file = open(self.lock_path, 'a+b')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _unmap(self):
+        # Caller holds the lock
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _reset(self):
+        # Caller holds the lock
+        self._unmap()
+        self._offsets = {}
+        self._ino = None
+        self._size = 0
+        self._checkpointed_size = 0
+
+    def _load_checkpoint(self, ino: int, size: int):
+        # Caller holds the lock; start from content.idx if it describes this pack
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = json_codec.loads(f.read())
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_FORMAT_VERSION or data.get("ino") != ino or data.get("size", 0) > size:
+            return
+        self._offsets = {memory_id: tuple(entry) for memory_id, entry in data["offsets"].items()}
+        self._size = self._checkpointed_size = data["size"]
+
+    def _refresh(self, force: bool = False) -> int:
+        """
+        Index records appended since the last scan (caller holds the lock).
+
+        Returns:
+            Size of the pack file; larger than the scanned size when the
+            last record is still being written or was torn
+        """
+        now = time.monotonic()
+        if not force and self._map is not None and now - self._checked_at < self.recheck_interval:
+            return self._size
+        self._checked_at = now
+        try:
+            st = os.stat(self.pack_path)
+        except FileNotFoundError:
+            self._reset()
+            return 0
+        if st.st_ino != self._ino or st.st_size < self._size:
+            # New or compacted pack
+            self._reset()
+            self._ino = st.st_ino
+            self._load_checkpoint(st.st_ino, st.st_size)
+        if st.st_size == 0:
+            return 0
+        if self._map is None or len(self._map) != st.st_size:
+            self._unmap()
+            with open(self.pack_path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+        # Never read mapped pages past the end of file seen by stat
+        end = min(len(self._map), st.st_size)
+        offset = self._size
+        while offset + _HEADER.size <= end:
+            key_length, content_length = _HEADER.unpack_from(self._map, offset)
+            start = offset + _HEADER.size + key_length
+            if start + content_length > end:
+                break
+            memory_id = str(self._view[offset + _HEADER.size:start], "utf-8")
+            self._offsets[memory_id] = (start, content_length)
+            offset = start + content_length
+        self._size = offset
+        return end
+
+    def read(self, memory_id: str) -> Optional[str]:
+        """Latest content written for memory_id, or None"""
+        with self._lock:
+            # A refresh may remap or reset the pack (another process compacted
+            # it), so offsets are only looked up after it
+            self._refresh(force=memory_id not in self._offsets or self._map is None)
+            entry = self._offsets.get(memory_id)
+            if entry is None or self._view is None:
+                return None
+            offset, length = entry
+            return str(self._view[offset:offset + length], "utf-8")
+
+    def write_many(self, items: Iterable[Tuple[str, str]]):
+        """Append the content of several memories in one write"""
+        records = []
+        for memory_id, content in items:
+            key, data = memory_id.encode("utf-8"), content.encode("utf-8")
+            records.append((memory_id, key, data))
+        if not records:
+            return
+        with self._lock, self._file_lock():
+            os.makedirs(self.knowledge_dir, exist_ok=True)
+            if self._refresh(force=True) > self._size:
+                # Torn record from a writer that crashed mid-append
+                self._unmap()
+                os.truncate(self.pack_path, self._size)
+            payload = bytearray()
+            for memory_id, key, data in records:
+                payload += _HEADER.pack(len(key), len(data))
+                payload += key
+                payload += data
+            with open(self.pack_path, 'ab') as f:
+                f.write(payload)
+            self._refresh(force=True)
+
+    def write(self, memory_id: str, content: str):
+        self.write_many([(memory_id, content)])
+
+    def compact(self, drop: Iterable[str] = ()) -> int:
+        """
+        Rewrite the pack with the latest content of each memory, leaving out
+        the memory ids in drop.
+
+        Returns:
+            Bytes reclaimed
+        """
+        dropped: Set[str] = set(drop)
+        with self._lock, self._file_lock():
+            self._refresh(force=True)
+            if self._map is None:
+                return 0
+            before = len(self._map)
+            tmp_path = f"{self.pack_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                for memory_id, (offset, length) in sorted(self._offsets.items(), key=lambda item: item[1][0]):
+                    if memory_id in dropped:
+                        continue
+                    key = memory_id.encode("utf-8")
+                    f.write(_HEADER.pack(len(key), length))
+                    f.write(key)
+                    f.write(self._view[offset:offset + length])
+                f.flush()
+                os.fsync(f.fileno())
+            self._reset()
+            os.replace(tmp_path, self.pack_path)
+            self._refresh(force=True)
+            self._save_checkpoint()
+            return before - self._size
+
+    def _save_checkpoint(self):
+        # Caller holds the lock; the offset table as of the scanned size
+        if self._ino is None or self._size == self._checkpointed_size:
+            return
+        data = {
+            "version": INDEX_FORMAT_VERSION,
+            "ino": self._ino,
+            "size": self._size,
+            "offsets": self._offsets
+        }
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json_codec.dumps(data))
+        os.replace(tmp_path, self.index_path)
+        self._checkpointed_size = self._size
+
+    def close(self):
+        """Checkpoint the offset table and unmap the pack"""
+        with self._lock:
+            try:
+                self._refresh(force=True)
+                self._save_checkpoint()
+            finally:
+                self._unmap()
+                if self._lock_file is not None:
+                    self._lock_file.close()
+                    self._lock_file = None
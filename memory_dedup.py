@@ -0,0 +1,284 @@
+"""
+MinHash / LSH Near-Duplicate Index for Memories
+
+_create_memory used to compare the first 20 words of new content with the
+summary of every active memory, which is O(n) per create and ignores the
+memories' actual content. This index keeps a MinHash signature of each
+active memory's content (word shingles) and buckets the signatures with
+locality-sensitive hashing: a new text is only compared with memories that
+share at least one band bucket, and candidates are confirmed by their
+estimated Jaccard similarity.
+
+With MEMORY_DEDUP_BANDS bands of (permutations / bands) rows, a pair with
+Jaccard similarity s becomes a candidate with probability
+1 - (1 - s^rows)^bands; the defaults (128 permutations, 32 bands of 4 rows)
+catch pairs at s >= 0.6 with probability > 0.99 while pairs at s = 0.2 are
+rarely compared.
+
+The index is persisted as knowledge/dedup_index.json (ids, settings and the
+store change sequence) plus knowledge/dedup_index.bin (uint32 signatures),
+kept current by the store on every create/update/retire, and rebuilt from
+the memory files when missing or behind the store. A change appends only
+the changed signatures to knowledge/dedup_index.log; the snapshot is
+rewritten once that log outgrows it (see delta_log.py).
+
+Configuration (environment variables):
+    MEMORY_DEDUP_THRESHOLD     Jaccard similarity that counts as duplicate (default 0.6)
+    MEMORY_DEDUP_PERMUTATIONS  MinHash signature length (default 128)
+    MEMORY_DEDUP_BANDS         LSH bands; must divide the permutations (default 32)
+    MEMORY_DEDUP_SHINGLE_SIZE  words per shingle (default 2)
+
+Usage:
+    from memory_dedup import MinHashIndex
+
+    index = MinHashIndex.open("knowledge/dedup_index.json", load_memories, load_content)
+    duplicates = index.query(content)  # [(memory_id, similarity), ...]
+"""
+
+import hashlib
+import os
+import random
+import re
+import threading
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import json_codec
+from delta_log import DeltaLog
+
+
+MEMORY_DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.6"))
+MEMORY_DEDUP_PERMUTATIONS = int(os.getenv("MEMORY_DEDUP_PERMUTATIONS", "128"))
+MEMORY_DEDUP_BANDS = int(os.getenv("MEMORY_DEDUP_BANDS", "32"))
+MEMORY_DEDUP_SHINGLE_SIZE = int(os.getenv("MEMORY_DEDUP_SHINGLE_SIZE", "2"))
+
+INDEX_FORMAT_VERSION = 1
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def shingles(text: str, size: int = MEMORY_DEDUP_SHINGLE_SIZE) -> Set[str]:
+    """Word n-grams of the text (the whole text when it has fewer than size words)"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash(shingle: str) -> int:
+    # Stable across processes (unlike hash())
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class MinHashIndex:
+    """LSH-bucketed MinHash signatures of active memory content"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        load_content: Optional[Callable[[Dict[str, Any]], str]] = None,
+        threshold: float = MEMORY_DEDUP_THRESHOLD,
+        num_perm: int = MEMORY_DEDUP_PERMUTATIONS,
+        bands: int = MEMORY_DEDUP_BANDS,
+        shingle_size: int = MEMORY_DEDUP_SHINGLE_SIZE
+    ):
+        if num_perm % bands:
+            raise ValueError("MEMORY_DEDUP_BANDS must divide MEMORY_DEDUP_PERMUTATIONS")
+        self.path = path
+        self.load_content = load_content or (lambda memory: memory.get("summary", ""))
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(1)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._signatures: Dict[str, array] = {}
+        self._buckets: Dict[Tuple[int, int], Set[str]] = {}
+        # Store change sequence this index reflects
+        self.seq = 0
+        self._log = DeltaLog(path, self._signatures_path) if path else None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        load_memories: Callable[[], Iterable[Dict[str, Any]]],
+        load_content: Callable[[Dict[str, Any]], str],
+        seq: int = 0,
+        **kwargs
+    ) -> "MinHashIndex":
+        """Load the persisted index if it reflects change sequence seq, else rebuild it"""
+        index = cls(path, load_content, **kwargs)
+        if not index.load() or index.seq != seq:
+            index.rebuild(load_memories(), persist=False)
+            index.seq = seq
+            index.save()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, text: str) -> array:
+        """MinHash signature (num_perm uint32 values) of the text's shingles"""
+        hashes = [_hash(s) for s in shingles(text, self.shingle_size)]
+        if not hashes:
+            return array("I", [_MAX_HASH] * self.num_perm)
+        return array("I", [
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+            for a, b in self._permutations
+        ])
+
+    def _band_keys(self, signature: array) -> List[Tuple[int, int]]:
+        return [
+            (band, hash(tuple(signature[band * self.rows:(band + 1) * self.rows])))
+            for band in range(self.bands)
+        ]
+
+    def _remove(self, memory_id: str):
+        # Caller holds the lock
+        signature = self._signatures.pop(memory_id, None)
+        if signature is None:
+            return
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(memory_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _insert(self, memory_id: str, signature: array):
+        # Caller holds the lock
+        self._remove(memory_id)
+        self._signatures[memory_id] = signature
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(memory_id)
+
+    def _index(self, memory: Dict[str, Any]):
+        # Caller holds the lock; only active memories are duplicate candidates
+        if memory.get("status", "active") == "active":
+            self._insert(memory["memory_id"], self.signature(self.load_content(memory)))
+        else:
+            self._remove(memory["memory_id"])
+
+    def apply(self, memories: List[Dict[str, Any]], seq: int):
+        """Re-index memories changed in the store, up to change sequence seq"""
+        with self._lock:
+            for memory in memories:
+                self._index(memory)
+            base, self.seq = self.seq, seq
+            if self._log is None:
+                return
+            # Signatures as hex; null for memories that are no longer candidates
+            changes = {}
+            for memory in memories:
+                signature = self._signatures.get(memory["memory_id"])
+                changes[memory["memory_id"]] = None if signature is None else signature.tobytes().hex()
+            if self._log.append(base, seq, changes):
+                self.save()
+
+    def rebuild(self, memories: Iterable[Dict[str, Any]], persist: bool = True):
+        with self._lock:
+            self._signatures, self._buckets = {}, {}
+            for memory in memories:
+                self._index(memory)
+            if persist:
+                self.save()
+
+    def query(
+        self,
+        text: str,
+        threshold: Optional[float] = None,
+        exclude: Iterable[str] = ()
+    ) -> List[Tuple[str, float]]:
+        """
+        Active memories whose content is a near duplicate of text.
+
+        Args:
+            text: Candidate memory content
+            threshold: Minimum estimated Jaccard similarity (default: the index threshold)
+            exclude: Memory ids to ignore (e.g. memories being consolidated)
+
+        Returns:
+            [(memory_id, similarity), ...] with the most similar first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = self.signature(text)
+        excluded = set(exclude)
+        with self._lock:
+            candidates: Set[str] = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            matches = []
+            for memory_id in candidates - excluded:
+                other = self._signatures[memory_id]
+                similarity = sum(1 for x, y in zip(signature, other) if x == y) / self.num_perm
+                if similarity >= threshold:
+                    matches.append((memory_id, similarity))
+        matches.sort(key=lambda item: item[1], reverse=True)
+        return matches
+
+    def _settings(self) -> Dict[str, int]:
+        return {"num_perm": self.num_perm, "bands": self.bands, "shingle_size": self.shingle_size}
+
+    def load(self) -> bool:
+        """Load the persisted snapshot and replay its delta log; False when there is nothing usable to load"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                meta = json_codec.loads(f.read())
+            signatures = array("I")
+            with open(self._signatures_path, 'rb') as f:
+                signatures.frombytes(f.read())
+        except (OSError, ValueError):
+            return False
+        ids = meta.get("ids", [])
+        if (
+            meta.get("version") != INDEX_FORMAT_VERSION
+            or meta.get("settings") != self._settings()
+            or len(signatures) != len(ids) * self.num_perm
+        ):
+            return False
+        with self._lock:
+            self._signatures, self._buckets = {}, {}
+            for i, memory_id in enumerate(ids):
+                self._insert(memory_id, signatures[i * self.num_perm:(i + 1) * self.num_perm])
+            self.seq = meta.get("seq", 0)
+            for seq, changes in self._log.replay(self.seq):
+                for memory_id, signature in changes.items():
+                    if signature is None:
+                        self._remove(memory_id)
+                    else:
+                        self._insert(memory_id, array("I", bytes.fromhex(signature)))
+                self.seq = seq
+        return True
+
+    @property
+    def _signatures_path(self) -> str:
+        return os.path.splitext(self.path)[0] + ".bin"
+
+    def save(self):
+        """Persist signatures, then the id list that makes them valid (both atomically); drop the delta log"""
+        if not self.path:
+            return
+        with self._lock:
+            ids = list(self._signatures)
+            signatures = array("I")
+            for memory_id in ids:
+                signatures.extend(self._signatures[memory_id])
+            meta = {"version": INDEX_FORMAT_VERSION, "seq": self.seq, "settings": self._settings(), "ids": ids}
+            suffix = f".{os.getpid()}.tmp"
+            with open(self._signatures_path + suffix, 'wb') as f:
+                signatures.tofile(f)
+            with open(self.path + suffix, 'wb') as f:
+                f.write(json_codec.dumps(meta))
+            os.replace(self._signatures_path + suffix, self._signatures_path)
+            os.replace(self.path + suffix, self.path)
+            self._log.clear()
@@ -0,0 +1,800 @@
+"""
+Inverted Index with BM25 Ranking for Memory Search
+
+search_memory_index used to scan every memory and score it with substring
+counts, so cost grew with the whole knowledge base and "art" matched
+"chart". This index tokenizes each memory's category, tags and summary into
+whole words and keeps postings (term -> {row: term frequency}), so a query
+only touches the memories that contain one of its terms, ranked with Okapi
+BM25.
+
+Ranking is vectorized with NumPy. Every memory has a row in compact column
+arrays (document length, status, category, confidence, updated time as
+epoch seconds, access count), postings are cached as (rows, tfs) arrays per
+term, and rank() computes
+
+    relevance * confidence + 0.1 * access_count + 0.5 * recency
+
+for all candidates in one pass, then takes the top results with
+argpartition instead of sorting every candidate.
+
+The index is persisted as a JSON snapshot (written atomically) and kept
+current incrementally: the store passes every created, updated or retired
+memory to apply() and access count flushes to apply_access(). apply()
+appends only the changed memories' entries to a delta log next to the
+snapshot and rewrites the snapshot once the log outgrows it (see
+delta_log.py). The snapshot and log record the store change sequence they
+reflect; if they are missing, unreadable or behind the store the index is
+rebuilt from the store on first use. Access counts change on every read,
+so they are not persisted: open() loads them from the store.
+
+ShardedSearchIndex partitions the index by category: one such index per
+category under knowledge/search_index/ plus a small manifest.json, with
+shards loaded on first use. A category-filtered search or a write touches a
+single shard; an unfiltered search scores every shard with corpus-wide BM25
+statistics, so its ranking matches an unsharded index.
+
+Configuration (environment variables):
+    MEMORY_BM25_K1  term frequency saturation (default 1.5)
+    MEMORY_BM25_B   length normalization (default 0.75)
+
+Usage:
+    from memory_search import MemorySearchIndex
+
+    index = MemorySearchIndex.open("knowledge/search_index.json", store.list, store.change_seq, store.access_counts)
+    rows, scores = index.bm25("chart preferences", status="active")
+    top = index.rank(rows, scores, limit=5)  # [(memory_id, score), ...]
+
+    sharded = ShardedSearchIndex.open("knowledge/search_index", lambda category: store.list(category=category), store.change_seq)
+    rows, scores = sharded.bm25("chart preferences", category="user_profile")  # loads one shard
+"""
+
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import json_codec
+from delta_log import DeltaLog
+
+
+MEMORY_BM25_K1 = float(os.getenv("MEMORY_BM25_K1", "1.5"))
+MEMORY_BM25_B = float(os.getenv("MEMORY_BM25_B", "0.75"))
+
+INDEX_FORMAT_VERSION = 2
+
+ACCESS_WEIGHT = 0.1
+RECENCY_WEIGHT = 0.5
+RECENCY_DAYS = 365
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Status codes in the status column; -1 marks a removed row
+_STATUS_CODES = {"active": 0, "retired": 1}
+_REMOVED = -1
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; punctuation and underscores separate words"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def memory_terms(memory: Dict[str, Any]) -> List[str]:
+    """Tokens of the searchable fields of a memory: category, tags and summary"""
+    return tokenize(" ".join([
+        memory.get("category") or "",
+        " ".join(memory.get("tags") or []),
+        memory.get("summary") or ""
+    ]))
+
+
+def top_k(scores: np.ndarray, limit: int) -> np.ndarray:
+    """Positions of the limit highest scores, best first (only those are sorted)"""
+    if len(scores) > limit:
+        top = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def epoch_seconds(timestamp: Optional[str]) -> float:
+    """ISO-8601 timestamp (naive means UTC) as epoch seconds; NaN when missing or invalid"""
+    if not timestamp:
+        return math.nan
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        return math.nan
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class MemorySearchIndex:
+    """Persistent inverted index over memory metadata with vectorized BM25 ranking"""
+
+    def __init__(self, path: Optional[str] = None, k1: float = MEMORY_BM25_K1, b: float = MEMORY_BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._terms: List[List[str]] = []
+        self._category_codes: Dict[Optional[str], int] = {}
+        self._category_names: List[Optional[str]] = []
+        # Column arrays, one entry per row (capacity grows by doubling)
+        self._length = np.zeros(0, dtype=np.float32)
+        self._status = np.zeros(0, dtype=np.int8)
+        self._category = np.zeros(0, dtype=np.int32)
+        self._confidence = np.zeros(0, dtype=np.float32)
+        self._updated = np.zeros(0, dtype=np.float64)
+        self._access = np.zeros(0, dtype=np.float64)
+        # term -> {row: term frequency}, plus cached (rows, tfs) arrays per term
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._posting_arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._total_length = 0
+        self._doc_count = 0
+        # Store change sequence this index reflects
+        self.seq = 0
+        self._log = DeltaLog(path) if path else None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        load_memories: Callable[[], Iterable[Dict[str, Any]]],
+        seq: int = 0,
+        load_access: Optional[Callable[[], Dict[str, int]]] = None,
+        **kwargs
+    ) -> "MemorySearchIndex":
+        """
+        Load the persisted index if it reflects store change sequence seq;
+        otherwise build it from load_memories() and persist it. Access
+        counts of a loaded index come from load_access().
+        """
+        index = cls(path, **kwargs)
+        if not index.load() or index.seq != seq:
+            index.rebuild(load_memories(), persist=False)
+            index.seq = seq
+            index.save()
+        elif load_access is not None:
+            index.set_access(load_access())
+        return index
+
+    def __len__(self) -> int:
+        return self._doc_count
+
+    def __contains__(self, memory_id: str) -> bool:
+        row = self._rows.get(memory_id)
+        return row is not None and self._status[row] != _REMOVED
+
+    def _ensure_capacity(self, rows: int):
+        # Caller holds the lock
+        capacity = len(self._status)
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 64)
+        for name in ("_length", "_status", "_category", "_confidence", "_updated", "_access"):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            if name == "_status":
+                grown[len(column):] = _REMOVED
+            setattr(self, name, grown)
+
+    def _category_code(self, category: Optional[str]) -> int:
+        code = self._category_codes.get(category)
+        if code is None:
+            code = self._category_codes[category] = len(self._category_names)
+            self._category_names.append(category)
+        return code
+
+    def _remove(self, memory_id: str):
+        # Caller holds the lock
+        row = self._rows.get(memory_id)
+        if row is None or self._status[row] == _REMOVED:
+            return
+        self._total_length -= int(self._length[row])
+        self._doc_count -= 1
+        self._status[row] = _REMOVED
+        for term in self._terms[row]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(row, None)
+                self._posting_arrays.pop(term, None)
+                if not postings:
+                    del self._postings[term]
+        self._terms[row] = []
+
+    def _add(self, memory: Dict[str, Any]):
+        # Caller holds the lock
+        memory_id = memory["memory_id"]
+        self._remove(memory_id)
+        if memory.get("status") == "archived":
+            # Moved to the cold archive
+            return
+        row = self._rows.get(memory_id)
+        if row is None:
+            row = self._rows[memory_id] = len(self._ids)
+            self._ids.append(memory_id)
+            self._terms.append([])
+            self._ensure_capacity(len(self._ids))
+        terms = memory_terms(memory)
+        frequencies: Dict[str, int] = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, tf in frequencies.items():
+            self._postings.setdefault(term, {})[row] = tf
+            self._posting_arrays.pop(term, None)
+        self._terms[row] = list(frequencies)
+        self._length[row] = len(terms)
+        self._status[row] = _STATUS_CODES.get(memory.get("status", "active"), len(_STATUS_CODES))
+        self._category[row] = self._category_code(memory.get("category"))
+        self._confidence[row] = memory.get("confidence", 0.5)
+        self._updated[row] = epoch_seconds(memory.get("updated") or memory.get("created"))
+        self._access[row] = memory.get("access_count", 0)
+        self._total_length += len(terms)
+        self._doc_count += 1
+
+    def upsert(self, memory: Dict[str, Any], persist: bool = True):
+        """Index a new memory or re-index a changed one (summary, tags, status, ...)"""
+        with self._lock:
+            self._add(memory)
+            if persist:
+                self.save()
+
+    def apply(self, memories: List[Dict[str, Any]], seq: int):
+        """Re-index memories changed in the store, up to change sequence seq"""
+        with self._lock:
+            for memory in memories:
+                self._add(memory)
+            self.commit([memory["memory_id"] for memory in memories], seq)
+
+    def commit(self, memory_ids: Iterable[str], seq: int):
+        """
+        Advance to change sequence seq and persist the entries of the given
+        (already re-indexed) memories: appended to the delta log, with the
+        snapshot rewritten only when the log has outgrown it.
+        """
+        with self._lock:
+            base, self.seq = self.seq, seq
+            if self._log is not None:
+                changes = {memory_id: self._doc(memory_id) for memory_id in memory_ids}
+                if self._log.append(base, seq, changes):
+                    self.save()
+
+    def apply_access(self, counts: Dict[str, int]):
+        """Add flushed access counts to the access column"""
+        with self._lock:
+            for memory_id, count in counts.items():
+                row = self._rows.get(memory_id)
+                if row is not None:
+                    self._access[row] += count
+
+    def set_access(self, counts: Dict[str, int]):
+        """Replace the access column with the store's access counts"""
+        with self._lock:
+            self._access[:] = 0
+            self.apply_access(counts)
+
+    def remove(self, memory_id: str, persist: bool = True):
+        with self._lock:
+            self._remove(memory_id)
+            if persist:
+                self.save()
+
+    def rebuild(self, memories: Iterable[Dict[str, Any]], persist: bool = True):
+        """Replace the index contents with the given memories"""
+        with self._lock:
+            self.__init__(self.path, self.k1, self.b)
+            for memory in memories:
+                self._add(memory)
+            if persist:
+                self.save()
+
+    def _posting_array(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # Caller holds the lock
+        arrays = self._posting_arrays.get(term)
+        if arrays is None:
+            postings = self._postings.get(term)
+            if not postings:
+                return None
+            arrays = self._posting_arrays[term] = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            )
+        return arrays
+
+    def _filter(self, rows: np.ndarray, status: Optional[str], category: Optional[str]) -> np.ndarray:
+        # Caller holds the lock; boolean mask over rows
+        mask = self._status[rows] != _REMOVED
+        if status and status != "all":
+            mask &= self._status[rows] == _STATUS_CODES.get(status, len(_STATUS_CODES))
+        if category:
+            code = self._category_codes.get(category)
+            if code is None:
+                return np.zeros(len(rows), dtype=bool)
+            mask &= self._category[rows] == code
+        return mask
+
+    def document_frequency(self, term: str) -> int:
+        with self._lock:
+            return len(self._postings.get(term, ()))
+
+    def bm25(
+        self,
+        query: str,
+        status: Optional[str] = "active",
+        category: Optional[str] = None,
+        stats: Optional[Tuple[int, float, Dict[str, int]]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of the rows containing at least one query term.
+
+        Args:
+            query: Free text; tokenized like the indexed fields
+            status: 'active', 'retired', or 'all'/None for any
+            category: Optional exact category filter
+            stats: (document count, average length, {term: document frequency})
+                of a larger corpus this index is part of (default: this index)
+
+        Returns:
+            (rows, scores) arrays, unordered
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if stats is None:
+                n = self._doc_count
+                avgdl = self._total_length / n if n else 0.0
+                df = {term: self.document_frequency(term) for term in terms}
+            else:
+                n, avgdl, df = stats
+            if not n or not terms or not self._doc_count:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            avgdl = avgdl or 1.0
+            all_rows, all_scores = [], []
+            for term in terms:
+                arrays = self._posting_array(term)
+                if arrays is None:
+                    continue
+                rows, tfs = arrays
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self._length[rows] / avgdl)
+                all_rows.append(rows)
+                all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+            if not all_rows:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            rows = np.concatenate(all_rows)
+            scores = np.concatenate(all_scores)
+            # Sum the per-term scores of each row
+            rows, inverse = np.unique(rows, return_inverse=True)
+            scores = np.bincount(inverse, weights=scores, minlength=len(rows)).astype(np.float32)
+            mask = self._filter(rows, status, category)
+            return rows[mask], scores[mask]
+
+    def search(
+        self,
+        query: str,
+        status: Optional[str] = "active",
+        category: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25-ranked memories containing at least one query term (no boosts).
+
+        Returns:
+            [(memory_id, score), ...] with the best match first
+        """
+        rows, scores = self.bm25(query, status, category)
+        order = np.argsort(-scores, kind="stable") if limit is None else top_k(scores, limit)
+        return [(self.memory_id(rows[i]), float(scores[i])) for i in order]
+
+    def rows_for(self, hits: Iterable[Tuple[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) arrays for (memory_id, score) pairs from another ranker; unknown ids are skipped"""
+        with self._lock:
+            known = [(self._rows[m], score) for m, score in hits if m in self]
+        return (
+            np.array([row for row, _ in known], dtype=np.int64),
+            np.array([score for _, score in known], dtype=np.float32)
+        )
+
+    def boosted(
+        self,
+        rows: np.ndarray,
+        relevance: np.ndarray,
+        pending_access: Optional[Dict[str, int]] = None,
+        now: Optional[float] = None
+    ) -> np.ndarray:
+        """relevance * confidence + access and recency boosts, per row"""
+        now = time.time() if now is None else now
+        with self._lock:
+            access = self._access[rows]
+            if pending_access:
+                pending = {self._rows[m]: c for m, c in pending_access.items() if m in self._rows}
+                if pending:
+                    access = access + np.fromiter((pending.get(r, 0) for r in rows.tolist()), dtype=np.float64, count=len(rows))
+            days = np.floor((now - self._updated[rows]) / 86400.0)
+            recency = np.nan_to_num(np.maximum(0.0, 1.0 - days / RECENCY_DAYS), nan=0.0)
+            return relevance * self._confidence[rows] + ACCESS_WEIGHT * access + RECENCY_WEIGHT * recency
+
+    def rank(
+        self,
+        rows: np.ndarray,
+        relevance: np.ndarray,
+        limit: int,
+        pending_access: Optional[Dict[str, int]] = None,
+        now: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Final ranking: relevance * confidence + access and recency boosts.
+
+        Args:
+            rows: Candidate rows (from bm25() or rows_for()), without repeats
+            relevance: Relevance score per candidate row
+            limit: Number of results
+            pending_access: Buffered access counts not yet in the access column
+            now: Epoch seconds for recency (default: current time)
+
+        Returns:
+            [(memory_id, score), ...] best first, at most limit entries
+        """
+        if not len(rows) or limit <= 0:
+            return []
+        scores = self.boosted(rows, relevance, pending_access, now)
+        return [(self.memory_id(rows[i]), float(scores[i])) for i in top_k(scores, limit)]
+
+    def memory_id(self, row: int) -> str:
+        return self._ids[row]
+
+    def load(self) -> bool:
+        """Load the persisted snapshot and replay its delta log; False when there is nothing usable to load"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                data = json_codec.loads(f.read())
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            return False
+        with self._lock:
+            self.rebuild([], persist=False)
+            for memory_id, doc in data["docs"].items():
+                self._load_doc(memory_id, doc)
+            self.seq = data.get("seq", 0)
+            for seq, changes in self._log.replay(self.seq):
+                for memory_id, doc in changes.items():
+                    if doc is None:
+                        self._remove(memory_id)
+                    else:
+                        self._load_doc(memory_id, doc)
+                self.seq = seq
+        return True
+
+    def _load_doc(self, memory_id: str, doc: List[Any]):
+        # Caller holds the lock; doc is a persisted entry (see _doc)
+        length, status, category, terms, tfs, confidence, updated = doc
+        self._remove(memory_id)
+        row = self._rows.get(memory_id)
+        if row is None:
+            row = self._rows[memory_id] = len(self._ids)
+            self._ids.append(memory_id)
+            self._terms.append([])
+            self._ensure_capacity(len(self._ids))
+        self._terms[row] = terms
+        for term, tf in zip(terms, tfs):
+            self._postings.setdefault(term, {})[row] = tf
+            self._posting_arrays.pop(term, None)
+        self._length[row] = length
+        self._status[row] = status
+        self._category[row] = self._category_code(category)
+        self._confidence[row] = confidence
+        self._updated[row] = math.nan if updated is None else updated
+        self._total_length += length
+        self._doc_count += 1
+
+    def _doc(self, memory_id: str) -> Optional[List[Any]]:
+        # Caller holds the lock; persisted entry of a memory, None when it is not indexed
+        row = self._rows.get(memory_id)
+        if row is None or self._status[row] == _REMOVED:
+            return None
+        terms = self._terms[row]
+        updated = float(self._updated[row])
+        return [
+            int(self._length[row]),
+            int(self._status[row]),
+            self._category_names[int(self._category[row])],
+            terms,
+            [self._postings[term][row] for term in terms],
+            float(self._confidence[row]),
+            None if math.isnan(updated) else updated
+        ]
+
+    def save(self):
+        """Persist a snapshot atomically (write a temp file, then rename over) and drop the delta log"""
+        if not self.path:
+            return
+        with self._lock:
+            docs = {memory_id: self._doc(memory_id) for memory_id in self._ids}
+            docs = {memory_id: doc for memory_id, doc in docs.items() if doc is not None}
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(json_codec.dumps({"version": INDEX_FORMAT_VERSION, "seq": self.seq, "docs": docs}))
+            os.replace(tmp_path, self.path)
+            self._log.clear()
+
+
+class ShardedSearchIndex:
+    """
+    Search index partitioned into one MemorySearchIndex shard per category.
+
+    A small manifest (manifest.json: category -> shard file, document count
+    and the change sequence the shard was last written at) sits next to
+    the shard files. Shards are loaded on first use, so a category-filtered
+    search or a write loads, scores and logs to only its own shard;
+    searches without a category load all shards and score them with
+    statistics of the whole corpus. Rows returned by bm25()/rows_for()
+    encode (shard, row in shard) and are only meaningful to this index.
+    """
+
+    MANIFEST_VERSION = 1
+
+    def __init__(
+        self,
+        directory: str,
+        load_memories: Callable[[Optional[str]], Iterable[Dict[str, Any]]],
+        load_access: Optional[Callable[[Optional[str]], Dict[str, int]]] = None,
+        **kwargs
+    ):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.load_memories = load_memories
+        self.load_access = load_access
+        self._index_kwargs = kwargs
+        # Manifest entries by shard key ("" for memories without a category)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._shards: Dict[str, MemorySearchIndex] = {}
+        # Process-local shard numbers used in row codes
+        self._codes: Dict[str, int] = {}
+        self._keys: List[str] = []
+        self.seq = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(
+        cls,
+        directory: str,
+        load_memories: Callable[[Optional[str]], Iterable[Dict[str, Any]]],
+        seq: int = 0,
+        load_access: Optional[Callable[[Optional[str]], Dict[str, int]]] = None,
+        **kwargs
+    ) -> "ShardedSearchIndex":
+        """
+        Read the manifest if it reflects store change sequence seq;
+        otherwise rebuild every shard from load_memories(None).
+        """
+        index = cls(directory, load_memories, load_access, **kwargs)
+        if not index._load_manifest() or index.seq != seq:
+            index.rebuild(load_memories(None), seq)
+        return index
+
+    @staticmethod
+    def _key(category: Optional[str]) -> str:
+        return category or ""
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        # Readable and unique for any category name
+        slug = re.sub(r"[^a-z0-9_]+", "-", key.lower()).strip("-") or "uncategorized"
+        return f"{slug}-{zlib.crc32(key.encode('utf-8')):08x}.json"
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(entry["docs"] for entry in self._entries.values())
+
+    @property
+    def categories(self) -> List[Optional[str]]:
+        with self._lock:
+            return [key or None for key in self._entries]
+
+    def _code(self, key: str) -> int:
+        # Caller holds the lock
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self._keys)
+            self._keys.append(key)
+        return code
+
+    def _new_shard(self, key: str) -> MemorySearchIndex:
+        return MemorySearchIndex(os.path.join(self.directory, self._file_name(key)), **self._index_kwargs)
+
+    def _shard(self, key: str, create: bool = False) -> Optional[MemorySearchIndex]:
+        """The shard for a category key, loaded on first use (caller holds the lock)"""
+        shard = self._shards.get(key)
+        if shard is not None:
+            return shard
+        entry = self._entries.get(key)
+        if entry is None:
+            if not create:
+                return None
+            shard = self._new_shard(key)
+            # A category new since the manifest was read: another process may have written it
+            if not shard.load():
+                shard.seq = self.seq
+            self._entries[key] = {"file": os.path.basename(shard.path), "docs": len(shard), "seq": shard.seq}
+        else:
+            shard = self._new_shard(key)
+            # Another process may have written a newer shard; an older one is stale
+            if not shard.load() or shard.seq < entry["seq"]:
+                memories = self.load_memories(key or None)
+                shard.rebuild([m for m in memories if self._key(m.get("category")) == key], persist=False)
+                shard.seq = entry["seq"]
+                shard.save()
+            elif self.load_access is not None:
+                shard.set_access(self.load_access(key or None))
+        self._shards[key] = shard
+        self._code(key)
+        return shard
+
+    def rebuild(self, memories: Iterable[Dict[str, Any]], seq: int = 0):
+        """Replace all shards with the given memories"""
+        by_key: Dict[str, List[Dict[str, Any]]] = {}
+        for memory in memories:
+            by_key.setdefault(self._key(memory.get("category")), []).append(memory)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._entries, self._shards = {}, {}
+            self.seq = seq
+            for key, shard_memories in by_key.items():
+                shard = self._new_shard(key)
+                shard.rebuild(shard_memories, persist=False)
+                shard.seq = seq
+                shard.save()
+                self._shards[key] = shard
+                self._code(key)
+                self._entries[key] = {"file": os.path.basename(shard.path), "docs": len(shard), "seq": seq}
+            self._save_manifest()
+            keep = {entry["file"] for entry in self._entries.values()} | {"manifest.json"}
+            for name in os.listdir(self.directory):
+                if name not in keep and name.endswith((".json", ".log")):
+                    os.remove(os.path.join(self.directory, name))
+
+    def apply(self, memories: List[Dict[str, Any]], seq: int):
+        """Re-index memories changed in the store; only their shards are logged to"""
+        with self._lock:
+            touched: Dict[str, List[str]] = {}
+            for memory in memories:
+                memory_id = memory["memory_id"]
+                key = self._key(memory.get("category"))
+                # A memory that moved category in another process: drop the old copy
+                for other_key, other in self._shards.items():
+                    if other_key != key and memory_id in other:
+                        other.remove(memory_id, persist=False)
+                        touched.setdefault(other_key, []).append(memory_id)
+                shard = self._shard(key, create=memory.get("status") != "archived")
+                if shard is not None:
+                    shard.upsert(memory, persist=False)
+                    touched.setdefault(key, []).append(memory_id)
+            self.seq = seq
+            for key, memory_ids in touched.items():
+                shard = self._shards[key]
+                shard.commit(memory_ids, seq)
+                self._entries[key].update(docs=len(shard), seq=seq)
+            self._save_manifest()
+
+    def apply_access(self, counts: Dict[str, int]):
+        with self._lock:
+            for shard in self._shards.values():
+                shard.apply_access(counts)
+
+    def _searched(self, category: Optional[str]) -> List[str]:
+        # Caller holds the lock; shard keys a search touches (loading them)
+        keys = [self._key(category)] if category else list(self._entries)
+        return [key for key in keys if self._shard(key) is not None]
+
+    def bm25(
+        self,
+        query: str,
+        status: Optional[str] = "active",
+        category: Optional[str] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 scores over the category's shard, or over all shards with corpus-wide statistics"""
+        with self._lock:
+            keys = self._searched(category)
+            if len(keys) == 1:
+                stats = None
+            else:
+                terms = set(tokenize(query))
+                n = sum(len(self._shards[key]) for key in keys)
+                total_length = sum(self._shards[key]._total_length for key in keys)
+                df = {term: sum(self._shards[key].document_frequency(term) for key in keys) for term in terms}
+                stats = (n, total_length / n if n else 0.0, df)
+            all_rows, all_scores = [], []
+            for key in keys:
+                rows, scores = self._shards[key].bm25(query, status=status, stats=stats)
+                all_rows.append((self._codes[key] << 32) | rows)
+                all_scores.append(scores)
+        if not all_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(all_rows), np.concatenate(all_scores)
+
+    def search(
+        self,
+        query: str,
+        status: Optional[str] = "active",
+        category: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """BM25-ranked memories containing at least one query term (no boosts)"""
+        rows, scores = self.bm25(query, status, category)
+        order = np.argsort(-scores, kind="stable") if limit is None else top_k(scores, limit)
+        return [(self.memory_id(rows[i]), float(scores[i])) for i in order]
+
+    def memory_id(self, row: int) -> str:
+        row = int(row)
+        return self._shards[self._keys[row >> 32]].memory_id(row & 0xFFFFFFFF)
+
+    def rows_for(
+        self,
+        hits: Iterable[Tuple[str, float]],
+        category: Optional[str] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) arrays for (memory_id, score) pairs from another ranker; unknown ids are skipped"""
+        hits = list(hits)
+        with self._lock:
+            all_rows, all_scores = [], []
+            for key in self._searched(category):
+                rows, scores = self._shards[key].rows_for(hits)
+                all_rows.append((self._codes[key] << 32) | rows)
+                all_scores.append(scores)
+        if not all_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(all_rows), np.concatenate(all_scores)
+
+    def rank(
+        self,
+        rows: np.ndarray,
+        relevance: np.ndarray,
+        limit: int,
+        pending_access: Optional[Dict[str, int]] = None,
+        now: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """Final ranking across shards (see MemorySearchIndex.rank)"""
+        if not len(rows) or limit <= 0:
+            return []
+        scores = np.zeros(len(rows), dtype=np.float64)
+        codes = rows >> 32
+        with self._lock:
+            for code in np.unique(codes):
+                positions = np.flatnonzero(codes == code)
+                shard = self._shards[self._keys[int(code)]]
+                scores[positions] = shard.boosted(rows[positions] & 0xFFFFFFFF, relevance[positions], pending_access, now)
+            return [(self.memory_id(rows[i]), float(scores[i])) for i in top_k(scores, limit)]
+
+    def _load_manifest(self) -> bool:
+        try:
+            with open(self.manifest_path, 'rb') as f:
+                data = json_codec.loads(f.read())
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != self.MANIFEST_VERSION:
+            return False
+        with self._lock:
+            self._entries = data["shards"]
+            self.seq = data.get("seq", 0)
+        return True
+
+    def _save_manifest(self):
+        # Caller holds the lock; written after the shards it vouches for
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json_codec.dumps({"version": self.MANIFEST_VERSION, "seq": self.seq, "shards": self._entries}))
+        os.replace(tmp_path, self.manifest_path)
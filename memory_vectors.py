@@ -0,0 +1,416 @@
+"""
+Offline Semantic Vectors for Memory Search
+
+Keyword search misses paraphrases ("risk limits" vs "exposure
+thresholds"). This module embeds each memory (summary, tags and content)
+with a local encoder and answers queries with cosine similarity over a
+contiguous float32 matrix, without any network call on the search path:
+
+- HashingEncoder (default): word unigrams, word bigrams and character
+  3-5-grams hashed into MEMORY_VECTOR_DIM signed buckets. Needs only NumPy
+  and matches morphological variants and partial overlaps ("threshold" /
+  "thresholds", "exposure limit" / "exposure limits").
+- SentenceTransformerEncoder: set MEMORY_VECTOR_MODEL to a sentence-
+  transformers model directory on local disk for real paraphrase matching;
+  the model is loaded from disk only.
+
+Vectors live in knowledge/vector_index.f32 (raw row-major float32, opened
+with numpy.memmap) next to knowledge/vector_index.json (ids, status,
+category, encoder and the store change sequence). New memories append one
+row, updated memories overwrite their row in place, and a query is one
+matrix-vector product plus a partial top-k (argpartition). The metadata of
+changed rows is appended to knowledge/vector_index.log and the metadata
+snapshot is rewritten once that log outgrows it (see delta_log.py).
+
+Every process applies every change to the same files, but not necessarily
+in the same order (a process catching up sees each memory only once, at its
+latest change). Rows are therefore placed by whichever process applies a
+change first: under knowledge/vector_index.lock a process first adopts the
+rows others have logged since it loaded, and skips changes they applied.
+
+Configuration (environment variables):
+    MEMORY_VECTOR_DIM    hashing encoder dimensions (default 512)
+    MEMORY_VECTOR_MODEL  local sentence-transformers model path (optional)
+
+Usage:
+    from memory_vectors import VectorIndex
+
+    index = VectorIndex.open("knowledge/vector_index.json", load_memories, memory_text)
+    hits = index.search("exposure thresholds", limit=5)  # [(memory_id, cosine), ...]
+"""
+
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import json_codec
+from delta_log import DeltaLog
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no inter-process locking; run a single worker there
+    fcntl = None
+
+
+MEMORY_VECTOR_DIM = int(os.getenv("MEMORY_VECTOR_DIM", "512"))
+MEMORY_VECTOR_MODEL = os.getenv("MEMORY_VECTOR_MODEL", "")
+
+INDEX_FORMAT_VERSION = 1
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEncoder:
+    """Network-free text encoder using signed feature hashing"""
+
+    def __init__(self, dim: int = MEMORY_VECTOR_DIM):
+        self.dim = dim
+        self.name = f"hashing-v1-{dim}"
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        words = _WORD_RE.findall(text.lower())
+        features = [(f"w:{w}", 1.0) for w in words]
+        features += [(f"b:{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            for n in (3, 4, 5):
+                features += [(f"c:{padded[i:i + n]}", 0.5) for i in range(len(padded) - n + 1)]
+        return features
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """L2-normalized float32 vectors, one row per text"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class SentenceTransformerEncoder:
+    """Local sentence-transformers model (loaded from disk, never downloaded)"""
+
+    def __init__(self, model_path: str = MEMORY_VECTOR_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_path, local_files_only=True)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st:{os.path.basename(os.path.normpath(model_path))}-{self.dim}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def default_encoder():
+    if MEMORY_VECTOR_MODEL:
+        return SentenceTransformerEncoder(MEMORY_VECTOR_MODEL)
+    return HashingEncoder()
+
+
+class VectorIndex:
+    """Memory vectors in a contiguous (memory-mapped) float32 matrix"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        load_text: Optional[Callable[[Dict[str, Any]], str]] = None,
+        encoder: Any = None
+    ):
+        self.path = path
+        self.load_text = load_text or (lambda memory: memory.get("summary", ""))
+        self.encoder = encoder or default_encoder()
+        self.dim = self.encoder.dim
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._status: List[str] = []
+        self._category: List[Optional[str]] = []
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        # Store change sequence this index reflects
+        self.seq = 0
+        self._log = DeltaLog(path) if path else None
+        self._load_memories: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None
+        # Identity of the metadata snapshot this index was loaded from or saved
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._file_lock_depth = 0
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        load_memories: Callable[[], Iterable[Dict[str, Any]]],
+        load_text: Callable[[Dict[str, Any]], str],
+        seq: int = 0,
+        **kwargs
+    ) -> "VectorIndex":
+        """Load the persisted index if it reflects change sequence seq, else rebuild it"""
+        index = cls(path, load_text, **kwargs)
+        index._load_memories = load_memories
+        with index._lock:
+            with index._file_lock():
+                loaded = index.load()
+            if not loaded or index.seq != seq:
+                index.rebuild(load_memories(), seq)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.splitext(self.path)[0] + ".f32"
+
+    @contextmanager
+    def _file_lock(self):
+        # Caller holds self._lock; serializes row placement across processes
+        if fcntl is None or not self.path or self._file_lock_depth:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(os.path.splitext(self.path)[0] + ".lock", 'a+b')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._file_lock_depth += 1
+        try:
+            yield
+        finally:
+            self._file_lock_depth -= 1
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _map(self):
+        # Caller holds the lock; (re)map the rows the metadata vouches for
+        if not self.path or not self._ids:
+            return
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(len(self._ids), self.dim))
+
+    def apply(self, memories: List[Dict[str, Any]], seq: int):
+        """Embed memories changed in the store and write their rows, up to change sequence seq"""
+        vectors = self._encode([m for m in memories if m.get("status") != "archived"])
+        with self._lock:
+            with self._file_lock():
+                current = self._catch_up()
+                if current:
+                    self._write(memories, vectors, seq)
+            if not current:
+                # Rebuilt behind this index elsewhere, so the rows written here
+                # since are gone. The store is read outside the file lock,
+                # which is only ever taken after the store's own locks.
+                self.rebuild(self._load_memories(), seq)
+
+    def _write(self, memories: List[Dict[str, Any]], vectors: Optional[np.ndarray], seq: int):
+        # Caller holds both locks
+        if self._log is not None and self.seq >= seq:
+            # Another process applied this change and placed its rows
+            return
+        self._embed(memories, vectors)
+        base, self.seq = self.seq, seq
+        if self._log is None:
+            return
+        # Row metadata of the changed memories (rows are written already)
+        changes = {}
+        for memory in memories:
+            row = self._rows.get(memory["memory_id"])
+            if row is not None:
+                changes[memory["memory_id"]] = [row, self._status[row], self._category[row]]
+        if self._log.append(base, seq, changes):
+            self._save_meta()
+
+    def _catch_up(self) -> bool:
+        # Caller holds both locks; adopt the rows other processes logged since
+        # this index was loaded, so a memory gets the same row in every process.
+        # False when the snapshot was rebuilt behind this index.
+        if self._log is None:
+            return True
+        if self._stat(self.path) == self._signature:
+            self.seq = self._replay(self._ids, self._rows, self._status, self._category, self.seq)
+            self._map()
+            return True
+        # The snapshot was compacted or rebuilt elsewhere
+        loaded_seq = self.seq
+        return (self.load() and self.seq >= loaded_seq) or self._load_memories is None
+
+    def _encode(self, memories: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not memories:
+            return None
+        return self.encoder.encode([self.load_text(m) for m in memories])
+
+    def _embed(self, memories: List[Dict[str, Any]], vectors: Optional[np.ndarray] = None):
+        # Update the rows of changed memories (metadata is persisted by the caller)
+        live = [m for m in memories if m.get("status") != "archived"]
+        if vectors is None:
+            vectors = self._encode(live)
+        with self._lock:
+            # Archived memories keep their row (rows are never moved) but stop matching
+            for memory in memories:
+                row = self._rows.get(memory["memory_id"])
+                if memory.get("status") == "archived" and row is not None:
+                    self._status[row] = "archived"
+            if not live:
+                return
+            memories = live
+            new_rows = []
+            for memory, vector in zip(memories, vectors):
+                memory_id = memory["memory_id"]
+                row = self._rows.get(memory_id)
+                if row is None:
+                    row = self._rows[memory_id] = len(self._ids)
+                    self._ids.append(memory_id)
+                    self._status.append(memory.get("status", "active"))
+                    self._category.append(memory.get("category"))
+                else:
+                    self._status[row] = memory.get("status", "active")
+                    self._category[row] = memory.get("category")
+                new_rows.append((row, vector))
+            if self.path:
+                mode = 'r+b' if os.path.exists(self._vectors_path) else 'w+b'
+                with open(self._vectors_path, mode) as f:
+                    for row, vector in new_rows:
+                        f.seek(row * self.dim * 4)
+                        f.write(vector.astype("<f4").tobytes())
+                self._map()
+            else:
+                matrix = np.zeros((len(self._ids), self.dim), dtype=np.float32)
+                matrix[:len(self._matrix)] = self._matrix
+                for row, vector in new_rows:
+                    matrix[row] = vector
+                self._matrix = matrix
+
+    def rebuild(self, memories: Iterable[Dict[str, Any]], seq: int = 0, batch_size: int = 256):
+        with self._lock, self._file_lock():
+            self._ids, self._rows, self._status, self._category = [], {}, [], []
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            if self.path and os.path.exists(self._vectors_path):
+                os.truncate(self._vectors_path, 0)
+            memories = list(memories)
+            for start in range(0, len(memories), batch_size):
+                self._embed(memories[start:start + batch_size])
+            self.seq = seq
+            if self.path:
+                self._save_meta()
+
+    def search(
+        self,
+        query: str,
+        status: Optional[str] = "active",
+        category: Optional[str] = None,
+        limit: int = 5
+    ) -> List[Tuple[str, float]]:
+        """
+        Memories most similar to the query.
+
+        Returns:
+            [(memory_id, cosine similarity), ...] best first, positive similarities only
+        """
+        query_vector = self.encoder.encode([query])[0]
+        with self._lock:
+            if not self._ids or limit <= 0:
+                return []
+            scores = np.asarray(self._matrix @ query_vector, dtype=np.float32)
+            mask = scores > 0
+            if status and status != "all":
+                mask &= np.fromiter((s == status for s in self._status), dtype=bool, count=len(self._ids))
+            else:
+                mask &= np.fromiter((s != "archived" for s in self._status), dtype=bool, count=len(self._ids))
+            if category:
+                mask &= np.fromiter((c == category for c in self._category), dtype=bool, count=len(self._ids))
+            candidates = np.flatnonzero(mask)
+            if len(candidates) > limit:
+                top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+                candidates = candidates[top]
+            ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self._ids[i], float(scores[i])) for i in ordered]
+
+    def load(self) -> bool:
+        """Load the persisted metadata and replay its delta log; False when there is nothing usable to load"""
+        signature = self._stat(self.path) if self.path else None
+        if signature is None:
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                meta = json_codec.loads(f.read())
+            ids, status, category = meta["ids"], meta["status"], meta["category"]
+        except (OSError, ValueError, KeyError):
+            return False
+        if meta.get("version") != INDEX_FORMAT_VERSION or meta.get("encoder") != self.encoder.name:
+            return False
+        rows = {memory_id: row for row, memory_id in enumerate(ids)}
+        seq = self._replay(ids, rows, status, category, meta.get("seq", 0))
+        try:
+            size = os.path.getsize(self._vectors_path) if ids else 0
+        except OSError:
+            return False
+        if size < len(ids) * self.dim * 4:
+            return False
+        with self._lock:
+            self._ids, self._rows, self._status, self._category = ids, rows, status, category
+            self.seq = seq
+            self._signature = signature
+            self._map()
+        return True
+
+    def _replay(self, ids: List[str], rows: Dict[str, int], status: List[str], category: List[Optional[str]], seq: int) -> int:
+        # Apply the logged row metadata that continues from seq; returns the seq reached
+        for line_seq, changes in self._log.replay(seq):
+            if not self._fits(rows, len(ids), changes):
+                break
+            for memory_id, (row, row_status, row_category) in changes.items():
+                if memory_id not in rows:
+                    rows[memory_id] = len(ids)
+                    ids.append(memory_id)
+                    status.append(row_status)
+                    category.append(row_category)
+                else:
+                    status[row], category[row] = row_status, row_category
+            seq = line_seq
+        return seq
+
+    @staticmethod
+    def _fits(rows: Dict[str, int], count: int, changes: Dict[str, List[Any]]) -> bool:
+        # A logged change continues these rows: known memories keep their row,
+        # new ones take the next rows in order
+        for memory_id, (row, _, _) in changes.items():
+            expected = rows.get(memory_id)
+            if expected is None:
+                expected, count = count, count + 1
+            if row != expected:
+                return False
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _save_meta(self):
+        # Caller holds the lock; rows are written before the metadata that vouches for them
+        meta = {
+            "version": INDEX_FORMAT_VERSION,
+            "seq": self.seq,
+            "encoder": self.encoder.name,
+            "ids": self._ids,
+            "status": self._status,
+            "category": self._category
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json_codec.dumps(meta))
+        os.replace(tmp_path, self.path)
+        self._signature = self._stat(self.path)
+        self._log.clear()
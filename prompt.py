@@ -9,7 +9,9 @@ You have access to a DuckDB database containing financial and risk-related data.
 <tools>
 <tool name="duckdb_query">
   <description>
-    Executes SQL queries against the DuckDB database and returns results as a string.
+    Executes SQL queries against the DuckDB database and returns results as compact column-oriented JSON:
+    {"columns": [...], "types": [...], "data": [[column 1 values], [column 2 values], ...], "rows": total_row_count}
+    Large results are cut to a row budget; they then include "truncated" and per-column "stats" (min, max, mean).
   </description>
   <parameters>
     <parameter name="sql" type="string" required="true">
@@ -20,7 +22,8 @@ You have access to a DuckDB database containing financial and risk-related data.
     - Use this tool to retrieve data from the database before creating visualizations
     - Always validate your SQL syntax before calling the tool
     - Handle potential errors gracefully
-    - Parse the string result to extract data for charts
+    - Use each "data" column directly as a Highcharts categories or series data array
+    - Aggregate in SQL (GROUP BY, date_trunc) instead of fetching raw rows for charts
   </usage_guidelines>
   <examples>
     <example>
@@ -44,7 +47,7 @@ You have access to a DuckDB database containing financial and risk-related data.
 </step>
 <step number="2">
   Process the query results:
-  - Parse the returned string data
+  - Read the column arrays from the returned JSON
   - Transform data into appropriate format for visualization
 </step>
 <step number="3">
@@ -0,0 +1,67 @@
+"""
+Provider Prompt Caching for the Static System Prompt
+
+SYSTEM_PROMPT (prompt.py) is several thousand tokens of XML and chart
+examples and is the first message of every request. Both providers can
+serve an identical prompt prefix from cache, which cuts input cost and
+prefill latency, provided the prefix is byte-for-byte stable:
+
+- The system message is built once per provider and always sent first;
+  nothing per-request (dates, user names, history) may be added to it
+- Anthropic needs an explicit cache breakpoint: the system block carries
+  cache_control {"type": "ephemeral"}, so everything up to and including
+  the system prompt is cached
+- OpenAI caches prompt prefixes of 1024+ tokens automatically; the stable
+  leading system message is what makes those cache hits possible
+
+cache_usage() turns a response's usage_metadata into the per-request token
+report returned by the chat endpoints, including cache-hit tokens.
+
+Usage:
+    from prompt_caching import system_message, cache_usage
+
+    messages = [system_message("anthropic"), *history]
+    response = await llm.ainvoke(messages)
+    usage = cache_usage(response.usage_metadata)
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import SystemMessage
+
+from prompt import SYSTEM_PROMPT
+
+
+@lru_cache(maxsize=None)
+def system_message(provider: str) -> SystemMessage:
+    """The static system prompt as a cacheable prefix for the given provider"""
+    if provider == "anthropic":
+        return SystemMessage(content=[{
+            "type": "text",
+            "text": SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"}
+        }])
+    return SystemMessage(content=SYSTEM_PROMPT)
+
+
+def cache_usage(usage_metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """
+    Summarize token usage with prompt cache details.
+
+    Args:
+        usage_metadata: LangChain usage_metadata from a response (may be None)
+
+    Returns:
+        {"input_tokens", "cached_input_tokens", "cache_creation_tokens", "output_tokens"}
+        or None when the provider reported no usage
+    """
+    if not usage_metadata:
+        return None
+    details = usage_metadata.get("input_token_details") or {}
+    return {
+        "input_tokens": usage_metadata.get("input_tokens", 0),
+        "cached_input_tokens": details.get("cache_read", 0) or 0,
+        "cache_creation_tokens": details.get("cache_creation", 0) or 0,
+        "output_tokens": usage_metadata.get("output_tokens", 0)
+    }
@@ -6,7 +6,7 @@ Can be imported and appended to any existing system prompt.
 
 MEMORY_TOOLS_PROMPT = """
 <memory_system>
-You have access to a persistent long-term memory system with three tools:
+You have access to a persistent long-term memory system with four tools:
 
 **1. search_memory_index(query, category=None, status="active", limit=5)**
 Search the memory index for relevant information.
@@ -44,6 +44,12 @@ Actions:
   * Required: memory_id (comma-separated), content, summary
   * Example: manage_memory(action="consolidate", memory_id="MEMORY-001,MEMORY-005", content="Merged...", summary="Combined info")
 
+**4. manage_memories(operations)**
+Apply several manage_memory operations at once, saved in one atomic commit (all or nothing).
+- Use when you learn several facts in one turn
+- Each operation takes the manage_memory arguments
+- Example: manage_memories(operations=[{"action": "create", "content": "User prefers bar charts", "category": "user_profile", "summary": "Chart type preference"}, {"action": "retire", "memory_id": "MEMORY-004"}])
+
 <categories>
 Use these standard categories:
 - user_profile: User preferences, settings, personal info
@@ -83,6 +89,7 @@ MEMORY_TOOLS_PROMPT_CONCISE = """
 **search_memory_index(query, category, status, limit)** - Search memory index
 **read_memory_file(memory_id)** - Read full memory content
 **manage_memory(action, content, memory_id, category, tags, summary, confidence)** - Create/update/retire/consolidate
+**manage_memories(operations)** - Several manage_memory operations in one atomic commit
 
 Workflow:
 1. Search before answering: search_memory_index("topic") → read_memory_file("MEMORY-XXX")
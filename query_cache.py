@@ -0,0 +1,192 @@
+"""
+SQL Result Cache for duckdb_query
+
+Analysts ask for the same charts again and again, and the agent re-runs the
+same aggregations every time. This LRU + TTL cache sits in front of the
+DuckDB tool and returns the already-encoded result for repeated queries.
+
+- Keys are normalized SQL text (comments dropped, whitespace collapsed and
+  keywords lowercased outside string, escape-string, dollar-quoted and
+  quoted-identifier literals, trailing semicolons dropped); SQL with an
+  unterminated literal or comment is keyed on its raw text
+- Entries expire after a TTL and the least recently used entry is evicted
+  once the cache is full
+- Everything is invalidated when the database file (or its WAL) changes, or
+  when a registered table version is bumped via bump_table_version()
+
+Configuration (environment variables):
+    DUCKDB_CACHE_SIZE  maximum cached queries (default 256, 0 disables)
+    DUCKDB_CACHE_TTL   seconds (default 300)
+
+Usage:
+    from query_cache import query_cache
+
+    version = query_cache.data_version()
+    result = query_cache.get(sql)
+    if result is None:
+        result = run_query(sql)
+        query_cache.put(sql, result, version)
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from duckdb_manager import DUCKDB_PATH
+
+
+DUCKDB_CACHE_SIZE = int(os.getenv("DUCKDB_CACHE_SIZE", "256"))
+DUCKDB_CACHE_TTL = float(os.getenv("DUCKDB_CACHE_TTL", "300"))
+
+# Literals are kept verbatim (string constants, escape strings, quoted
+# identifiers, dollar-quoted strings); comments are dropped
+_TOKENS = re.compile(r"""
+    (?P<literal>
+        (?<![\w$])[eE]'(?:[^'\\]|\\.|'')*'
+      | '(?:[^']|'')*'
+      | "(?:[^"]|"")*"
+      | \$(?P<tag>(?:[A-Za-z_]\w*)?)\$.*?\$(?P=tag)\$
+    )
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+""", re.VERBOSE | re.DOTALL)
+
+# Left in code outside any literal or comment only when one is unterminated
+_UNTERMINATED = re.compile(r"['\"]|/\*|\$(?:[A-Za-z_]\w*)?\$")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize SQL text so trivially different spellings share a cache entry.
+
+    Comments are dropped, and outside literals whitespace runs are collapsed
+    and text is lowercased. SQL that cannot be tokenized safely (an
+    unterminated literal or comment) is keyed on its raw text.
+    """
+    sql = sql.strip()
+    parts, code, position = [], [], 0
+
+    def flush_code() -> bool:
+        text = "".join(code)
+        code.clear()
+        if _UNTERMINATED.search(text):
+            return False
+        parts.append(re.sub(r"\s+", " ", text).lower())
+        return True
+
+    for match in _TOKENS.finditer(sql):
+        code.append(sql[position:match.start()])
+        position = match.end()
+        if match.group("comment") is not None:
+            code.append(" ")
+            continue
+        if not flush_code():
+            return sql
+        parts.append(match.group("literal"))
+    code.append(sql[position:])
+    if not flush_code():
+        return sql
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+class QueryCache:
+    """Thread-safe LRU + TTL cache of encoded query results"""
+
+    def __init__(self, db_path: str = DUCKDB_PATH, max_entries: int = DUCKDB_CACHE_SIZE, ttl: float = DUCKDB_CACHE_TTL):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._table_versions: Dict[str, int] = {}
+        self._version: Optional[Tuple] = None
+        self._lock = threading.Lock()
+
+    def data_version(self) -> Tuple:
+        """Fingerprint of the underlying data: database/WAL file stats plus table versions"""
+        stats = []
+        for path in (self.db_path, self.db_path + ".wal"):
+            try:
+                st = os.stat(path)
+                stats.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stats.append(None)
+        return (tuple(stats), tuple(sorted(self._table_versions.items())))
+
+    def bump_table_version(self, table: str):
+        """Record that a table changed outside of the database file (e.g. a registered view)"""
+        with self._lock:
+            self._table_versions[table] = self._table_versions.get(table, 0) + 1
+
+    def _check_version(self, version: Tuple):
+        # Caller holds the lock
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, sql: str) -> Optional[str]:
+        """Return the cached result for this query, or None"""
+        if self.max_entries <= 0:
+            return None
+        key = normalize_sql(sql)
+        version = self.data_version()
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, sql: str, result: str, version: Optional[Tuple] = None):
+        """
+        Cache a result.
+
+        Args:
+            sql: The query text
+            result: The encoded result
+            version: data_version() taken before the query ran; results computed
+                against data that has since changed are not cached
+        """
+        if self.max_entries <= 0:
+            return
+        key = normalize_sql(sql)
+        current = self.data_version()
+        if version is not None and version != current:
+            return
+        with self._lock:
+            self._check_version(current)
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
+
+
+query_cache = QueryCache()
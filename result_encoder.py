@@ -0,0 +1,263 @@
+"""
+Compact Result Encoding for duckdb_query
+
+str(fetchall()) materializes every row as Python tuples and then builds a
+repr string of the whole result, which is fed back to the model verbatim.
+This encoder instead:
+
+- fetches in Arrow record batches (falls back to fetchmany without pyarrow)
+- keeps at most max_rows rows, column-oriented, with the header sent once
+- rounds floats to a fixed number of decimals
+- shrinks the kept rows until the encoded text fits in max_bytes
+- marks truncated results explicitly and adds min/max/mean per numeric column
+  computed over the full result, so the model still sees the overall shape
+- reports column types with one name table applied to DuckDB's own column
+  types, so the schema does not depend on whether pyarrow is installed
+
+Example output:
+    {"columns":["category","total"],"types":["string","double"],
+     "data":[["Credit","Market"],[450.5,380.0]],"rows":2}
+
+Configuration (environment variables):
+    DUCKDB_RESULT_MAX_ROWS   (default 200)
+    DUCKDB_RESULT_MAX_BYTES  (default 16000)
+    DUCKDB_RESULT_PRECISION  decimals kept for floats (default 4)
+"""
+
+import datetime
+import decimal
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+
+DUCKDB_RESULT_MAX_ROWS = int(os.getenv("DUCKDB_RESULT_MAX_ROWS", "200"))
+DUCKDB_RESULT_MAX_BYTES = int(os.getenv("DUCKDB_RESULT_MAX_BYTES", "16000"))
+DUCKDB_RESULT_PRECISION = int(os.getenv("DUCKDB_RESULT_PRECISION", "4"))
+
+BATCH_SIZE = 2048
+
+# DuckDB type -> type name reported in "types" (parameters such as DECIMAL
+# precision are dropped; unknown types are reported in lower case)
+_TYPE_NAMES = {
+    "BOOLEAN": "bool",
+    "TINYINT": "int8",
+    "SMALLINT": "int16",
+    "INTEGER": "int32",
+    "BIGINT": "int64",
+    "HUGEINT": "int128",
+    "UTINYINT": "uint8",
+    "USMALLINT": "uint16",
+    "UINTEGER": "uint32",
+    "UBIGINT": "uint64",
+    "UHUGEINT": "uint128",
+    "FLOAT": "float",
+    "DOUBLE": "double",
+    "DECIMAL": "decimal",
+    "VARCHAR": "string",
+    "ENUM": "string",
+    "UUID": "uuid",
+    "JSON": "json",
+    "BLOB": "binary",
+    "BIT": "bit",
+    "DATE": "date",
+    "TIME": "time",
+    "TIME WITH TIME ZONE": "timetz",
+    "TIMESTAMP": "timestamp",
+    "TIMESTAMP_S": "timestamp",
+    "TIMESTAMP_MS": "timestamp",
+    "TIMESTAMP_NS": "timestamp",
+    "TIMESTAMP WITH TIME ZONE": "timestamptz",
+    "INTERVAL": "interval",
+    "STRUCT": "struct",
+    "MAP": "map",
+    "UNION": "union",
+}
+
+
+class _NumericStats:
+    """Running count/min/max/sum for one numeric column"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def merge(self, count: int, total: float, low: Any, high: Any):
+        if not count:
+            return
+        self.count += count
+        self.total += float(total)
+        self.min = float(low) if self.min is None else min(self.min, float(low))
+        self.max = float(high) if self.max is None else max(self.max, float(high))
+
+    def to_dict(self, precision: int) -> Dict[str, Any]:
+        mean = self.total / self.count if self.count else None
+        return {
+            "min": _round(self.min, precision),
+            "max": _round(self.max, precision),
+            "mean": _round(mean, precision)
+        }
+
+
+def _round(value: Optional[float], precision: int) -> Optional[float]:
+    return None if value is None else round(value, precision)
+
+
+def _compact_value(value: Any, precision: int) -> Any:
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, float):
+        return round(value, precision)
+    if isinstance(value, decimal.Decimal):
+        return round(float(value), precision)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (int, str)):
+        return value
+    return str(value)
+
+
+def _type_name(duckdb_type: Any) -> str:
+    """Reported name of a DuckDB column type (e.g. DECIMAL(10,2) -> decimal, INTEGER[] -> list<int32>)"""
+    name = str(duckdb_type)
+    if name.endswith("]"):
+        return f"list<{_type_name(name[:name.rindex('[')])}>"
+    base = name.split("(", 1)[0].strip()
+    return _TYPE_NAMES.get(base, base.lower())
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, decimal.Decimal)) and not isinstance(value, bool)
+
+
+def encode_result(
+    cursor,
+    max_rows: int = DUCKDB_RESULT_MAX_ROWS,
+    max_bytes: int = DUCKDB_RESULT_MAX_BYTES,
+    precision: int = DUCKDB_RESULT_PRECISION
+) -> str:
+    """
+    Encode the pending result of a DuckDB cursor as compact, bounded JSON.
+
+    Args:
+        cursor: DuckDB connection/cursor on which execute() was just called
+        max_rows: Maximum number of rows included in the output
+        max_bytes: Maximum size of the encoded output
+        precision: Decimals kept for floating point values
+
+    Returns:
+        Compact JSON string (see module docstring)
+    """
+    if cursor.description is None:
+        return json.dumps({"columns": [], "types": [], "data": [], "rows": 0}, separators=(",", ":"))
+
+    # DuckDB's own column types, whichever way the rows are fetched
+    types = [_type_name(d[1]) for d in cursor.description]
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        names, columns, total_rows, stats = _collect_rows(cursor, max_rows)
+    else:
+        names, columns, total_rows, stats = _collect_arrow(cursor, max_rows)
+
+    return _render(names, types, columns, total_rows, stats, max_bytes, precision)
+
+
+def _collect_arrow(cursor, max_rows: int):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if hasattr(cursor, "to_arrow_reader"):
+        reader = cursor.to_arrow_reader(BATCH_SIZE)
+    else:
+        reader = cursor.fetch_record_batch(BATCH_SIZE)
+    schema = reader.schema
+    names = list(schema.names)
+    numeric = [
+        pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_decimal(field.type)
+        for field in schema
+    ]
+    columns: List[List[Any]] = [[] for _ in names]
+    stats = {name: _NumericStats() for name, is_num in zip(names, numeric) if is_num}
+    total_rows = 0
+
+    for batch in reader:
+        remaining = max_rows - total_rows
+        if remaining > 0:
+            kept = batch.slice(0, remaining)
+            for i, column in enumerate(kept.columns):
+                columns[i].extend(column.to_pylist())
+
+        for i, name in enumerate(names):
+            if not numeric[i]:
+                continue
+            column = batch.column(i)
+            valid = len(column) - column.null_count
+            if valid:
+                bounds = pc.min_max(column)
+                stats[name].merge(
+                    valid,
+                    pc.sum(column).as_py(),
+                    bounds["min"].as_py(),
+                    bounds["max"].as_py()
+                )
+
+        total_rows += batch.num_rows
+
+    return names, columns, total_rows, stats
+
+
+def _collect_rows(cursor, max_rows: int):
+    names = [d[0] for d in cursor.description]
+    columns: List[List[Any]] = [[] for _ in names]
+    stats: Dict[str, _NumericStats] = {}
+    total_rows = 0
+
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        remaining = max_rows - total_rows
+        for row in rows[:max(remaining, 0)]:
+            for i, value in enumerate(row):
+                columns[i].append(value)
+        for row in rows:
+            for name, value in zip(names, row):
+                if _is_number(value):
+                    stats.setdefault(name, _NumericStats()).merge(1, value, value, value)
+        total_rows += len(rows)
+
+    return names, columns, total_rows, stats
+
+
+def _render(names, types, columns, total_rows, stats, max_bytes, precision) -> str:
+    columns = [[_compact_value(v, precision) for v in column] for column in columns]
+    kept_rows = len(columns[0]) if columns else 0
+
+    def build(row_count: int) -> str:
+        payload: Dict[str, Any] = {
+            "columns": names,
+            "types": types,
+            "data": [column[:row_count] for column in columns],
+            "rows": total_rows
+        }
+        if row_count < total_rows:
+            payload["truncated"] = f"showing first {row_count} of {total_rows} rows"
+            payload["stats"] = {name: s.to_dict(precision) for name, s in stats.items() if s.count}
+        return json.dumps(payload, separators=(",", ":"), default=str)
+
+    encoded = build(kept_rows)
+    if len(encoded.encode("utf-8")) <= max_bytes:
+        return encoded
+
+    # Binary search for the largest row count that fits the byte budget
+    low, high = 0, kept_rows
+    while low < high:
+        mid = (low + high + 1) // 2
+        if len(build(mid).encode("utf-8")) <= max_bytes:
+            low = mid
+        else:
+            high = mid - 1
+    return build(low)
@@ -0,0 +1,210 @@
+"""
+Server-Side Session Store
+
+Instead of re-posting (and re-validating) the whole conversation on every
+turn, clients send {"session_id", "message"} and the server keeps the
+history. Recently used sessions live in an in-process LRU; every session is
+persisted in a durable backend so it survives restarts and LRU eviction.
+The backend is authoritative: before a cached history is used its length is
+checked against the backend, so turns appended by another worker process
+are fetched (only the missing tail is loaded) and a session reset elsewhere
+is reloaded.
+
+- SQLiteSessionBackend: local embedded database (default)
+- RedisSessionBackend: any Redis-compatible client (redis-py, fakeredis,
+  KeyDB, ...) exposing rpush/lrange/delete/expire
+
+Configuration (environment variables):
+    SESSION_BACKEND     "sqlite" (default) or "redis"
+    SESSION_DB_PATH     SQLite file (default: sessions.db)
+    SESSION_REDIS_URL   e.g. redis://localhost:6379/0
+    SESSION_TTL         seconds before an idle Redis session expires (default 7 days)
+    SESSION_CACHE_SIZE  sessions kept in memory (default 1000)
+
+Usage:
+    from sessions import session_store
+
+    history = session_store.get_history(session_id)
+    session_store.append(session_id, [user_message, assistant_message])
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1000"))
+
+Message = Dict[str, str]
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+class SQLiteSessionBackend:
+    """Durable session history in a local SQLite database"""
+
+    def __init__(self, path: str = SESSION_DB_PATH):
+        self.path = path
+        # Autocommit mode: append() manages its own BEGIN IMMEDIATE transaction
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS session_messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            )
+        """)
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str, start: int = 0) -> List[Message]:
+        """Messages of a session from position start on"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM session_messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                (session_id, start)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def length(self, session_id: str) -> int:
+        with self._lock:
+            (last,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) FROM session_messages WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+        return last + 1
+
+    def append(self, session_id: str, messages: List[Message]):
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock before the next seq is read,
+            # so appends from other processes cannot compute the same seq
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                (last,) = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq), -1) FROM session_messages WHERE session_id = ?",
+                    (session_id,)
+                ).fetchone()
+                self._conn.executemany(
+                    "INSERT INTO session_messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(session_id, last + 1 + i, m["role"], m["content"]) for i, m in enumerate(messages)]
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisSessionBackend:
+    """Session history in a Redis list per session (any Redis-compatible client)"""
+
+    def __init__(self, client: Any = None, url: str = SESSION_REDIS_URL, ttl: int = SESSION_TTL, prefix: str = "session:"):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def load(self, session_id: str, start: int = 0) -> List[Message]:
+        """Messages of a session from position start on"""
+        return [json.loads(item) for item in self.client.lrange(self.prefix + session_id, start, -1)]
+
+    def length(self, session_id: str) -> int:
+        return self.client.llen(self.prefix + session_id)
+
+    def append(self, session_id: str, messages: List[Message]):
+        key = self.prefix + session_id
+        self.client.rpush(key, *[json.dumps(m) for m in messages])
+        if self.ttl:
+            self.client.expire(key, self.ttl)
+
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+    def close(self):
+        close = getattr(self.client, "close", None)
+        if close:
+            close()
+
+
+class SessionStore:
+    """In-process LRU of session histories in front of a durable backend"""
+
+    def __init__(self, backend: Any = None, max_sessions: int = SESSION_CACHE_SIZE):
+        self._backend = backend
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, List[Message]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = RedisSessionBackend() if SESSION_BACKEND == "redis" else SQLiteSessionBackend()
+        return self._backend
+
+    def _cached(self, session_id: str) -> List[Message]:
+        # Caller holds the lock
+        history = self._sessions.get(session_id)
+        if history is None:
+            history = self.backend.load(session_id)
+            self._sessions[session_id] = history
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            # Other worker processes may have appended to or reset the session
+            length = self.backend.length(session_id)
+            if length > len(history):
+                history.extend(self.backend.load(session_id, start=len(history)))
+            elif length < len(history):
+                history[:] = self.backend.load(session_id)
+        self._sessions.move_to_end(session_id)
+        return history
+
+    def get_history(self, session_id: str) -> List[Message]:
+        """Copy of the stored conversation for this session (empty for new sessions)"""
+        with self._lock:
+            return list(self._cached(session_id))
+
+    def append(self, session_id: str, messages: List[Message]):
+        """Persist new messages and add them to the cached history"""
+        with self._lock:
+            history = self._cached(session_id)
+            self.backend.append(session_id, messages)
+            history.extend(messages)
+
+    def reset(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self.backend.delete(session_id)
+
+    def close(self):
+        with self._lock:
+            self._sessions.clear()
+            if self._backend is not None:
+                self._backend.close()
+                self._backend = None
+
+
+session_store = SessionStore()
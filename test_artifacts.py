@@ -0,0 +1,208 @@
+"""
+Tests for server-side artifact parsing.
+
+Run from the repository root:
+    python -m pytest -q test_artifacts.py
+"""
+
+import json
+import math
+
+import pytest
+
+from artifacts import (
+    ARTIFACT_END,
+    ARTIFACT_START,
+    ArtifactError,
+    StreamingArtifactParser,
+    build_chat_response,
+    format_sse,
+    parse_artifact,
+    split_segments
+)
+from downsampling import downsample_artifact, lttb_indices
+
+
+def make_artifact(title="Sales", points=(1, 2, 3)):
+    return {
+        "type": "artifact",
+        "artifact_type": "chart",
+        "title": title,
+        "description": "Monthly sales",
+        "data": {
+            "chart": {"type": "line"},
+            "series": [{"name": "Sales", "data": list(points)}]
+        }
+    }
+
+
+def wrap(artifact):
+    body = artifact if isinstance(artifact, str) else json.dumps(artifact, indent=2)
+    return f"{ARTIFACT_START}\n{body}\n{ARTIFACT_END}"
+
+
+def test_split_segments_extracts_every_artifact():
+    content = f"Intro text\n{wrap(make_artifact('A'))}\nBetween\n{wrap(make_artifact('B'))}\nOutro"
+
+    segments = split_segments(content)
+
+    assert [s["type"] for s in segments] == ["text", "artifact", "text", "artifact", "text"]
+    assert segments[0]["content"] == "Intro text"
+    assert segments[1]["artifact"]["title"] == "A"
+    assert segments[3]["artifact"]["title"] == "B"
+    assert segments[4]["content"] == "Outro"
+
+
+def test_plain_text_is_a_single_segment():
+    assert split_segments("Just an answer") == [{"type": "text", "content": "Just an answer"}]
+    assert build_chat_response("Hi")["response"] == "Hi"
+
+
+def test_malformed_artifacts_become_error_segments():
+    bad_json = wrap('{"type": "artifact", "data": {')
+    wrong_schema = wrap({"type": "artifact", "artifact_type": "table", "data": {}})
+    unterminated = f"Text {ARTIFACT_START} {{\"type\": \"artifact\""
+
+    segments = split_segments(f"{bad_json}\n{wrong_schema}\n{unterminated}")
+
+    assert [s["type"] for s in segments] == ["artifact_error", "artifact_error", "text", "artifact_error"]
+    assert segments[0]["error"].startswith("Invalid artifact JSON")
+    assert "artifact_type" in segments[1]["error"]
+    assert segments[3]["error"] == "Artifact is missing its end marker"
+
+
+@pytest.mark.parametrize("artifact", [
+    [],
+    {"type": "artifact", "artifact_type": "chart"},
+    {"type": "artifact", "artifact_type": "chart", "data": {"series": {}}},
+    {"type": "artifact", "artifact_type": "chart", "data": {"series": [{"data": 5}]}},
+])
+def test_parse_artifact_rejects_invalid_schema(artifact):
+    with pytest.raises(ArtifactError):
+        parse_artifact(json.dumps(artifact))
+
+
+def feed_all(chunks):
+    parser = StreamingArtifactParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.close())
+    return parser, events
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_streaming_parser_handles_markers_split_across_chunks(chunk_size):
+    content = f"Here is the chart:\n{wrap(make_artifact('A'))}\nAnd <<< more text."
+    chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+    parser, events = feed_all(chunks)
+
+    artifacts = [e for e in events if e["event"] == "artifact"]
+    text = "".join(e["data"]["text"] for e in events if e["event"] == "text_delta")
+    assert len(artifacts) == 1
+    assert artifacts[0]["data"]["artifact"]["title"] == "A"
+    assert text == "Here is the chart:\n\nAnd <<< more text."
+    assert parser.text == content
+
+
+def test_streaming_parser_forwards_prose_immediately():
+    parser = StreamingArtifactParser()
+
+    assert parser.feed("Hello ") == [{"event": "text_delta", "data": {"text": "Hello "}}]
+    # A possible marker prefix is held back until it is disambiguated
+    assert parser.feed("world <<<ART") == [{"event": "text_delta", "data": {"text": "world "}}]
+    assert parser.feed("IFACT_START>>>{") == []
+    assert parser.close()[0]["event"] == "artifact_error"
+
+
+def test_streaming_parser_reports_invalid_artifacts():
+    _, events = feed_all(["Text ", wrap("{not json}"), " end"])
+
+    assert [e["event"] for e in events] == ["text_delta", "artifact_error", "text_delta"]
+    assert events[1]["data"]["error"].startswith("Invalid artifact JSON")
+
+
+def test_format_sse():
+    event = {"event": "text_delta", "data": {"text": "a\nb"}}
+    assert format_sse(event) == 'event: text_delta\ndata: {"text":"a\\nb"}\n\n'
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    points = [(float(i), 0.0) for i in range(1000)]
+    points[500] = (500.0, 100.0)
+
+    indices = lttb_indices(points, 50)
+
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert 500 in indices
+    assert indices == sorted(indices)
+
+
+def test_downsample_line_series_with_categories_stays_aligned():
+    n = 5000
+    artifact = make_artifact(points=[math.sin(i / 100) for i in range(n)])
+    artifact["data"]["xAxis"] = {"categories": [f"d{i}" for i in range(n)]}
+    artifact["data"]["series"].append({"name": "Limit", "data": [1.0] * n})
+
+    downsample_artifact(artifact, budget=200)
+
+    categories = artifact["data"]["xAxis"]["categories"]
+    series = artifact["data"]["series"]
+    assert len(categories) <= 200
+    assert all(len(s["data"]) == len(categories) for s in series)
+    first = int(categories[10][1:])
+    assert series[0]["data"][10] == math.sin(first / 100)
+    report = artifact["metadata"]["downsampling"]
+    assert report["point_budget"] == 200
+    assert [r["original_points"] for r in report["series"]] == [n, n]
+
+
+def test_downsample_many_aligned_series_stays_within_budget():
+    n, budget = 5000, 100
+    artifact = make_artifact(points=[math.sin(i / 50) for i in range(n)])
+    artifact["data"]["xAxis"] = {"categories": [f"d{i}" for i in range(n)]}
+    for k in range(1, 5):
+        artifact["data"]["series"].append({"name": f"S{k}", "data": [math.cos(i / (20 * k)) for i in range(n)]})
+
+    downsample_artifact(artifact, budget=budget)
+
+    categories = artifact["data"]["xAxis"]["categories"]
+    assert len(categories) <= budget
+    for series in artifact["data"]["series"]:
+        assert len(series["data"]) == len(categories)
+        assert len(series["data"]) <= budget
+    assert categories[0] == "d0" and categories[-1] == f"d{n - 1}"
+
+
+def test_downsample_column_series_uses_buckets():
+    artifact = make_artifact(points=list(range(1000)))
+    artifact["data"]["chart"]["type"] = "column"
+
+    downsample_artifact(artifact, budget=100)
+
+    series = artifact["data"]["series"][0]
+    assert len(series["data"]) == 100
+    assert series["data"][0] == 4.5
+    assert series["pointInterval"] == 10
+    assert artifact["metadata"]["downsampling"]["series"][0]["method"] == "bucket_mean"
+
+
+def test_downsample_line_series_makes_x_explicit():
+    artifact = make_artifact(points=[float(i % 7) for i in range(3000)])
+    artifact["data"]["series"][0]["pointStart"] = 100
+
+    downsample_artifact(artifact, budget=300)
+
+    data = artifact["data"]["series"][0]["data"]
+    assert len(data) == 300
+    assert data[0] == [100, 0.0]
+    assert all(y == float((x - 100) % 7) for x, y in data)
+
+
+def test_small_artifacts_are_untouched():
+    artifact = make_artifact()
+    segments = split_segments(wrap(artifact))
+    assert segments[0]["artifact"] == artifact
+    assert "metadata" not in segments[0]["artifact"]
@@ -0,0 +1,152 @@
+"""
+Concurrency tests for the async backend endpoints.
+
+A fake model sleeps asynchronously for DELAY seconds per call. If handlers
+block the event loop, N concurrent requests take N * DELAY; when they run
+concurrently they finish in roughly one DELAY.
+
+Run from the repository root:
+    python -m pytest -q test_backend_concurrency.py
+"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("langchain_core")
+httpx = pytest.importorskip("httpx")
+
+import backend_langchain
+from langchain_core.messages import AIMessage
+
+
+DELAY = 0.5
+CONCURRENT_REQUESTS = 10
+
+
+class SlowFakeLLM:
+    async def ainvoke(self, messages):
+        await asyncio.sleep(DELAY)
+        return AIMessage(content="ok")
+
+
+class FakeDuckDBAgent:
+    """Stands in for the tool-calling agent: every run makes one distinct duckdb_query call"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        # Distinct SQL so the query cache cannot answer
+        result = await backend_langchain.duckdb_query.ainvoke({"sql": f"SELECT {self.calls} AS agent_call"})
+        return {"output": "ok" if result == "[(1,)]" else result}
+
+
+def blocking_query(sql):
+    time.sleep(DELAY)
+    return "[(1,)]"
+
+
+async def _post_concurrently(path: str, count: int = CONCURRENT_REQUESTS) -> float:
+    transport = httpx.ASGITransport(app=backend_langchain.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        payload = {"messages": [{"role": "user", "content": "Hello"}]}
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post(path, json=payload) for _ in range(count)
+        ])
+        elapsed = time.perf_counter() - start
+
+    assert all(r.status_code == 200 for r in responses)
+    assert all(r.json()["response"] == "ok" for r in responses)
+    return elapsed
+
+
+@pytest.mark.parametrize("path", ["/chat", "/chat-claude"])
+def test_chat_requests_overlap(monkeypatch, path):
+    monkeypatch.setattr(backend_langchain, "get_llm", lambda *args, **kwargs: SlowFakeLLM())
+
+    elapsed = asyncio.run(_post_concurrently(path))
+
+    # Serialized handlers would need CONCURRENT_REQUESTS * DELAY seconds
+    assert elapsed < DELAY * 3
+
+
+def test_chat_with_tools_requests_overlap(monkeypatch):
+    monkeypatch.setattr(backend_langchain, "get_agent_executor", lambda: FakeDuckDBAgent())
+    monkeypatch.setattr(backend_langchain, "run_duckdb_query", blocking_query)
+
+    elapsed = asyncio.run(_post_concurrently("/chat-with-tools", backend_langchain.DUCKDB_MAX_WORKERS))
+
+    # Each request blocks a pool thread for DELAY; serialized they would need DUCKDB_MAX_WORKERS * DELAY
+    assert elapsed < DELAY * 2
+
+
+def test_duckdb_pool_is_recreated_for_each_lifespan(monkeypatch):
+    monkeypatch.setattr(backend_langchain, "run_duckdb_query", lambda sql: "[(1,)]")
+
+    async def run_lifespans():
+        results = []
+        for i in range(2):
+            async with backend_langchain.lifespan(backend_langchain.app):
+                results.append(await backend_langchain.duckdb_query.ainvoke({"sql": f"SELECT {i} AS lifespan"}))
+            assert backend_langchain.db_executor is None
+        return results
+
+    assert asyncio.run(run_lifespans()) == ["[(1,)]", "[(1,)]"]
+
+
+def test_agent_executor_is_rebuilt_for_each_lifespan(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    llms = []
+
+    def recording_get_llm(*args, **kwargs):
+        llms.append(backend_langchain.registry.get(*args, **kwargs))
+        return llms[-1]
+
+    monkeypatch.setattr(backend_langchain, "get_llm", recording_get_llm)
+
+    async def run_lifespans():
+        for _ in range(2):
+            async with backend_langchain.lifespan(backend_langchain.app):
+                backend_langchain.get_agent_executor()
+                assert not llms[-1].http_async_client.is_closed
+            assert backend_langchain._agent_executor is None
+
+    asyncio.run(run_lifespans())
+    first, second = llms
+    assert first is not second
+    assert first.http_async_client.is_closed
+
+
+def test_duckdb_tool_runs_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(backend_langchain, "run_duckdb_query", blocking_query)
+
+    async def run_queries():
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.05)
+                ticks += 1
+
+        beat = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            backend_langchain.duckdb_query.ainvoke({"sql": "SELECT 1"})
+            for _ in range(backend_langchain.DUCKDB_MAX_WORKERS)
+        ])
+        elapsed = time.perf_counter() - start
+        beat.cancel()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(run_queries())
+
+    assert results == ["[(1,)]"] * backend_langchain.DUCKDB_MAX_WORKERS
+    assert elapsed < DELAY * 2
+    # The event loop kept running while the queries blocked their threads
+    assert ticks >= 5
@@ -0,0 +1,79 @@
+"""
+Tests for binding requests to per-tenant memory stores.
+
+Run from the repository root:
+    python -m pytest -q test_backend_tenants.py
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("langchain_core")
+httpx = pytest.importorskip("httpx")
+
+import backend_langchain
+import knowledge_store
+from fastapi.responses import JSONResponse
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    shared = knowledge_store.open_store(str(tmp_path / "shared"))
+    previous = knowledge_store._store
+    knowledge_store.set_store(shared)
+    tenants = knowledge_store.TenantStores(str(tmp_path))
+    monkeypatch.setattr(knowledge_store, "tenant_stores", tenants)
+    yield shared, tenants
+    tenants.close()
+    knowledge_store.set_store(previous)
+    shared.close()
+
+
+async def store_app(scope, receive, send):
+    # Reports which store the memory tools would use for this request
+    store = knowledge_store.get_store()
+    await JSONResponse({
+        "tenant": knowledge_store.current_tenant.get(),
+        "knowledge_dir": store.knowledge_dir
+    })(scope, receive, send)
+
+
+def get(app, headers=None):
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/", headers=headers)
+
+    return asyncio.run(request())
+
+
+def test_tenant_header_binds_the_tenant_store(stores):
+    shared, tenants = stores
+    app = backend_langchain.KnowledgeTenantMiddleware(store_app, header="X-User-ID")
+
+    response = get(app, {"X-User-ID": "alice"})
+    assert response.status_code == 200
+    assert response.json() == {"tenant": "alice", "knowledge_dir": knowledge_store.tenant_dir("alice", tenants.knowledge_dir)}
+    # The scope ends with the request
+    assert knowledge_store.current_tenant.get() is None
+
+    response = get(app)
+    assert response.json() == {"tenant": None, "knowledge_dir": shared.knowledge_dir}
+
+
+def test_invalid_tenant_id_is_rejected(stores):
+    app = backend_langchain.KnowledgeTenantMiddleware(store_app, header="X-User-ID")
+
+    response = get(app, {"X-User-ID": "../etc"})
+    assert response.status_code == 400
+    assert "Invalid tenant id" in response.json()["error"]
+
+
+def test_tenant_header_is_ignored_unless_enabled(stores):
+    shared, _ = stores
+    app = backend_langchain.KnowledgeTenantMiddleware(store_app, header="")
+
+    response = get(app, {"X-User-ID": "alice"})
+    assert response.json() == {"tenant": None, "knowledge_dir": shared.knowledge_dir}
@@ -0,0 +1,180 @@
+"""
+Tests for the DuckDB helpers behind the duckdb_query agent tool.
+
+Run from the repository root:
+    python -m pytest -q test_duckdb_tools.py
+"""
+
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from duckdb_manager import DuckDBConnectionManager
+from query_cache import QueryCache, normalize_sql
+from result_encoder import encode_result
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    conn = duckdb.connect(path)
+    conn.execute("""
+        CREATE TABLE risks AS
+        SELECT i AS id,
+               CASE WHEN i % 2 = 0 THEN 'Credit' ELSE 'Market' END AS category,
+               i * 1.5 AS exposure
+        FROM range(100) t(i)
+    """)
+    conn.close()
+    return path
+
+
+def test_manager_reuses_one_cursor_per_thread(db_path):
+    manager = DuckDBConnectionManager(db_path, threads=2, memory_limit="256MB")
+
+    def total(_):
+        return manager.cursor().execute("SELECT COUNT(*) FROM risks").fetchone()[0]
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(total, range(12)))
+
+    assert results == [100] * 12
+    assert len(manager._cursors) <= 3
+    assert manager.cursor() is manager.cursor()
+    manager.close()
+
+
+def test_manager_is_read_only_and_closes(db_path):
+    manager = DuckDBConnectionManager(db_path)
+
+    with pytest.raises(duckdb.Error):
+        manager.cursor().execute("DELETE FROM risks")
+
+    manager.close()
+    assert manager._conn is None
+    # Reopens lazily after close
+    assert manager.cursor().execute("SELECT 1").fetchone() == (1,)
+    manager.close()
+
+
+def test_encode_result_is_column_oriented(db_path):
+    conn = duckdb.connect(db_path, read_only=True)
+    conn.execute("SELECT category, SUM(exposure) / 3.7 AS total FROM risks GROUP BY category ORDER BY category")
+
+    encoded = json.loads(encode_result(conn, precision=2))
+
+    assert encoded["columns"] == ["category", "total"]
+    assert encoded["data"] == [["Credit", "Market"], [993.24, 1013.51]]
+    assert encoded["rows"] == 2
+    assert "truncated" not in encoded
+    conn.close()
+
+
+@pytest.mark.parametrize("use_arrow", [True, False])
+def test_encode_result_enforces_budgets(db_path, monkeypatch, use_arrow):
+    if use_arrow:
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+    conn = duckdb.connect(db_path, read_only=True)
+    conn.execute("SELECT id, exposure FROM risks ORDER BY id")
+    encoded_text = encode_result(conn, max_rows=50, max_bytes=300)
+    encoded = json.loads(encoded_text)
+
+    assert len(encoded_text) <= 300
+    assert encoded["rows"] == 100
+    kept = len(encoded["data"][0])
+    assert 0 < kept < 50
+    assert encoded["data"][0] == list(range(kept))
+    assert encoded["truncated"] == f"showing first {kept} of 100 rows"
+    assert encoded["stats"]["exposure"] == {"min": 0.0, "max": 148.5, "mean": 74.25}
+    conn.close()
+
+
+def test_encode_result_types_do_not_depend_on_pyarrow(monkeypatch):
+    pytest.importorskip("pyarrow")
+    sql = """
+        SELECT 1::INTEGER AS i, 2::BIGINT AS b, 1.5::DOUBLE AS d, 1.5::DECIMAL(10, 2) AS n,
+               'x' AS s, true AS f, DATE '2024-01-01' AS day, TIMESTAMP '2024-01-01 10:00' AS ts,
+               [1, 2] AS l, NULL::INTEGER AS missing
+    """
+
+    def types():
+        conn = duckdb.connect()
+        conn.execute(sql)
+        encoded = json.loads(encode_result(conn))
+        conn.close()
+        return encoded["types"]
+
+    with_arrow = types()
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    without_arrow = types()
+
+    assert with_arrow == without_arrow == [
+        "int32", "int64", "double", "decimal", "string", "bool", "date", "timestamp", "list<int32>", "int32"
+    ]
+
+
+def test_normalize_sql_keeps_literals():
+    assert normalize_sql("SELECT  *\n FROM risks WHERE category = 'Credit';") == \
+        normalize_sql("select * from risks where category = 'Credit'")
+    assert normalize_sql("SELECT 'A  B'") != normalize_sql("SELECT 'a b'")
+    assert normalize_sql("SELECT $$A$$") != normalize_sql("SELECT $$a$$")
+    assert normalize_sql("SELECT $t$A -- $$ $t$") != normalize_sql("SELECT $t$a -- $$ $t$")
+    assert normalize_sql("SELECT 'A") != normalize_sql("SELECT 'a")
+
+
+def test_normalize_sql_drops_comments():
+    # A line comment ends at the newline; what follows is still part of the query
+    assert normalize_sql("SELECT 1 -- x\n+1") != normalize_sql("SELECT 1 -- x +1")
+    assert normalize_sql("SELECT 1 -- x\n+1") == normalize_sql("select 1 +1")
+    assert normalize_sql("SELECT 1 /* one */ + 1; -- done") == normalize_sql("select 1 + 1")
+    assert normalize_sql("SELECT '-- not a comment'") == "select '-- not a comment'"
+
+
+def test_query_cache_hits_and_invalidates_on_data_change(db_path):
+    cache = QueryCache(db_path, max_entries=2, ttl=60)
+
+    assert cache.get("SELECT 1") is None
+    version = cache.data_version()
+    cache.put("SELECT 1", "one", version)
+    assert cache.get("select 1;") == "one"
+
+    cache.put("SELECT 2", "two")
+    cache.put("SELECT 3", "three")
+    # LRU eviction keeps the cache bounded
+    assert cache.get("SELECT 1") is None
+    assert cache.get("SELECT 3") == "three"
+
+    conn = duckdb.connect(db_path)
+    conn.execute("INSERT INTO risks VALUES (1000, 'Credit', 1.0)")
+    conn.close()
+    assert cache.get("SELECT 3") is None
+
+    cache.put("SELECT 3", "three")
+    cache.bump_table_version("risks")
+    assert cache.get("SELECT 3") is None
+
+    # Results computed against data that changed meanwhile are not cached
+    cache.put("SELECT 4", "four", version)
+    assert cache.get("SELECT 4") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 5
+    assert stats["invalidations"] == 2
+
+
+def test_query_cache_expires_entries(db_path, monkeypatch):
+    cache = QueryCache(db_path, ttl=10)
+    now = [1000.0]
+    monkeypatch.setattr("query_cache.time.monotonic", lambda: now[0])
+
+    cache.put("SELECT 1", "one")
+    now[0] += 11
+    assert cache.get("SELECT 1") is None
@@ -0,0 +1,87 @@
+"""
+Tests for token-budgeted history windowing.
+
+Run from the repository root:
+    python -m pytest -q test_history.py
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import history
+from history import HistoryManager
+
+
+@pytest.fixture(autouse=True)
+def simple_token_count(monkeypatch):
+    # One token per word keeps the budgets in these tests easy to follow
+    monkeypatch.setattr(history, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(history, "MESSAGE_OVERHEAD_TOKENS", 0)
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, summary, messages):
+        self.calls.append((summary, [m["content"] for m in messages]))
+        return (summary + " | " if summary else "") + ",".join(m["content"].split()[0] for m in messages)
+
+
+def conversation(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"u{i} " + "word " * 9})
+        messages.append({"role": "assistant", "content": f"a{i} " + "word " * 9})
+    return messages
+
+
+def test_short_history_is_sent_verbatim():
+    summarizer = RecordingSummarizer()
+    manager = HistoryManager(budget=100, summarize=summarizer)
+
+    prepared = asyncio.run(manager.prepare(conversation(2)))
+
+    assert [type(m) for m in prepared] == [HumanMessage, AIMessage, HumanMessage, AIMessage]
+    assert summarizer.calls == []
+
+
+def test_long_history_is_summarized_within_budget():
+    summarizer = RecordingSummarizer()
+    manager = HistoryManager(budget=60, recent_ratio=0.5, summarize=summarizer)
+    messages = conversation(5)
+
+    summary, recent = asyncio.run(manager.window(messages))
+
+    assert sum(len(m["content"].split()) for m in recent) <= 30
+    assert recent[-1] == messages[-1]
+    assert summary == "u0,a0,u1,a1,u2,a2,u3"
+    prepared = asyncio.run(manager.prepare(messages))
+    assert isinstance(prepared[0], SystemMessage)
+    assert len(summarizer.calls) == 1
+
+
+def test_summaries_are_reused_and_updated_incrementally():
+    summarizer = RecordingSummarizer()
+    manager = HistoryManager(budget=60, recent_ratio=0.5, summarize=summarizer)
+    messages = conversation(5)
+    asyncio.run(manager.window(messages))
+
+    # The next turn still fits after the cached cut: no new summary
+    messages += conversation(6)[10:11]
+    asyncio.run(manager.window(messages))
+    assert len(summarizer.calls) == 1
+
+    # Once the window overflows, only the newly dropped turns are summarized
+    messages += conversation(8)[11:16]
+    summary, recent = asyncio.run(manager.window(messages))
+    assert len(summarizer.calls) == 2
+    previous, new_turns = summarizer.calls[1]
+    assert previous == "u0,a0,u1,a1,u2,a2,u3"
+    assert new_turns[0].startswith("a3")
+    assert summary.startswith(previous)
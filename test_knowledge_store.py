@@ -0,0 +1,643 @@
+"""
+Tests for the knowledge memory stores and the memory tools built on them.
+
+Run from the repository root:
+    python -m pytest -q test_knowledge_store.py
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+import knowledge_store
+from knowledge_store import AccessCountBuffer, JsonKnowledgeStore, SQLiteKnowledgeStore, migrate_json_to_sqlite
+from memory_content import PackedContentStore
+from memory_dedup import MinHashIndex
+from memory_search import MemorySearchIndex, ShardedSearchIndex
+from tools import manage_memory, read_memory_file, search_memory_index
+
+
+@pytest.fixture(params=[("json", "files"), ("sqlite", "files"), ("json", "packed")], ids=lambda p: "-".join(p))
+def store(request, tmp_path):
+    store = knowledge_store.open_store(str(tmp_path), *request.param)
+    previous = knowledge_store._store
+    knowledge_store.set_store(store)
+    yield store
+    knowledge_store.set_store(previous)
+    store.close()
+
+
+def create(content, summary, category="user_profile", tags="preferences"):
+    return manage_memory.invoke({
+        "action": "create", "content": content, "category": category,
+        "tags": tags, "summary": summary
+    })
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class PartialStore(knowledge_store.KnowledgeStore):
+        def increment_access(self, counts):
+            pass
+
+    with pytest.raises(TypeError, match="_batch_commit"):
+        PartialStore()
+
+
+def test_create_read_update_retire(store):
+    assert "Created MEMORY-001" in create("User prefers dark mode charts", "Dark mode chart preference")
+    assert "Created MEMORY-002" in create("Loans table is partitioned by month", "Loans partitioning",
+                                         category="technical_knowledge", tags="schema")
+
+    text = read_memory_file.invoke({"memory_id": "MEMORY-001"})
+    assert "User prefers dark mode charts" in text
+    store.access.flush()
+    assert store.get("MEMORY-001")["access_count"] == 1
+
+    manage_memory.invoke({"action": "update", "memory_id": "MEMORY-001", "tags": "ui, charts"})
+    assert store.get("MEMORY-001")["tags"] == ["ui", "charts"]
+
+    manage_memory.invoke({"action": "retire", "memory_id": "MEMORY-002"})
+    assert [m["memory_id"] for m in store.list(status="active")] == ["MEMORY-001"]
+    assert [m["memory_id"] for m in store.list(status="retired")] == ["MEMORY-002"]
+    assert store.load_index()["metadata"]["total_memories"] == 1
+
+
+def test_search_filters_and_counts_access(store):
+    create("User prefers dark mode charts", "Dark mode chart preference")
+    create("Loans table is partitioned by month", "Loans partitioning",
+           category="technical_knowledge", tags="schema")
+
+    result = json.loads(search_memory_index.invoke({"query": "loans", "category": "technical_knowledge"}))
+    assert [r["memory_id"] for r in result["results"]] == ["MEMORY-002"]
+    assert result["results"][0]["access_count"] == 1
+    # Reads are buffered, not written through
+    assert store.get("MEMORY-002")["access_count"] == 0
+    store.access.flush()
+    assert store.get("MEMORY-002")["access_count"] == 1
+
+
+def test_access_buffer_flushes_by_count():
+    flushed = []
+    buffer = AccessCountBuffer(flushed.append, interval=0, max_pending=3)
+    buffer.add(["MEMORY-001", "MEMORY-002"])
+    assert flushed == [] and buffer.pending("MEMORY-001") == 1
+    buffer.add(["MEMORY-001"])
+    assert flushed == [{"MEMORY-001": 2, "MEMORY-002": 1}]
+    buffer.add(["MEMORY-003"])
+    buffer.close()
+    assert flushed[-1] == {"MEMORY-003": 1}
+    buffer.add(["MEMORY-004"])
+    assert buffer.pending("MEMORY-004") == 0
+
+
+def test_consolidate(store):
+    create("User prefers dark mode charts", "Dark mode chart preference")
+    create("Loans table is partitioned by month", "Loans partitioning")
+    result = manage_memory.invoke({
+        "action": "consolidate", "memory_id": "MEMORY-001,MEMORY-002",
+        "content": "Merged notes", "summary": "Merged notes"
+    })
+    assert "MEMORY-003" in result
+    assert [m["memory_id"] for m in store.list(status="active")] == ["MEMORY-003"]
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    source = JsonKnowledgeStore(str(tmp_path))
+    source.put({"memory_id": "MEMORY-001", "file_path": "memory-001.md", "category": "user_profile",
+                "tags": ["a", "b"], "summary": "First", "confidence": 0.8, "access_count": 3,
+                "status": "active", "created": "2025-01-01T00:00:00Z", "updated": "2025-01-02T00:00:00Z"})
+    source.allocate_id()
+    source.allocate_id()
+
+    assert migrate_json_to_sqlite(str(tmp_path)) == 1
+
+    target = SQLiteKnowledgeStore(str(tmp_path))
+    assert target.get("MEMORY-001") == source.get("MEMORY-001")
+    assert target.allocate_id() == 3
+    target.close()
+
+
+def test_search_index_bm25(tmp_path):
+    path = str(tmp_path / "search_index.json")
+    index = MemorySearchIndex(path)
+    index.upsert({"memory_id": "M1", "category": "user_profile", "tags": ["charts"], "summary": "Chart colours", "status": "active"})
+    index.upsert({"memory_id": "M2", "category": "technical_knowledge", "tags": ["art"], "summary": "Art table schema", "status": "active"})
+    index.upsert({"memory_id": "M3", "category": "technical_knowledge", "tags": [], "summary": "Schema notes", "status": "active"})
+
+    # Whole-word matching: "art" no longer matches "chart"
+    assert [m for m, _ in index.search("art")] == ["M2"]
+    # Rarer terms weigh more: M2 matches both terms, M3 only the common one
+    assert [m for m, _ in index.search("art schema")] == ["M2", "M3"]
+
+    index.upsert({"memory_id": "M2", "category": "technical_knowledge", "tags": ["art"], "summary": "Art table schema", "status": "retired"})
+    assert index.search("art") == []
+    assert [m for m, _ in index.search("art", status="retired")] == ["M2"]
+
+    reloaded = MemorySearchIndex(path)
+    assert reloaded.load()
+    assert reloaded.search("schema notes", status="all") == index.search("schema notes", status="all")
+
+
+def test_search_index_rank_boosts(tmp_path):
+    index = MemorySearchIndex(str(tmp_path / "search_index.json"))
+    now = 1_750_000_000.0
+    memory = {"category": "technical_knowledge", "tags": [], "summary": "Loans schema", "status": "active"}
+    index.upsert({**memory, "memory_id": "M1", "confidence": 1.0, "access_count": 0, "updated": "2000-01-01T00:00:00Z"})
+    index.upsert({**memory, "memory_id": "M2", "confidence": 0.5, "access_count": 0, "updated": None})
+    index.upsert({**memory, "memory_id": "M3", "confidence": 0.5, "access_count": 10})
+
+    rows, relevance = index.bm25("loans")
+    ranked = dict(index.rank(rows, relevance, limit=3, now=now))
+    bm25 = dict(index.search("loans"))
+    assert ranked["M1"] == pytest.approx(bm25["M1"])
+    assert ranked["M2"] == pytest.approx(bm25["M2"] * 0.5)
+    assert ranked["M3"] == pytest.approx(bm25["M3"] * 0.5 + 1.0)
+
+    # Partial top-k, buffered and flushed access counts
+    assert [m for m, _ in index.rank(rows, relevance, limit=1, now=now)] == ["M3"]
+    assert [m for m, _ in index.rank(rows, relevance, limit=1, pending_access={"M2": 20}, now=now)] == ["M2"]
+    index.apply_access({"M1": 30})
+    assert [m for m, _ in index.rank(rows, relevance, limit=1, now=now)] == ["M1"]
+
+    # Recency: half a year old earns half the boost
+    updated = "2025-06-15T00:00:00+00:00"
+    index.upsert({**memory, "memory_id": "M4", "confidence": 0.0, "updated": updated})
+    rows, relevance = index.bm25("loans")
+    half_year_later = datetime.fromisoformat(updated).timestamp() + 182.5 * 86400
+    assert dict(index.rank(rows, relevance, limit=4, now=half_year_later))["M4"] == pytest.approx(0.5 * (1 - 182 / 365))
+
+
+def test_search_index_writes_deltas_and_compacts(tmp_path):
+    path = str(tmp_path / "search_index.json")
+    memory = {"category": "technical_knowledge", "tags": [], "status": "active"}
+    index = MemorySearchIndex.open(path, lambda: [{**memory, "memory_id": "M1", "summary": "Loans schema"}], seq=1)
+    with open(path, 'rb') as f:
+        snapshot = f.read()
+
+    # A change is appended to the log; the snapshot is not rewritten
+    index.apply([{**memory, "memory_id": "M2", "summary": "Loans partitions"}], seq=2)
+    with open(path, 'rb') as f:
+        assert f.read() == snapshot
+    reloaded = MemorySearchIndex(path)
+    assert reloaded.load() and reloaded.seq == 2
+    assert reloaded.search("loans") == index.search("loans")
+
+    # Once the log outgrows the snapshot, the snapshot is rewritten and the log dropped
+    index._log.min_bytes = 0
+    index.apply([{**memory, "memory_id": f"M{i}", "summary": f"Loans note {i}"} for i in range(3, 30)], seq=3)
+    assert not os.path.exists(index._log.path)
+    reloaded = MemorySearchIndex(path)
+    assert reloaded.load() and reloaded.seq == 3 and len(reloaded) == 29
+
+
+def test_delta_log_replays_only_continuous_changes(tmp_path):
+    from delta_log import DeltaLog
+
+    log = DeltaLog(str(tmp_path / "index.json"))
+    log.append(1, 2, {"M1": 2})
+    log.append(1, 2, {"M1": 2})  # the same change applied by another process
+    log.append(2, 4, {"M1": 4})
+    log.append(3, 4, {"M1": 4})  # a late duplicate
+    log.append(5, 6, {"M1": 6})  # 4 -> 5 is missing
+    with open(log.path, 'ab') as f:
+        f.write(b'{"base": 6, "se')  # torn by a crashed writer
+
+    assert list(log.replay(1)) == [(2, {"M1": 2}), (4, {"M1": 4})]
+    assert list(log.replay(5)) == [(6, {"M1": 6})]
+    log.clear()
+    assert list(log.replay(1)) == []
+
+
+def test_sharded_search_index(tmp_path, monkeypatch):
+    directory = str(tmp_path / "search_index")
+    memories = [
+        {"memory_id": "M1", "category": "user_profile", "tags": ["charts"], "summary": "Chart colours", "status": "active"},
+        {"memory_id": "M2", "category": "technical_knowledge", "tags": ["schema"], "summary": "Loans schema", "status": "active"},
+        {"memory_id": "M3", "category": "technical_knowledge", "tags": [], "summary": "Schema notes", "status": "active"},
+        {"memory_id": "M4", "category": "my custom/area", "tags": [], "summary": "Loans chart", "status": "active"},
+    ]
+    load = lambda category: [m for m in memories if category is None or m["category"] == category]
+    ShardedSearchIndex.open(directory, load, seq=1)
+    flat = MemorySearchIndex()
+    flat.rebuild(memories, persist=False)
+
+    # Unfiltered searches score with corpus-wide statistics, like one index
+    index = ShardedSearchIndex.open(directory, load, seq=1)
+    assert index.search("loans chart schema") == flat.search("loans chart schema")
+    assert len(index) == 4 and len(index.categories) == 3
+
+    # A category search and a write touch a single shard file
+    index = ShardedSearchIndex.open(directory, load, seq=1)
+    loaded = []
+    real_load = MemorySearchIndex.load
+    monkeypatch.setattr(MemorySearchIndex, "load", lambda self: loaded.append(os.path.basename(self.path)) or real_load(self))
+    assert [m for m, _ in index.search("schema", category="technical_knowledge")] == ["M2", "M3"]
+    index.apply([{**memories[1], "summary": "Loans table"}], seq=2)
+    assert len(loaded) == 1 and loaded[0].startswith("technical_knowledge-")
+    rows, scores = index.bm25("loans", category="technical_knowledge")
+    assert [m for m, _ in index.rank(rows, scores, limit=5)] == ["M2"]
+
+    # Moving a memory to another category (tombstone, then new version)
+    index.apply([{**memories[1], "status": "archived"}, {**memories[1], "category": "facts"}], seq=3)
+    reopened = ShardedSearchIndex.open(directory, load, seq=3)
+    assert [m for m, _ in reopened.search("loans", category="facts")] == ["M2"]
+    assert reopened.search("loans", category="technical_knowledge") == []
+    assert sorted(m for m, _ in reopened.search("loans")) == ["M2", "M4"]
+
+
+def test_json_store_serves_cached_index(tmp_path, monkeypatch):
+    store = JsonKnowledgeStore(str(tmp_path), recheck_interval=60)
+    store.put({"memory_id": "MEMORY-001", "file_path": "memory-001.md", "summary": "First", "status": "active"})
+
+    def no_disk(*args, **kwargs):
+        raise AssertionError("index read from disk")
+
+    monkeypatch.setattr("builtins.open", no_disk)
+    monkeypatch.setattr("os.stat", no_disk)
+    for _ in range(3):
+        assert store.get("MEMORY-001")["summary"] == "First"
+        assert len(store.list(status="active")) == 1
+    monkeypatch.undo()
+
+    # Entries handed out are copies; editing one does not touch the cache
+    store.get("MEMORY-001")["summary"] = "Changed"
+    assert store.get("MEMORY-001")["summary"] == "First"
+
+    # Another process rewriting the file is picked up once the interval passes
+    other = JsonKnowledgeStore(str(tmp_path))
+    other.put({"memory_id": "MEMORY-002", "file_path": "memory-002.md", "summary": "Second", "status": "active"})
+    store.recheck_interval = 0
+    version = store.version
+    assert store.get("MEMORY-002")["summary"] == "Second"
+    assert store.version > version
+
+
+def _concurrent_writer(knowledge_dir, worker, count):
+    store = JsonKnowledgeStore(knowledge_dir, recheck_interval=0, compact_every=7)
+    for i in range(count):
+        memory_id = f"MEMORY-{store.allocate_id():03d}"
+        store.put({"memory_id": memory_id, "file_path": f"{memory_id.lower()}.md",
+                   "summary": f"worker {worker} note {i}", "status": "active"})
+        store.increment_access({"MEMORY-001": 1})
+    store.close()
+
+
+def test_json_journal_concurrent_writers(tmp_path):
+    multiprocessing = pytest.importorskip("multiprocessing")
+    pytest.importorskip("fcntl")
+    workers = [
+        multiprocessing.Process(target=_concurrent_writer, args=(str(tmp_path), w, 10))
+        for w in range(4)
+    ]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+        assert p.exitcode == 0
+
+    store = JsonKnowledgeStore(str(tmp_path))
+    memories = store.list()
+    assert len(memories) == 40
+    assert len({m["memory_id"] for m in memories}) == 40
+    assert store.get("MEMORY-001")["access_count"] == 40
+    assert store.allocate_id() == 41
+
+
+def test_json_journal_compaction_and_recovery(tmp_path):
+    store = JsonKnowledgeStore(str(tmp_path), compact_every=3)
+    for i in range(1, 5):
+        store.put({"memory_id": f"M{i}", "summary": f"note {i}", "status": "active"})
+    # Three records were folded into the snapshot, one is still in the journal
+    with open(store.journal_path, "rb") as f:
+        assert len(f.read().splitlines()) == 1
+    snapshot = json.load(open(store.index_path))
+    assert [m["memory_id"] for m in snapshot["memories"]] == ["M1", "M2", "M3"]
+
+    # A torn last line (crash mid-append) is ignored and cut off on the next write
+    with open(store.journal_path, "ab") as f:
+        f.write(b'{"seq": 99, "op": "upd')
+    reader = JsonKnowledgeStore(str(tmp_path))
+    assert [m["memory_id"] for m in reader.list()] == ["M1", "M2", "M3", "M4"]
+    reader.increment_access({"M4": 2})
+    reader.compact()
+
+    # Replaying records the snapshot already holds (crash before truncation) is a no-op
+    with open(store.journal_path, "wb") as f:
+        f.write(json.dumps({"seq": 5, "ts": "x", "op": "access", "counts": {"M4": 2}}).encode() + b"\n")
+    assert JsonKnowledgeStore(str(tmp_path)).get("M4")["access_count"] == 2
+
+
+def test_packed_content_read_after_compaction_elsewhere(tmp_path):
+    writer = PackedContentStore(str(tmp_path))
+    writer.write_many([("M1", "first"), ("M2", "second"), ("M3", "third")])
+    writer.write("M1", "first, updated")
+    reader = PackedContentStore(str(tmp_path), recheck_interval=0)
+    assert [reader.read(m) for m in ("M1", "M2", "M3")] == ["first, updated", "second", "third"]
+
+    # Another instance compacts: the pack is replaced and every offset moves
+    PackedContentStore(str(tmp_path)).compact(drop={"M2"})
+    assert reader.read("M2") is None
+    assert reader.read("M3") == "third"
+    assert reader.read("M1") == "first, updated"
+
+
+def test_packed_content_store(tmp_path):
+    writer = PackedContentStore(str(tmp_path))
+    writer.write_many([("M1", "first"), ("M2", "second ✓")])
+    writer.write("M1", "first, updated")
+    reader = PackedContentStore(str(tmp_path), recheck_interval=60)
+    assert reader.read("M1") == "first, updated"
+    assert reader.read("M2") == "second ✓"
+    # Unknown ids trigger a rescan, so other writers' records are found
+    writer.write("M3", "third")
+    assert reader.read("M3") == "third"
+    assert reader.read("M4") is None
+
+    # A torn record (crash mid-append) is not indexed and is cut off by the next writer
+    with open(writer.pack_path, "ab") as f:
+        f.write(b"\x02\x00\x00\x00\xff\x00\x00\x00M4partial")
+    assert PackedContentStore(str(tmp_path)).read("M4") is None
+    writer.write("M4", "fourth")
+    assert PackedContentStore(str(tmp_path)).read("M4") == "fourth"
+
+    # Compaction keeps the latest content and drops the given ids
+    size = os.path.getsize(writer.pack_path)
+    assert writer.compact(drop={"M2"}) > 0
+    assert os.path.getsize(writer.pack_path) < size
+    fresh = PackedContentStore(str(tmp_path))
+    assert [fresh.read(m) for m in ("M1", "M2", "M3", "M4")] == ["first, updated", None, "third", "fourth"]
+    # The checkpointed offset table is used when it matches the pack
+    writer.close()
+    with open(writer.index_path, "rb") as f:
+        assert set(json.loads(f.read())["offsets"]) == {"M1", "M3", "M4"}
+
+
+def test_compact_content_drops_retired(tmp_path):
+    store = knowledge_store.open_store(str(tmp_path), "json", "packed")
+    previous = knowledge_store._store
+    knowledge_store.set_store(store)
+    try:
+        create("User prefers dark mode charts", "Dark mode chart preference")
+        create("Loans table is partitioned by month", "Loans partitioning")
+        manage_memory.invoke({"action": "retire", "memory_id": "MEMORY-001"})
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".md")]
+        assert store.compact_content() > 0
+        assert "not found" in read_memory_file.invoke({"memory_id": "MEMORY-001"})
+        assert "partitioned by month" in read_memory_file.invoke({"memory_id": "MEMORY-002"})
+    finally:
+        knowledge_store.set_store(previous)
+        store.close()
+
+
+def test_pack_content_files(tmp_path):
+    store = JsonKnowledgeStore(str(tmp_path))
+    store.write_content({"memory_id": "MEMORY-001", "file_path": "memory-001.md"}, "Loose file content")
+    store.put({"memory_id": "MEMORY-001", "file_path": "memory-001.md", "summary": "Loose", "status": "active"})
+    store.close()
+
+    assert knowledge_store.pack_content_files(str(tmp_path), remove_files=True) == 1
+    assert not os.path.exists(tmp_path / "memory-001.md")
+    packed = JsonKnowledgeStore(str(tmp_path), content_format="packed")
+    assert packed.read_content(packed.get("MEMORY-001")) == "Loose file content"
+    packed.close()
+
+
+def test_archive_retired_moves_memories_to_cold_tier(store):
+    create("User prefers dark mode charts", "Dark mode chart preference")
+    create("Old loans partitioning notes", "Loans partitioning")
+    manage_memory.invoke({"action": "retire", "memory_id": "MEMORY-002"})
+    assert store.archive_retired(older_than_days=1) == 0
+
+    other = type(store)(store.knowledge_dir, content_format=store.content_format)
+    other.recheck_interval = 0
+    other.search_index
+    assert store.archive_retired(older_than_days=0) == 1
+    assert store.archive_retired(older_than_days=0) == 0
+
+    # The live tier only holds active memories now
+    assert store.get("MEMORY-002") is None
+    assert [m["memory_id"] for m in store.list(status="all")] == ["MEMORY-001"]
+    assert not os.path.exists(os.path.join(store.knowledge_dir, "memory-002.md"))
+    other.sync()
+    assert other.search_index.search("loans", status="all") == []
+
+    # The archive is consulted for retired/all searches and reads only
+    result = json.loads(search_memory_index.invoke({"query": "loans"}))
+    assert result["results"] == []
+    result = json.loads(search_memory_index.invoke({"query": "loans partitioning", "status": "all"}))
+    assert [r["memory_id"] for r in result["results"]] == ["MEMORY-002"]
+    assert result["total_searched"] == 2
+    assert "Old loans partitioning notes" in read_memory_file.invoke({"memory_id": "MEMORY-002"})
+    other.close()
+
+
+def test_search_index_follows_other_writers(tmp_path):
+    first = JsonKnowledgeStore(str(tmp_path), recheck_interval=0)
+    second = JsonKnowledgeStore(str(tmp_path), recheck_interval=0)
+    first.put({"memory_id": "M1", "category": "user_profile", "summary": "Dark mode", "status": "active"})
+    assert [m for m, _ in second.search_index.search("dark")] == ["M1"]
+
+    first.put({"memory_id": "M2", "category": "user_profile", "summary": "Light mode", "status": "active"})
+    first.put({"memory_id": "M1", "category": "user_profile", "summary": "Dark mode", "status": "retired"})
+    assert [m for m, _ in second.search_index.search("mode")] == ["M2"]
+
+    # The persisted index is current, so a fresh process loads it without rebuilding
+    third = JsonKnowledgeStore(str(tmp_path))
+    assert third.search_index.seq == third.change_seq
+    assert [m for m, _ in third.search_index.search("mode")] == ["M2"]
+
+
+def test_minhash_index_finds_near_duplicates(tmp_path):
+    contents = {
+        "M1": "The user prefers dark mode charts with a blue palette and large legends on every dashboard",
+        "M2": "Loans table is partitioned by month and keyed by loan_id with a separate exposure table",
+    }
+    memories = [{"memory_id": m, "status": "active"} for m in contents]
+    path = str(tmp_path / "dedup_index.json")
+    index = MinHashIndex.open(path, lambda: memories, lambda m: contents[m["memory_id"]], seq=1)
+
+    near = "The user prefers dark mode charts with a blue palette and large legends on each dashboard"
+    assert [m for m, _ in index.query(near)] == ["M1"]
+    assert index.query("Quarterly revenue by region for the sales team") == []
+    assert index.query(near, exclude=["M1"]) == []
+
+    # Retired memories are no longer duplicate candidates
+    index.apply([{"memory_id": "M1", "status": "retired"}], seq=2)
+    assert index.query(near) == []
+
+    reloaded = MinHashIndex(path)
+    assert reloaded.load() and reloaded.seq == 2 and len(reloaded) == 1
+    assert [m for m, _ in reloaded.query(contents["M2"])] == ["M2"]
+
+
+def test_create_warns_on_duplicate_content_and_consolidate_ignores_sources(store):
+    content = "User prefers dark mode charts with a blue palette and large legends"
+    create(content, "Chart style")
+    create("Loans table is partitioned by month", "Loans partitioning")
+
+    warning = create(content + " everywhere", "Chart style again")
+    assert warning.startswith("Warning: Similar memory found: MEMORY-001")
+
+    result = manage_memory.invoke({
+        "action": "consolidate", "memory_id": "MEMORY-001,MEMORY-002",
+        "content": content, "summary": "Merged notes"
+    })
+    assert "MEMORY-003" in result
+    assert [m["memory_id"] for m in store.list(status="active")] == ["MEMORY-003"]
+
+
+def test_vector_index_matches_variants_and_persists(tmp_path):
+    pytest.importorskip("numpy")
+    from memory_vectors import VectorIndex
+
+    memories = [
+        {"memory_id": "M1", "summary": "Exposure threshold per counterparty", "status": "active", "category": "business_rules"},
+        {"memory_id": "M2", "summary": "User prefers dark mode charts", "status": "active", "category": "user_profile"},
+    ]
+    path = str(tmp_path / "vector_index.json")
+    index = VectorIndex.open(path, lambda: memories, lambda m: m["summary"], seq=2)
+
+    # No shared whole word with "thresholds"/"exposures", still the best match
+    assert index.search("exposures thresholds")[0][0] == "M1"
+    assert "M1" not in [m for m, _ in index.search("exposures thresholds", category="user_profile")]
+
+    index.apply([{"memory_id": "M1", "summary": "Exposure threshold per counterparty", "status": "retired"},
+                 {"memory_id": "M3", "summary": "Risk exposure limits by desk", "status": "active"}], seq=3)
+    assert [m for m, _ in index.search("exposure thresholds", limit=1)] == ["M3"]
+
+    reloaded = VectorIndex(path, lambda m: m["summary"])
+    assert reloaded.load() and reloaded.seq == 3 and len(reloaded) == 3
+    assert reloaded.search("exposure thresholds", status="all", limit=3) == index.search("exposure thresholds", status="all", limit=3)
+
+
+def test_vector_rows_agree_across_store_instances(tmp_path):
+    pytest.importorskip("numpy")
+    from memory_vectors import VectorIndex
+
+    first = SQLiteKnowledgeStore(str(tmp_path))
+    second = SQLiteKnowledgeStore(str(tmp_path))
+    first.vector_index
+    second.vector_index
+    previous = knowledge_store._store
+    knowledge_store.set_store(first)
+    try:
+        create("Per-counterparty exposure threshold is 5m", "Exposure threshold policy", category="business_rules")
+        create("User prefers dark mode charts", "Dark mode chart preference")
+        manage_memory.invoke({"action": "update", "memory_id": "MEMORY-001", "tags": "risk"})
+    finally:
+        knowledge_store.set_store(previous)
+
+    # The second store catches up with both memories in one change, latest first
+    # (MEMORY-002, then the updated MEMORY-001), but keeps the rows already placed
+    assert second.vector_index.search("exposure thresholds", limit=1)[0][0] == "MEMORY-001"
+    assert first.vector_index.search("exposure thresholds", limit=1)[0][0] == "MEMORY-001"
+    assert first.vector_index.search("dark mode", limit=1)[0][0] == "MEMORY-002"
+
+    reloaded = VectorIndex(os.path.join(str(tmp_path), "vector_index.json"), first.memory_text)
+    assert reloaded.load() and reloaded.seq == first.change_seq
+    assert reloaded.search("exposure thresholds", limit=1)[0][0] == "MEMORY-001"
+    assert reloaded.search("dark mode", limit=1)[0][0] == "MEMORY-002"
+    first.close()
+    second.close()
+
+
+def test_hybrid_search_mode(store, monkeypatch):
+    pytest.importorskip("numpy")
+    import tools
+
+    create("Per-counterparty exposure threshold is 5m", "Exposure threshold policy", category="business_rules")
+    create("User prefers dark mode charts", "Dark mode chart preference")
+    monkeypatch.setattr(tools, "MEMORY_SEARCH_MODE", "keyword")
+    assert json.loads(search_memory_index.invoke({"query": "thresholds"}))["results"] == []
+
+    monkeypatch.setattr(tools, "MEMORY_SEARCH_MODE", "hybrid")
+    result = json.loads(search_memory_index.invoke({"query": "thresholds"}))
+    assert result["results"][0]["memory_id"] == "MEMORY-001"
+
+
+def test_semantic_search_lists_a_moved_memory_once(store, monkeypatch):
+    pytest.importorskip("numpy")
+    import tools
+
+    create("User prefers dark mode charts", "Dark mode chart preference")
+    monkeypatch.setattr(tools, "MEMORY_SEARCH_MODE", "semantic")
+    assert [r["memory_id"] for r in json.loads(search_memory_index.invoke({"query": "dark mode"}))["results"]] == ["MEMORY-001"]
+
+    # Moving the memory leaves a removed row in the old category's shard
+    store.put({**store.get("MEMORY-001"), "category": "facts"})
+    for mode in ("semantic", "hybrid"):
+        monkeypatch.setattr(tools, "MEMORY_SEARCH_MODE", mode)
+        results = json.loads(search_memory_index.invoke({"query": "dark mode"}))["results"]
+        assert [(r["memory_id"], r["category"]) for r in results] == [("MEMORY-001", "facts")]
+
+
+def test_manage_memories_commits_once_or_not_at_all(store):
+    from tools import manage_memories
+
+    create("Loans table is partitioned by month", "Loans partitioning")
+    result = manage_memories.invoke({"operations": [
+        {"action": "create", "content": "User prefers bar charts", "category": "user_profile", "summary": "Chart type"},
+        {"action": "create", "content": "Fiscal year starts in April", "category": "facts", "summary": "Fiscal year", "tags": ["finance"]},
+        {"action": "retire", "memory_id": "MEMORY-001"},
+    ]})
+    assert result.endswith("Saved 3 operations in one commit")
+    assert [m["memory_id"] for m in store.list(status="active")] == ["MEMORY-002", "MEMORY-003"]
+    assert store.get("MEMORY-003")["tags"] == ["finance"]
+    assert "Fiscal year starts in April" in read_memory_file.invoke({"memory_id": "MEMORY-003"})
+    if isinstance(store, JsonKnowledgeStore):
+        with open(store.journal_path, "rb") as f:
+            assert json.loads(f.read().splitlines()[-1])["op"] == "batch"
+
+    # A failing operation rolls back the whole batch, including content writes
+    result = manage_memories.invoke({"operations": [
+        {"action": "update", "memory_id": "MEMORY-002", "content": "Changed content"},
+        {"action": "retire", "memory_id": "MEMORY-999"},
+    ]})
+    assert result.startswith("Error: operation 2 (retire) failed")
+    assert "User prefers bar charts" in read_memory_file.invoke({"memory_id": "MEMORY-002"})
+    assert [m["memory_id"] for m in store.list(status="active")] == ["MEMORY-002", "MEMORY-003"]
+    assert store.allocate_id() == 4
+
+
+def test_tenant_scopes_isolate_stores_and_evict_idle_tenants(tmp_path, monkeypatch):
+    stores = knowledge_store.TenantStores(str(tmp_path), capacity=1)
+    monkeypatch.setattr(knowledge_store, "tenant_stores", stores)
+
+    with knowledge_store.tenant_scope("alice"):
+        assert "Created MEMORY-001" in create("User prefers dark mode charts", "Dark mode chart preference")
+        json.loads(search_memory_index.invoke({"query": "dark"}))
+        alice = knowledge_store.get_store()
+    with knowledge_store.tenant_scope("bob"):
+        assert json.loads(search_memory_index.invoke({"query": "dark"}))["results"] == []
+        # Each tenant numbers its own memories
+        assert "Created MEMORY-001" in create("Loans table is partitioned by month", "Loans partitioning")
+    assert knowledge_store.get_store() is not alice
+
+    # Opening bob evicted idle alice, flushing her buffered access count
+    assert "alice" not in stores and "bob" in stores
+    reopened = JsonKnowledgeStore(knowledge_store.tenant_dir("alice", str(tmp_path)))
+    assert reopened.get("MEMORY-001")["access_count"] == 1
+
+    # A tenant inside an active scope is never evicted
+    async def request(tenant_id):
+        with knowledge_store.tenant_scope(tenant_id):
+            store = await asyncio.to_thread(knowledge_store.get_store)
+            await asyncio.sleep(0.05)
+            assert tenant_id in stores
+            return store.knowledge_dir
+
+    async def requests():
+        return await asyncio.gather(request("alice"), request("carol"))
+
+    assert [os.path.basename(d) for d in asyncio.run(requests())] == ["alice", "carol"]
+    assert len(stores) == 1
+
+    with pytest.raises(ValueError):
+        with knowledge_store.tenant_scope("../escape"):
+            pass
+    stores.close()
@@ -0,0 +1,68 @@
+"""
+Tests for the shared LLM client registry.
+
+Run from the repository root:
+    python -m pytest -q test_llm_clients.py
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from llm_clients import LLMClientRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    registry = LLMClientRegistry(max_connections=7, max_keepalive_connections=3, keepalive_expiry=5, timeout=30)
+    yield registry
+    asyncio.run(registry.aclose())
+
+
+def test_clients_are_reused_per_configuration(registry):
+    llm = registry.get("openai", "gpt-4", temperature=0.7)
+
+    assert registry.get("openai", "gpt-4", temperature=0.7) is llm
+    assert registry.get("openai", "gpt-4", temperature=0.7, streaming=True) is not llm
+    assert registry.get("openai", "gpt-4", temperature=0) is not llm
+    assert registry.get("openai", "gpt-4o", temperature=0.7) is not llm
+
+
+def test_openai_clients_share_the_connection_pool(registry):
+    first = registry.get("openai", "gpt-4", temperature=0)
+    second = registry.get("openai", "gpt-4o", temperature=0.7, streaming=True)
+
+    assert first.http_client is second.http_client is registry._http_client
+    assert first.http_async_client is second.http_async_client is registry._http_async_client
+
+
+def test_anthropic_client_gets_the_timeout(registry):
+    pytest.importorskip("langchain_anthropic")
+
+    llm = registry.get("anthropic", "claude-3-5-sonnet-latest", temperature=0)
+
+    assert registry.get("anthropic", "claude-3-5-sonnet-latest", temperature=0) is llm
+    assert llm.default_request_timeout == 30
+
+
+def test_unknown_provider(registry):
+    with pytest.raises(ValueError, match="Unknown LLM provider"):
+        registry.get("mistral", "large")
+
+
+def test_aclose_closes_the_pools_and_drops_the_clients(registry):
+    llm = registry.get("openai", "gpt-4", temperature=0)
+    http_client, http_async_client = llm.http_client, llm.http_async_client
+
+    asyncio.run(registry.aclose())
+
+    assert http_client.is_closed and http_async_client.is_closed
+    assert registry._http_client is None and registry._http_async_client is None
+    # The next use opens fresh pools and builds a new client on them
+    rebuilt = registry.get("openai", "gpt-4", temperature=0)
+    assert rebuilt is not llm
+    assert not rebuilt.http_async_client.is_closed
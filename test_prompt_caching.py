@@ -0,0 +1,61 @@
+"""
+Tests for the cacheable system prompt prefix and cache usage reporting.
+
+Run from the repository root:
+    python -m pytest -q test_prompt_caching.py
+"""
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import AIMessage
+
+from prompt import SYSTEM_PROMPT
+from prompt_caching import cache_usage, system_message
+
+
+def test_anthropic_system_block_is_a_cache_breakpoint():
+    message = system_message("anthropic")
+
+    assert message.content == [{
+        "type": "text",
+        "text": SYSTEM_PROMPT,
+        "cache_control": {"type": "ephemeral"}
+    }]
+    # Built once, so the cached prefix is byte-for-byte stable across requests
+    assert system_message("anthropic") is message
+
+
+def test_openai_system_prompt_is_left_untouched():
+    message = system_message("openai")
+
+    assert message.content == SYSTEM_PROMPT
+
+
+def test_cache_usage_reports_cache_hits_from_response_metadata():
+    response = AIMessage(content="ok", usage_metadata={
+        "input_tokens": 5200,
+        "output_tokens": 40,
+        "total_tokens": 5240,
+        "input_token_details": {"cache_read": 5000, "cache_creation": 0}
+    })
+
+    assert cache_usage(response.usage_metadata) == {
+        "input_tokens": 5200,
+        "cached_input_tokens": 5000,
+        "cache_creation_tokens": 0,
+        "output_tokens": 40
+    }
+
+
+def test_cache_usage_without_cache_details_or_usage():
+    response = AIMessage(content="ok", usage_metadata={"input_tokens": 12, "output_tokens": 3, "total_tokens": 15})
+
+    assert cache_usage(response.usage_metadata) == {
+        "input_tokens": 12,
+        "cached_input_tokens": 0,
+        "cache_creation_tokens": 0,
+        "output_tokens": 3
+    }
+    assert cache_usage(None) is None
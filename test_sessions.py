@@ -0,0 +1,118 @@
+"""
+Tests for the server-side session store.
+
+Run from the repository root:
+    python -m pytest -q test_sessions.py
+"""
+
+import threading
+
+import pytest
+
+from sessions import RedisSessionBackend, SessionStore, SQLiteSessionBackend
+
+
+class FakeRedis:
+    """Minimal Redis-compatible stand-in (list commands only)"""
+
+    def __init__(self):
+        self.lists = {}
+        self.ttls = {}
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(v.encode("utf-8") for v in values)
+
+    def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def expire(self, key, ttl):
+        self.ttls[key] = ttl
+
+    def delete(self, key):
+        self.lists.pop(key, None)
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        backend = SQLiteSessionBackend(str(tmp_path / "sessions.db"))
+    else:
+        backend = RedisSessionBackend(client=FakeRedis(), ttl=60)
+    yield backend
+    backend.close()
+
+
+def turn(i):
+    return [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+def test_history_survives_lru_eviction(backend):
+    store = SessionStore(backend, max_sessions=1)
+
+    assert store.get_history("a") == []
+    store.append("a", turn(1))
+    store.append("b", turn(1))
+    store.append("a", turn(2))
+
+    assert store.get_history("a") == turn(1) + turn(2)
+    assert store.get_history("b") == turn(1)
+    assert list(store._sessions) == ["b"]
+
+
+def test_history_is_a_copy_and_reset_clears_it(backend):
+    store = SessionStore(backend)
+    store.append("a", turn(1))
+
+    store.get_history("a").append({"role": "user", "content": "not stored"})
+    assert store.get_history("a") == turn(1)
+
+    store.reset("a")
+    assert store.get_history("a") == []
+
+
+def test_cached_history_sees_other_workers(backend):
+    store = SessionStore(backend)
+    other = SessionStore(backend)
+    store.append("a", turn(1))
+    assert other.get_history("a") == turn(1)
+
+    store.append("a", turn(2))
+    assert other.get_history("a") == turn(1) + turn(2)
+
+    store.reset("a")
+    store.append("a", turn(3))
+    assert other.get_history("a") == turn(3)
+
+
+def test_sqlite_concurrent_appends_from_separate_connections(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    backends = [SQLiteSessionBackend(path) for _ in range(4)]
+
+    def append_turns(backend):
+        for i in range(25):
+            backend.append("a", turn(i))
+
+    threads = [threading.Thread(target=append_turns, args=(b,)) for b in backends]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backends[0].length("a") == 4 * 25 * 2
+    for backend in backends:
+        backend.close()
+
+
+def test_sqlite_history_is_durable(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(SQLiteSessionBackend(path))
+    store.append("a", turn(1))
+    store.close()
+
+    reopened = SessionStore(SQLiteSessionBackend(path))
+    assert reopened.get_history("a") == turn(1)
+    reopened.close()
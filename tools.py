@@ -5,41 +5,53 @@ import json
 import os
 from pathlib import Path
 
+import numpy as np
 
-KNOWLEDGE_DIR = "knowledge"
-KNOWLEDGE_INDEX = os.path.join(KNOWLEDGE_DIR, "knowledge.json")
+from knowledge_store import get_store
+
+
+# "keyword" (BM25), "semantic" (local vectors) or "hybrid"
+MEMORY_SEARCH_MODE = os.getenv("MEMORY_SEARCH_MODE", "keyword")
+# Share of the semantic score in hybrid mode
+MEMORY_SEMANTIC_WEIGHT = float(os.getenv("MEMORY_SEMANTIC_WEIGHT", "0.5"))
 
 
 def ensure_knowledge_structure():
-    """Ensure knowledge directory and index file exist"""
-    os.makedirs(KNOWLEDGE_DIR, exist_ok=True)
-    
-    if not os.path.exists(KNOWLEDGE_INDEX):
-        initial_data = {
-            "metadata": {
-                "created": datetime.utcnow().isoformat() + "Z",
-                "last_updated": datetime.utcnow().isoformat() + "Z",
-                "total_memories": 0,
-                "next_id": 1
-            },
-            "memories": []
-        }
-        with open(KNOWLEDGE_INDEX, 'w') as f:
-            json.dump(initial_data, f, indent=2)
+    """Ensure knowledge directory exists"""
+    os.makedirs(get_store().knowledge_dir, exist_ok=True)
 
 
 def load_knowledge_index() -> Dict[str, Any]:
-    """Load the knowledge index JSON"""
-    ensure_knowledge_structure()
-    with open(KNOWLEDGE_INDEX, 'r') as f:
-        return json.load(f)
+    """Load the whole knowledge index from the configured store"""
+    return get_store().load_index()
 
 
 def save_knowledge_index(data: Dict[str, Any]):
-    """Save the knowledge index JSON"""
-    data["metadata"]["last_updated"] = datetime.utcnow().isoformat() + "Z"
-    with open(KNOWLEDGE_INDEX, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Replace the whole knowledge index in the configured store"""
+    get_store().save_index(data)
+
+
+def _relevance(store, query: str, status: str, category: Optional[str], limit: int) -> tuple:
+    """(rows, relevance) arrays of search index rows for the configured MEMORY_SEARCH_MODE"""
+    index = store.search_index
+    if MEMORY_SEARCH_MODE == "keyword":
+        # BM25 over the inverted index: only memories sharing a query term are scored
+        return index.bm25(query, status=status, category=category)
+    
+    semantic = store.vector_index.search(query, status=status, category=category, limit=max(limit * 4, 20))
+    semantic_rows, semantic_scores = index.rows_for(semantic, category=category)
+    if MEMORY_SEARCH_MODE == "semantic":
+        return semantic_rows, semantic_scores
+    
+    # Hybrid: blend max-normalized BM25 with cosine similarity
+    keyword_rows, keyword_scores = index.bm25(query, status=status, category=category)
+    top_keyword = keyword_scores.max() if len(keyword_scores) else 1.0
+    rows, inverse = np.unique(np.concatenate([keyword_rows, semantic_rows]), return_inverse=True)
+    weighted = np.concatenate([
+        (1 - MEMORY_SEMANTIC_WEIGHT) * keyword_scores / top_keyword,
+        MEMORY_SEMANTIC_WEIGHT * semantic_scores
+    ])
+    return rows, np.bincount(inverse, weights=weighted, minlength=len(rows))
 
 
 @tool
@@ -50,7 +62,8 @@ def search_memory_index(
     limit: int = 5
 ) -> str:
     """
-    Search the knowledge index (knowledge.json) for relevant memories using keyword matching.
+    Search the knowledge index for relevant memories using keyword matching (BM25 ranking),
+    local semantic vectors, or both (MEMORY_SEARCH_MODE).
     Returns metadata about matching memories including their file paths.
     
     Args:
@@ -68,77 +81,42 @@ def search_memory_index(
         search_memory_index("user settings", status="all", limit=3)
     """
     try:
-        index_data = load_knowledge_index()
-        memories = index_data.get("memories", [])
+        store = get_store()
+        index = store.search_index
+        # Retired memories moved out by the tiering job live in the cold archive
+        archive_index = store.archive.search_index if status in ("retired", "all") else None
+        searched = len(index) + (len(archive_index) if archive_index is not None else 0)
         
-        if not memories:
+        if not searched:
             return json.dumps({
                 "status": "success",
                 "message": "No memories found in knowledge base",
                 "results": []
             })
         
-        # Filter by status
-        if status != "all":
-            memories = [m for m in memories if m.get("status") == status]
-        
-        # Filter by category
-        if category:
-            memories = [m for m in memories if m.get("category") == category]
-        
-        # Keyword matching and scoring
-        query_keywords = query.lower().split()
-        scored_memories = []
-        
-        for memory in memories:
-            score = 0
-            
-            # Build searchable text
-            searchable_parts = [
-                memory.get("category", ""),
-                " ".join(memory.get("tags", [])),
-                memory.get("summary", "")
-            ]
-            searchable_text = " ".join(searchable_parts).lower()
-            
-            # Count keyword matches
-            for keyword in query_keywords:
-                if keyword in searchable_text:
-                    score += searchable_text.count(keyword)
-            
-            # Boost by confidence
-            confidence = memory.get("confidence", 0.5)
-            score *= confidence
-            
-            # Boost by access count (popularity)
-            access_count = memory.get("access_count", 0)
-            score += access_count * 0.1
-            
-            # Boost by recency
-            updated = memory.get("updated", memory.get("created", ""))
-            if updated:
-                try:
-                    updated_date = datetime.fromisoformat(updated.replace('Z', '+00:00'))
-                    days_old = (datetime.utcnow() - updated_date.replace(tzinfo=None)).days
-                    recency_boost = max(0, 1 - (days_old / 365))
-                    score += recency_boost * 0.5
-                except:
-                    pass
-            
-            if score > 0:
-                scored_memories.append((score, memory))
-        
-        # Sort by score and limit
-        scored_memories.sort(reverse=True, key=lambda x: x[0])
-        top_memories = scored_memories[:limit]
+        # Relevance * confidence + access and recency boosts, computed over
+        # the index columns; only the top `limit` memories are fetched
+        rows, relevance = _relevance(store, query, status, category, limit)
+        ranked = index.rank(rows, relevance, limit, pending_access=store.access.pending_counts())
+        memories = store.get_many(memory_id for memory_id, _ in ranked)
+        top_memories = [(score, memories[memory_id]) for memory_id, score in ranked if memory_id in memories]
         
         # Increment access count for retrieved memories
+        # (buffered write-behind; the store is not written on this read path)
         if top_memories:
-            memory_ids = [m[1]["memory_id"] for m in top_memories]
-            for memory in index_data["memories"]:
-                if memory["memory_id"] in memory_ids:
-                    memory["access_count"] = memory.get("access_count", 0) + 1
-            save_knowledge_index(index_data)
+            store.record_access(m[1]["memory_id"] for m in top_memories)
+        
+        if archive_index is not None and len(archive_index):
+            # Keyword ranking only; archived memories are not in the vector index
+            archive_rows, archive_relevance = archive_index.bm25(query, status=status, category=category)
+            archived_ranked = archive_index.rank(archive_rows, archive_relevance, limit)
+            archived = store.archive.get_many(memory_id for memory_id, _ in archived_ranked)
+            top_memories += [
+                (score, archived[memory_id]) for memory_id, score in archived_ranked
+                if memory_id in archived and memory_id not in memories
+            ]
+            top_memories.sort(key=lambda item: item[0], reverse=True)
+            top_memories = top_memories[:limit]
         
         # Format results
         results = []
@@ -150,7 +128,7 @@ def search_memory_index(
                 "tags": memory.get("tags", []),
                 "summary": memory.get("summary", ""),
                 "confidence": memory.get("confidence", 0.5),
-                "access_count": memory.get("access_count", 0),
+                "access_count": store.access_count(memory),
                 "status": memory.get("status", "active"),
                 "created": memory.get("created", ""),
                 "updated": memory.get("updated", ""),
@@ -160,7 +138,7 @@ def search_memory_index(
         return json.dumps({
             "status": "success",
             "message": f"Found {len(results)} relevant memories",
-            "total_searched": len(memories),
+            "total_searched": searched,
             "results": results
         }, indent=2)
         
@@ -188,11 +166,8 @@ def read_memory_file(memory_id: str) -> str:
         read_memory_file("MEMORY-001")
     """
     try:
-        index_data = load_knowledge_index()
-        memories = index_data.get("memories", [])
-        
-        # Find memory by ID
-        memory = next((m for m in memories if m.get("memory_id") == memory_id), None)
+        store = get_store()
+        memory = store.get(memory_id) or store.archive.get(memory_id)
         
         if not memory:
             return f"Error: Memory {memory_id} not found in index"
@@ -201,20 +176,13 @@ def read_memory_file(memory_id: str) -> str:
         if not file_path:
             return f"Error: No file path found for {memory_id}"
         
-        full_path = os.path.join(KNOWLEDGE_DIR, file_path)
+        content = store.read_content(memory)
         
-        if not os.path.exists(full_path):
+        if content is None:
             return f"Error: Memory file not found at {file_path}"
         
-        with open(full_path, 'r') as f:
-            content = f.read()
-        
-        # Increment access count
-        for mem in index_data["memories"]:
-            if mem["memory_id"] == memory_id:
-                mem["access_count"] = mem.get("access_count", 0) + 1
-                break
-        save_knowledge_index(index_data)
+        # Increment access count (buffered write-behind)
+        store.record_access([memory_id])
         
         return f"""Memory: {memory_id}
 Category: {memory.get('category')}
@@ -262,23 +230,89 @@ def manage_memory(
         manage_memory(action="retire", memory_id="MEMORY-003")
         manage_memory(action="consolidate", memory_id="MEMORY-001,MEMORY-005", content="Merged content...", summary="Consolidated preferences")
     """
+    operation = {
+        "action": action, "content": content, "memory_id": memory_id, "category": category,
+        "tags": tags, "summary": summary, "confidence": confidence
+    }
     try:
-        if action == "create":
-            return _create_memory(content, category, tags, summary, confidence)
-        elif action == "update":
-            return _update_memory(memory_id, content, tags, summary, confidence)
-        elif action == "retire":
-            return _retire_memory(memory_id)
-        elif action == "consolidate":
-            return _consolidate_memories(memory_id, content, tags, summary, confidence)
-        else:
-            return f"Error: Unknown action '{action}'. Use: create, update, retire, or consolidate"
+        # One commit, even for consolidate (create + N retires)
+        with get_store().batch():
+            result = _apply_operation(operation)
+            if not result.startswith("✅"):
+                raise _Rollback(result)
+        return result
+    except _Rollback as e:
+        return str(e)
     except Exception as e:
         return f"Error in manage_memory: {str(e)}"
 
 
-def _create_memory(content: str, category: str, tags: Optional[str], summary: Optional[str], confidence: Optional[float]) -> str:
-    """Create a new memory"""
+@tool
+def manage_memories(operations: List[Dict[str, Any]]) -> str:
+    """
+    Apply several memory operations in one atomic commit: either all of them are saved or none.
+    Use this instead of several manage_memory calls when you learn multiple facts in one turn.
+    
+    Args:
+        operations: List of operations, each an object with the manage_memory arguments
+            (action, content, memory_id, category, tags, summary, confidence)
+    
+    Returns:
+        One confirmation line per operation, or the first error (nothing is saved then)
+        
+    Examples:
+        manage_memories(operations=[
+            {"action": "create", "content": "User prefers bar charts", "category": "user_profile", "summary": "Chart type preference"},
+            {"action": "retire", "memory_id": "MEMORY-004"}
+        ])
+    """
+    if not operations:
+        return "Error: operations list is empty"
+    results = []
+    try:
+        with get_store().batch():
+            for i, operation in enumerate(operations, 1):
+                result = _apply_operation(operation)
+                if not result.startswith("✅"):
+                    raise _Rollback(f"Error: operation {i} ({operation.get('action')}) failed: {result} No changes were saved.")
+                results.append(f"{i}. {result}")
+    except _Rollback as e:
+        return str(e)
+    except Exception as e:
+        return f"Error in manage_memories: {str(e)}. No changes were saved."
+    results.append(f"✅ Saved {len(operations)} operations in one commit")
+    return "\n".join(results)
+
+
+class _Rollback(Exception):
+    """Raised inside a store batch to discard its changes"""
+
+
+def _apply_operation(operation: Dict[str, Any]) -> str:
+    """Run one manage_memory operation (inside the caller's batch)"""
+    action = operation.get("action")
+    content = operation.get("content") or ""
+    memory_id = operation.get("memory_id")
+    tags = operation.get("tags")
+    if isinstance(tags, list):
+        tags = ", ".join(tags)
+    summary = operation.get("summary")
+    confidence = operation.get("confidence")
+    
+    if action == "create":
+        return _create_memory(content, operation.get("category"), tags, summary, confidence)
+    elif action == "update":
+        return _update_memory(memory_id, content, tags, summary, confidence)
+    elif action == "retire":
+        return _retire_memory(memory_id)
+    elif action == "consolidate":
+        return _consolidate_memories(memory_id, content, tags, summary, confidence)
+    else:
+        return f"Error: Unknown action '{action}'. Use: create, update, retire, or consolidate"
+
+
+def _create_memory(content: str, category: str, tags: Optional[str], summary: Optional[str], confidence: Optional[float], replaces: Optional[List[str]] = None) -> str:
+    """Create a new memory (replaces: ids being consolidated, ignored by the duplicate check)"""
     if not content:
         return "Error: content is required for create action"
     if not category:
@@ -286,34 +320,20 @@ def _create_memory(content: str, category: str, tags: Optional[str], summary: Op
     if not summary:
         return "Error: summary is required for create action"
     
-    index_data = load_knowledge_index()
+    store = get_store()
     
-    # Check for duplicates
-    query_keywords = set(content.lower().split()[:20])
-    for memory in index_data["memories"]:
-        if memory.get("status") != "active":
-            continue
-        
-        existing_summary = memory.get("summary", "").lower()
-        existing_keywords = set(existing_summary.split())
-        
-        overlap = len(query_keywords & existing_keywords)
-        similarity = overlap / len(query_keywords) if query_keywords else 0
-        
-        if similarity > 0.6:
-            return f"Warning: Similar memory found: {memory['memory_id']} - '{memory.get('summary')}'. Consider updating it or use consolidate action."
+    # Check for duplicates (MinHash/LSH over active memory content)
+    for duplicate_id, similarity in store.dedup_index.query(content, exclude=replaces or ()):
+        memory = store.get(duplicate_id)
+        if memory:
+            return f"Warning: Similar memory found: {duplicate_id} - '{memory.get('summary')}' ({similarity:.0%} similar). Consider updating it or use consolidate action."
     
     # Generate new ID
-    next_id = index_data["metadata"]["next_id"]
+    next_id = store.allocate_id()
     memory_id = f"MEMORY-{str(next_id).zfill(3)}"
     file_name = f"{memory_id.lower()}.md"
     file_path = file_name
     
-    # Create memory file
-    full_path = os.path.join(KNOWLEDGE_DIR, file_path)
-    with open(full_path, 'w') as f:
-        f.write(content)
-    
     # Create index entry
     now = datetime.utcnow().isoformat() + "Z"
     tags_list = [t.strip() for t in tags.split(",")] if tags else []
@@ -332,11 +352,9 @@ def _create_memory(content: str, category: str, tags: Optional[str], summary: Op
         "updated": now
     }
     
-    index_data["memories"].append(memory_entry)
-    index_data["metadata"]["next_id"] = next_id + 1
-    index_data["metadata"]["total_memories"] = len([m for m in index_data["memories"] if m["status"] == "active"])
-    
-    save_knowledge_index(index_data)
+    # Content first, so the index update sees it
+    store.write_content(memory_entry, content)
+    store.put(memory_entry)
     
     return f"✅ Created {memory_id} in category '{category}' (file: {file_path})"
 
@@ -346,18 +364,16 @@ def _update_memory(memory_id: str, content: Optional[str], tags: Optional[str],
     if not memory_id:
         return "Error: memory_id is required for update action"
     
-    index_data = load_knowledge_index()
+    store = get_store()
     
     # Find memory
-    memory = next((m for m in index_data["memories"] if m["memory_id"] == memory_id), None)
+    memory = store.get(memory_id)
     if not memory:
         return f"Error: Memory {memory_id} not found"
     
     # Update file content if provided
     if content:
-        full_path = os.path.join(KNOWLEDGE_DIR, memory["file_path"])
-        with open(full_path, 'w') as f:
-            f.write(content)
+        store.write_content(memory, content)
     
     # Update index metadata
     now = datetime.utcnow().isoformat() + "Z"
@@ -372,7 +388,7 @@ def _update_memory(memory_id: str, content: Optional[str], tags: Optional[str],
     if confidence is not None:
         memory["confidence"] = confidence
     
-    save_knowledge_index(index_data)
+    store.put(memory)
     
     return f"✅ Updated {memory_id}"
 
@@ -382,10 +398,10 @@ def _retire_memory(memory_id: str) -> str:
     if not memory_id:
         return "Error: memory_id is required for retire action"
     
-    index_data = load_knowledge_index()
+    store = get_store()
     
     # Find memory
-    memory = next((m for m in index_data["memories"] if m["memory_id"] == memory_id), None)
+    memory = store.get(memory_id)
     if not memory:
         return f"Error: Memory {memory_id} not found"
     
@@ -394,9 +410,7 @@ def _retire_memory(memory_id: str) -> str:
     memory["confidence"] = 0.3
     memory["updated"] = datetime.utcnow().isoformat() + "Z"
     
-    index_data["metadata"]["total_memories"] = len([m for m in index_data["memories"] if m["status"] == "active"])
-    
-    save_knowledge_index(index_data)
+    store.put(memory)
     
     return f"✅ Retired {memory_id}"
 
@@ -415,10 +429,10 @@ def _consolidate_memories(memory_ids_str: str, content: str, tags: Optional[str]
     if len(memory_ids) < 2:
         return "Error: Consolidate requires at least 2 memory IDs (comma-separated)"
     
-    index_data = load_knowledge_index()
+    store = get_store()
     
     # Find all memories
-    to_merge = [m for m in index_data["memories"] if m["memory_id"] in memory_ids]
+    to_merge = [m for m in (store.get(memory_id) for memory_id in memory_ids) if m]
     
     if len(to_merge) != len(memory_ids):
         found_ids = [m["memory_id"] for m in to_merge]
@@ -447,8 +461,11 @@ def _consolidate_memories(memory_ids_str: str, content: str, tags: Optional[str]
         category=most_common_category,
         tags=", ".join(unique_tags),
         summary=summary,
-        confidence=final_confidence
+        confidence=final_confidence,
+        replaces=memory_ids
     )
+    if not result.startswith("✅"):
+        return f"Error: Could not consolidate {', '.join(memory_ids)}: {result}"
     
     # Retire old memories
     for memory_id in memory_ids: